@@ -25,10 +25,26 @@ For more information: http://developer.apple.com/documentation/coreml
 # File format versions
 SPECIFICATION_VERSION = 1
 
-# expose sub packages as directories
-import converters
-import proto
-import models
-from models import utils
+# Sub packages are imported on first use: importing this package must not pull
+# in protobuf, NumPy or a deep learning framework (see "--profile-startup").
+_LAZY_SUBPACKAGES = ('common', 'converters')
 
-from _scripts.converter import _main
+
+def __getattr__(name):
+    if name in _LAZY_SUBPACKAGES:
+        import importlib
+        return importlib.import_module(name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+import sys as _sys
+if _sys.version_info < (3, 7):
+    # module __getattr__ (PEP 562) does not exist there; the sub packages
+    # themselves import no framework, so importing them eagerly stays cheap
+    import common
+    import converters
+
+
+def _main():
+    from _scripts.converter import _main
+    return _main()
@@ -0,0 +1,209 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import time
+import shutil
+import hashlib
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dnnconvert")
+
+_HASH_CHUNK = 1 << 20
+_ENTRY_MANIFEST = "entry.json"
+_HASH_MEMO = "source_hashes.json"
+# the converter's code, relative to the package root
+_FINGERPRINT_DIRS = ("common", "converters", "_scripts")
+
+
+def _package_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def converter_fingerprint(root = None):
+    """Digest of the paths and contents of the converter's own sources, standing for its version.
+
+    Contents rather than mtimes, so fresh checkouts of the same tree (CI)
+    share cache entries. Only the packages in _FINGERPRINT_DIRS count;
+    editing tests or examples keeps the cache valid.
+    """
+    hasher = hashlib.sha256()
+    root = root or _package_root()
+    for top in _FINGERPRINT_DIRS:
+        for directory, dirs, files in os.walk(os.path.join(root, top)):
+            dirs[:] = sorted(e for e in dirs if not e.startswith(".") and e != "__pycache__")
+            for name in sorted(files):
+                if name.endswith(".py") or name.endswith(".proto"):
+                    path = os.path.join(directory, name)
+                    with open(path, "rb") as fin:
+                        data = fin.read()
+                    hasher.update(("%s:%d;" % (os.path.relpath(path, root).replace(os.sep, "/"), len(data))).encode("utf-8"))
+                    hasher.update(data)
+    return hasher.hexdigest()
+
+
+
+class ConversionCache(object):
+    """On-disk cache of conversion outputs, keyed by a digest of their inputs.
+
+    Every entry is a directory holding copies of the output files of one
+    conversion; its mtime is refreshed on every hit, and the least recently
+    used entries are removed once the cache exceeds max_bytes. Entries are
+    published with an atomic rename, so concurrent converters sharing the
+    cache never see a partial entry.
+    Source digests are memoized by (size, mtime), so a hit does not rehash
+    unchanged multi-GB weight files.
+    """
+
+    def __init__(self, directory = DEFAULT_CACHE_DIR, max_bytes = 2 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._memo = self._load_memo()
+        self._memo_changed = False
+
+
+    def _load_memo(self):
+        try:
+            with open(os.path.join(self.directory, _HASH_MEMO), "r") as fin:
+                return json.load(fin)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+
+    def _save_memo(self):
+        if not self._memo_changed:
+            return
+        path = os.path.join(self.directory, _HASH_MEMO)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(temp_path, "w") as of:
+                json.dump(self._memo, of)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+            self._memo_changed = False
+        except (IOError, OSError):
+            pass
+
+
+    def file_digest(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        memo = self._memo.get(path)
+        if memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime:
+            return memo[2]
+
+        hasher = hashlib.sha256()
+        with open(path, "rb") as fin:
+            while True:
+                data = fin.read(_HASH_CHUNK)
+                if not data:
+                    break
+                hasher.update(data)
+        self._memo[path] = [stat.st_size, stat.st_mtime, hasher.hexdigest()]
+        self._memo_changed = True
+        return self._memo[path][2]
+
+
+    def key(self, sources, options):
+        """Digest of the source file contents and of a JSON-serializable options dict."""
+        hasher = hashlib.sha256()
+        for name in sorted(sources):
+            hasher.update(("%s=%s;" % (name, self.file_digest(sources[name]))).encode("utf-8"))
+        hasher.update(json.dumps(options, sort_keys = True).encode("utf-8"))
+        self._save_memo()
+        return hasher.hexdigest()
+
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+
+    def restore(self, key, outputs, has_blob = None):
+        """Copy the cached files of key to outputs (role -> path); returns False on a miss.
+
+        has_blob(digest) tells whether a weight blob the cached IR refers to
+        still exists; an entry missing any of its blobs is a miss.
+        """
+        entry = self._entry_path(key)
+        try:
+            with open(os.path.join(entry, _ENTRY_MANIFEST), "r") as fin:
+                manifest = json.load(fin)
+            roles = manifest["roles"]
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+        if set(roles) != set(outputs):
+            return False
+        if has_blob is not None and not all(has_blob(e) for e in manifest.get("blobs", list())):
+            return False
+
+        for role, path in outputs.items():
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            shutil.copyfile(os.path.join(entry, role), path)
+        os.utime(entry, None)
+        return True
+
+
+    def store(self, key, outputs, blobs = ()):
+        """Copy the output files (role -> path) into the entry of key, then evict down to max_bytes.
+
+        blobs lists the digests of the blob store tensors the IR refers to.
+        """
+        entry = self._entry_path(key)
+        if os.path.isdir(entry):
+            return
+        parent = os.path.dirname(entry)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                pass
+
+        temp_entry = "%s.%d.tmp" % (entry, os.getpid())
+        os.makedirs(temp_entry)
+        try:
+            for role, path in outputs.items():
+                shutil.copyfile(path, os.path.join(temp_entry, role))
+            with open(os.path.join(temp_entry, _ENTRY_MANIFEST), "w") as of:
+                json.dump({"roles" : sorted(outputs), "blobs" : sorted(set(blobs)), "created" : time.time()}, of)
+            os.rename(temp_entry, entry)
+        except (IOError, OSError):
+            # another converter stored the same entry meanwhile, or the disk is full
+            shutil.rmtree(temp_entry, ignore_errors = True)
+            return
+        self.evict()
+
+
+    def entries(self):
+        """(last use, bytes, path) of every entry."""
+        ret = list()
+        for prefix in os.listdir(self.directory):
+            parent = os.path.join(self.directory, prefix)
+            if not os.path.isdir(parent):
+                continue
+            for name in os.listdir(parent):
+                entry = os.path.join(parent, name)
+                if name.endswith(".tmp") or not os.path.isdir(entry):
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry, e)) for e in os.listdir(entry))
+                ret.append((os.path.getmtime(entry), size, entry))
+        return ret
+
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes; returns the bytes freed."""
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        freed = 0
+        for last_use, size, entry in entries:
+            if total - freed <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors = True)
+            freed += size
+        return freed
@@ -10,26 +10,199 @@ from __future__ import print_function
 
 import logging as _logging
 import sys as _sys
-import google.protobuf.text_format as text_format
-# expose files as imports
-#from ..models import utils
+from collections import OrderedDict
 
-#from ..models import neural_network
-#from ..models import MLModel
-import converters
-#from .. import proto
+try:
+    unicode
+except NameError:
+    # Python 3
+    unicode = str
 
+# frontends, protobuf and NumPy are imported where used, so a conversion
+# only pays for the frameworks of its own source format
+
+
+
+def _optimize_IR(parser, args):
+    if not args.passes:
+        return
+
+    from common.IR.passes import PassManager
+    manager = PassManager(args.passes, fixed_point = args.fixedPoint, trace_memory = args.passMemory,
+            options = {'batch_size': args.batchSize})
+    manager.run(parser.IR_graph)
+    manager.print_report()
+
+    if args.passReport:
+        import json
+        with open(args.passReport, 'w') as of:
+            json.dump(manager.report, of, indent = 2)
+        print ("IR pass report saved as [{}].".format(args.passReport))
+
+
+
+def _externalize_weights(parser, args, blobs = None):
+    if args.blobStorePath:
+        from common.IR.weight_store import BlobStore, externalize_weights
+        store = BlobStore(args.blobStorePath)
+        externalize_weights(parser.IR_graph, store)
+        if blobs is not None:
+            blobs.extend(store.references)
+        report = store.report()
+        print ("{} tensors ({} bytes) written to blob store [{}], {} already stored ({} bytes saved).".format(
+            report["tensors_written"], report["bytes_written"], args.blobStorePath,
+            report["tensors_reused"], report["bytes_saved"]))
+        return
+
+    if not args.weightStorePath:
+        return
+
+    from common.IR.weight_store import WeightStoreWriter, CompressedWeightStoreWriter, externalize_weights
+    if args.weightCodec == 'none':
+        writer = WeightStoreWriter(args.weightStorePath)
+    else:
+        writer = CompressedWeightStoreWriter(args.weightStorePath, args.weightCodec, args.weightChunkSize)
+    moved = externalize_weights(parser.IR_graph, writer)
+    stored = writer.close()
+    print ("{} bytes of weights saved as [{}] ({} bytes on disk).".format(moved, args.weightStorePath, stored))
 
 
-def _convert(args):
-    if args.srcModelFormat == 'auto':
-        if args.srcModelPath.endswith('.caffemodel') or args.caffeProtoTxtPath != '':
-            args.srcModelFormat = 'caffe'
 
-        elif args.srcModelPath.endswith('.h5') or args.kerasJsonPath != '':
-            args.srcModelFormat = 'keras'
+def _IR_paths(args):
+    """Output path of every requested IR format.
 
+    dstModelPath receives the JSON IR when json is requested, otherwise the
+    first requested format; the other formats default to dstModelPath with
+    the format's extension unless irBinaryPath/irJsonPath/irTextPath is given.
+    Raises ValueError when two formats would be written to the same file.
+    """
+    import os
+    from common.IR.IR_io import IR_extensions
+
+    formats = args.irFormat.split('+')
+    primary = 'json' if 'json' in formats else formats[0]
+    explicit = {
+        'binary' : args.irBinaryPath,
+        'json'   : args.irJsonPath,
+        'text'   : args.irTextPath,
+        }
+
+    paths = list()
+    for ir_format in formats:
+        if explicit[ir_format]:
+            path = explicit[ir_format]
+        elif ir_format == primary:
+            path = args.dstModelPath
         else:
+            path = os.path.splitext(args.dstModelPath)[0] + IR_extensions[ir_format]
+        for other_format, other_path in paths:
+            if os.path.abspath(other_path) == os.path.abspath(path):
+                raise ValueError("IR formats [{}] and [{}] would both be written to [{}], set --ir{}Path.".format(
+                    other_format, ir_format, path, ir_format.capitalize()))
+        paths.append((ir_format, path))
+    return paths
+
+
+
+def _save_IR(parser, args):
+    from common.IR.IR_io import save_IR
+    for ir_format, path in _IR_paths(args):
+        save_IR(parser.IR_graph, path, ir_format)
+
+
+
+# arguments naming source files, hashed by content into the conversion cache key
+_CACHE_SOURCE_ARGS = ('srcModelPath', 'caffeProtoTxtPath', 'kerasJsonPath', 'meanImageProtoPath')
+
+# arguments without influence on the content of the outputs
+_CACHE_IGNORED_ARGS = ('numWorkers', 'noCache', 'cacheDir', 'cacheMaxSize', 'profileStartup',
+                       'batchManifest', 'batchGlob', 'batchOutputDir', 'batchWorkers', 'batchSummary')
+
+
+def _cache_outputs(args):
+    """role -> path of every file a conversion writes."""
+    outputs = OrderedDict()
+    for ir_format, path in _IR_paths(args):
+        outputs['ir_' + ir_format] = path
+    if args.weightStorePath and not args.blobStorePath:
+        outputs['weights'] = args.weightStorePath
+        outputs['weights_index'] = args.weightStorePath + '.json'
+    if args.passReport:
+        outputs['pass_report'] = args.passReport
+    return outputs
+
+
+def _cache_key(cache, args):
+    """Digest of the sources, converter version and options of a conversion, None if a source is missing."""
+    import os
+    from _scripts.conversion_cache import converter_fingerprint
+
+    sources = dict()
+    for name in _CACHE_SOURCE_ARGS:
+        path = getattr(args, name)
+        if path:
+            if not os.path.isfile(path):
+                return None
+            sources[name] = path
+
+    options = dict((name, value) for name, value in vars(args).items()
+                   if not name in _CACHE_IGNORED_ARGS and not name in _CACHE_SOURCE_ARGS and not name in _PER_MODEL_ARGS)
+    options['outputs'] = list(_cache_outputs(args))
+    options['converter'] = converter_fingerprint()
+    return cache.key(sources, options)
+
+
+def _convert_cached(args):
+    """_convert, or restore its outputs from the conversion cache when the same conversion already ran."""
+    import os
+
+    try:
+        _IR_paths(args)
+    except ValueError as e:
+        print ("error: {}".format(e))
+        return 1
+
+    if args.noCache:
+        return _convert(args)
+
+    from _scripts.conversion_cache import ConversionCache
+    cache = ConversionCache(args.cacheDir, args.cacheMaxSize << 20)
+    key = _cache_key(cache, args)
+    outputs = _cache_outputs(args)
+
+    # the cached IR only refers to blobs by digest, they must still be in the blob store
+    has_blob = None
+    if args.blobStorePath:
+        from common.IR.weight_store import BlobStore
+        has_blob = BlobStore(args.blobStorePath).__contains__
+    if key is not None and cache.restore(key, outputs, has_blob):
+        print ("Conversion cache hit [{}], outputs restored from [{}].".format(key[:16], args.cacheDir))
+        return 0
+
+    blobs = list()
+    ret = _convert(args, blobs)
+    if ret == 0 and key is not None and all(os.path.isfile(e) for e in outputs.values()):
+        cache.store(key, outputs, blobs)
+    return ret
+
+
+
+def _detect_format(args):
+    """srcModelFormat, resolving 'auto' from the source paths; None if it cannot be detected."""
+    if args.srcModelFormat != 'auto':
+        return args.srcModelFormat
+    if args.srcModelPath.endswith('.caffemodel') or args.caffeProtoTxtPath:
+        return 'caffe'
+    if args.srcModelPath.endswith('.h5') or args.kerasJsonPath:
+        return 'keras'
+    return None
+
+
+
+def _convert(args, blobs = None):
+    if args.srcModelFormat == 'auto':
+        args.srcModelFormat = _detect_format(args)
+        if args.srcModelFormat is None:
             print("error: coremlconverter: Unable to auto-detect model format. "
                   "Please specify the model format using the 'srcModelFormat' argument.")
             _sys.exit(1)
@@ -45,12 +218,10 @@ def _convert(args):
 
         from converters.caffe.caffe_parser import CaffeParser
         parser = CaffeParser(model, args.caffePhase)
-        parser.gen_IR()
-        parser.saveToJson(args.dstModelPath)
-
-        proto_str = parser.IR_graph.SerializeToString()
-        with open('kit_model.prototxt', 'wb') as of:
-            of.write(proto_str)
+        parser.gen_IR(args.numWorkers)
+        _optimize_IR(parser, args)
+        _externalize_weights(parser, args, blobs)
+        _save_IR(parser, args)
 
         return 0
 
@@ -69,13 +240,11 @@ def _convert(args):
                 model = args.srcModelPath
             
             from converters.keras.keras2_parser import Keras2Parser
-            parser = Keras2Parser(model)
-            parser.gen_IR()
-            parser.saveToJson(args.dstModelPath)
-
-            proto_str = parser.IR_graph.SerializeToString()
-            with open('kit_model.prototxt', 'wb') as of:
-                of.write(proto_str)
+            parser = Keras2Parser(model, args.useKeras)
+            parser.gen_IR(args.numWorkers)
+            _optimize_IR(parser, args)
+            _externalize_weights(parser, args, blobs)
+            _save_IR(parser, args)
 
             """ 
             from converters.keras.keras2_emitter import Keras2Emitter
@@ -88,16 +257,247 @@ def _convert(args):
         print('error: Invalid srcModelFormat specified.')
         return 1
 
-def _main():
+# arguments naming per-model output files, never shared between the models of a batch
+_PER_MODEL_ARGS = ('dstModelPath', 'weightStorePath', 'passReport', 'irBinaryPath', 'irJsonPath', 'irTextPath')
+
+
+def _read_manifest(path):
+    """Manifest entries: a JSON list of objects or a CSV with a header row, keyed by converter argument names."""
+    if path.endswith('.csv'):
+        import csv
+        with open(path, 'r') as fin:
+            return [dict((k, v) for k, v in row.items() if v) for row in csv.DictReader(fin)]
+
+    import json
+    with open(path, 'r') as fin:
+        entries = json.load(fin)
+    if isinstance(entries, dict):
+        entries = entries['models']
+    return entries
+
+
+def _glob_entries(pattern, output_dir):
+    import os
+    import glob
+
+    entries = list()
+    used = set()
+    for path in sorted(glob.glob(pattern)):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem
+        idx = 1
+        while name in used:
+            name = '{}_{}'.format(stem, idx)
+            idx += 1
+        used.add(name)
+        entries.append({'srcModelPath' : path, 'dstModelPath' : os.path.join(output_dir, name + '.json')})
+    return entries
+
+
+def _entry_args(defaults, entry):
+    """Namespace of one batch entry: the command line arguments overridden by the entry."""
     import argparse
 
+    args = argparse.Namespace(**vars(defaults))
+    for name in _PER_MODEL_ARGS:
+        setattr(args, name, '')
+
+    for name, value in entry.items():
+        if not hasattr(args, name):
+            raise KeyError("Unknown converter argument [{}] in the batch manifest.".format(name))
+        default = getattr(defaults, name)
+        # CSV manifests carry strings
+        if isinstance(default, bool) and not isinstance(value, bool):
+            value = str(value).lower() in ('1', 'true', 'yes')
+        elif isinstance(default, int) and not isinstance(default, bool):
+            value = int(value)
+        elif isinstance(default, float):
+            value = float(value)
+        elif isinstance(default, list) and not isinstance(value, list):
+            value = str(value).split()
+        setattr(args, name, value)
+
+    if not args.dstModelPath:
+        raise KeyError("Batch entry [{}] has no dstModelPath.".format(args.srcModelPath))
+    return args
+
+
+def _reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets the VmHWM peak of the process
+    try:
+        with open('/proc/self/clear_refs', 'w') as of:
+            of.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _peak_rss():
+    """Peak resident set size in bytes, since the last _reset_peak_rss where supported."""
+    try:
+        with open('/proc/self/status', 'r') as fin:
+            for line in fin:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if _sys.platform == 'darwin' else peak * 1024
+
+
+def _batch_convert(task, started = None):
+    import os
+    import time
+    import traceback
+
+    idx, args = task
+    if started is not None:
+        # lets _batch notice a worker killed in the middle of the model
+        started.put((idx, os.getpid()))
+    dst_dir = os.path.dirname(args.dstModelPath)
+    if dst_dir and not os.path.isdir(dst_dir):
+        try:
+            os.makedirs(dst_dir)
+        except OSError:
+            pass
+
+    _reset_peak_rss()
+    status, error = 'ok', ''
+    start = time.time()
+    stdout = _sys.stdout
+    log_path = args.dstModelPath + '.log'
+    with open(log_path, 'w') as log:
+        _sys.stdout = log
+        try:
+            ret = _convert_cached(args)
+            if ret:
+                status, error = 'failed', 'converter returned {}'.format(ret)
+        except (Exception, SystemExit) as e:
+            status, error = 'failed', '{}: {}'.format(type(e).__name__, e)
+            log.write(traceback.format_exc())
+        finally:
+            _sys.stdout = stdout
+
+    return idx, OrderedDict([
+            ('srcModelPath', args.srcModelPath),
+            ('dstModelPath', args.dstModelPath),
+            ('status', status),
+            ('error', error),
+            ('duration', time.time() - start),
+            ('peak_rss', _peak_rss()),
+            ('log', log_path),
+            ])
+
+
+def _batch_lost(args):
+    return OrderedDict([
+            ('srcModelPath', args.srcModelPath),
+            ('dstModelPath', args.dstModelPath),
+            ('status', 'failed'),
+            ('error', 'worker process died, killed or out of memory'),
+            ('duration', None),
+            ('peak_rss', None),
+            ('log', args.dstModelPath + '.log'),
+            ])
+
+
+# seconds between the checks of the batch workers
+_BATCH_POLL_INTERVAL = 1.0
+
+
+def _batch(args):
+    """Convert every model of a manifest or glob in a pool of worker processes; returns the failure count.
+
+    Every worker reports its pid when it starts a model. A model whose
+    worker dies before finishing (e.g. killed for running out of memory)
+    is recorded as failed, the pool replaces the worker and the batch goes on.
+    """
+    import json
+    import multiprocessing
+    from _scripts.daemon import _is_alive, _queue
+
+    if args.batchManifest:
+        entries = _read_manifest(args.batchManifest)
+    else:
+        if not args.batchOutputDir:
+            print("error: --batchGlob requires --batchOutputDir.")
+            return 1
+        entries = _glob_entries(args.batchGlob, args.batchOutputDir)
+
+    tasks = [(idx, _entry_args(args, entry)) for idx, entry in enumerate(entries)]
+    workers = max(1, min(args.batchWorkers, len(tasks)))
+    print ("Converting {} models with {} worker processes.".format(len(tasks), workers))
+
+    results = [None] * len(tasks)
+    manager = multiprocessing.Manager()
+    started = manager.Queue()
+    pool = multiprocessing.Pool(workers)
+    pending = OrderedDict((task[0], pool.apply_async(_batch_convert, (task, started))) for task in tasks)
+    pids = dict()
+    lost = False
+    try:
+        while pending:
+            try:
+                idx, pid = started.get(timeout = _BATCH_POLL_INTERVAL)
+                pids[idx] = pid
+                while True:
+                    idx, pid = started.get_nowait()
+                    pids[idx] = pid
+            except _queue.Empty:
+                pass
+
+            for idx, async_result in list(pending.items()):
+                if async_result.ready():
+                    result = async_result.get()[1]
+                elif idx in pids and not _is_alive(pids[idx]):
+                    result = _batch_lost(tasks[idx][1])
+                    lost = True
+                else:
+                    continue
+                del pending[idx]
+                results[idx] = result
+                print ("[{}/{}] {} {} ({})".format(
+                    len(tasks) - len(pending), len(tasks), result['status'], result['srcModelPath'],
+                    result['error'] if result['duration'] is None else
+                    "{:.1f}s, peak RSS {} MB".format(result['duration'], result['peak_rss'] // (1 << 20))))
+    finally:
+        # the pool never completes the task of a dead worker, join would wait for it forever
+        if lost or pending:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+        manager.shutdown()
+
+    failed = sum(e['status'] != 'ok' for e in results)
+    print ("{} models converted, {} failed.".format(len(results) - failed, failed))
+    if args.batchSummary:
+        with open(args.batchSummary, 'w') as of:
+            json.dump(results, of, indent = 2)
+        print ("Batch summary saved as [{}].".format(args.batchSummary))
+    return failed
+
+
+
+def _arg_parser():
+    import argparse
+    from _scripts.conversion_cache import DEFAULT_CACHE_DIR
+
     parser = argparse.ArgumentParser(description='Convert other model file formats to MLKit format (.mlmodel).')
     parser.add_argument('--srcModelFormat', type=unicode, choices=['auto', 'caffe', 'keras'], default='auto', help='Format of model at srcModelPath (default is to auto-detect).')
-    parser.add_argument('--srcModelPath', type=unicode, required=True, help='Path to the model file of the external tool (e.g caffe weights proto binary, keras h5 binary')
-    parser.add_argument('--dstModelPath', type=unicode, required=True, help='Path to save the model in format .mlmodel')
+    parser.add_argument('--srcModelPath', type=unicode, default='', help='Path to the model file of the external tool (e.g caffe weights proto binary, keras h5 binary')
+    parser.add_argument('--dstModelPath', type=unicode, default='', help='Path to save the model in format .mlmodel')
+    parser.add_argument('--irFormat', type=unicode, choices=['binary', 'json', 'text', 'binary+json'], default='binary+json', help='Format(s) of the saved IR (default binary+json). dstModelPath gets the JSON IR if requested, otherwise the selected format.')
+    parser.add_argument('--irBinaryPath', type=unicode, default='', help='Path of the binary IR (optional, default is dstModelPath with a .pb extension).')
+    parser.add_argument('--irJsonPath', type=unicode, default='', help='Path of the JSON IR (optional, default is dstModelPath).')
+    parser.add_argument('--irTextPath', type=unicode, default='', help='Path of the text IR (optional, default is dstModelPath with a .pbtxt extension).')
     parser.add_argument('--caffeProtoTxtPath', type=unicode, default='', help='Path to the .prototxt file if network differs from the source file (optional)')
     parser.add_argument('--meanImageProtoPath', type=unicode, default='', help='Path to the .binaryproto file containing the mean image if required by the network (optional). This requires a prototxt file to be specified.')
     parser.add_argument('--kerasJsonPath', type=unicode, default=None, help='Path to the .json file for keras if the network differs from the weights file (optional)')
+    parser.add_argument('--useKeras', action='store_true', default=False, help='Load Keras models with Keras (and TensorFlow) instead of reading their JSON config directly.')
     parser.add_argument('--inputNames', type=unicode, nargs='*', help='Names of the feature (input) columns, in order (required for keras models).')
     parser.add_argument('--outputNames', type=unicode, nargs='*', help='Names of the target (output) columns, in order (required for keras models).')
     parser.add_argument('--imageInputNames', type=unicode, default=[], action='append', help='Label the named input as an image. Can be specified more than once for multiple image inputs.')
@@ -110,8 +510,64 @@ def _main():
     parser.add_argument('--classInputPath', type=unicode, default='', help='Path to class labels (ordered new line separated) for treating the neural network as a classifier')
     parser.add_argument('--predictedFeatureName', type=unicode, default='class_output', help='Name of the output feature that captures the class name (for classifiers models).')
     parser.add_argument('--caffePhase', type=unicode, default='TRAIN', help='Convert the specific phase of caffe model.')
+    parser.add_argument('--passes', type=unicode, nargs='*', default=[], help='IR optimization passes to run after conversion; "standard" selects the inference pipeline (optional).')
+    parser.add_argument('--fixedPoint', action='store_true', default=False, help='Repeat the IR passes until none of them changes the graph (optional).')
+    parser.add_argument('--passReport', type=unicode, default='', help='Path to save the per-pass report as JSON (optional).')
+    parser.add_argument('--batchSize', type=int, default=1, help='Batch size the IR memory passes (schedule_memory, plan_memory) plan for (optional, default 1).')
+    parser.add_argument('--passMemory', action='store_true', default=False, help='Record the peak Python memory of every IR pass; slows the passes down (optional).')
+    parser.add_argument('--weightStorePath', type=unicode, default='', help='Path to save the weights as a memory-mappable sidecar file referenced from the IR instead of embedding them (optional).')
+    parser.add_argument('--weightCodec', type=unicode, choices=['none', 'zlib', 'lzma'], default='none', help='Compress the weightStorePath file in independent chunks with this codec (optional, default none).')
+    parser.add_argument('--weightChunkSize', type=int, default=1 << 20, help='Uncompressed size in bytes of the compressed weight chunks (optional, default 1MB).')
+    parser.add_argument('--blobStorePath', type=unicode, default='', help='Directory of a content-addressed blob store shared across conversions; identical weights are stored once and referenced by digest (optional, overrides weightStorePath).')
+    parser.add_argument('--numWorkers', type=int, default=1, help='Number of threads converting the independent layers of each topological level (optional, default 1 is sequential).')
+
+    parser.add_argument('--profile-startup', dest='profileStartup', action='store_true', default=False, help='Print the time spent importing every module, slowest first.')
+    parser.add_argument('--no-cache', dest='noCache', action='store_true', default=False, help='Always convert, neither reading nor filling the conversion cache.')
+    parser.add_argument('--cacheDir', type=unicode, default=DEFAULT_CACHE_DIR, help='Directory of the conversion cache (optional, default ~/.cache/dnnconvert).')
+    parser.add_argument('--cacheMaxSize', type=int, default=2048, help='Size in MB above which the least recently used conversions are evicted from the cache (optional, default 2048).')
+    parser.add_argument('--batchManifest', type=unicode, default='', help='Convert every model of a JSON (list of objects) or CSV manifest whose fields are converter argument names, srcModelPath and dstModelPath included (optional).')
+    parser.add_argument('--batchGlob', type=unicode, default='', help='Convert every source model matching this glob pattern into batchOutputDir (optional).')
+    parser.add_argument('--batchOutputDir', type=unicode, default='', help='Directory receiving the IR of every model of a batchGlob conversion.')
+    parser.add_argument('--batchWorkers', type=int, default=4, help='Number of worker processes of a batch conversion (optional, default 4).')
+    parser.add_argument('--batchSummary', type=unicode, default='', help='Path to save the per-model status, duration and peak RSS of a batch conversion as JSON (optional).')
+
+    return parser
+
+
+
+def _run(argv = None):
+    """Run one converter command line (a batch or a single conversion); returns the exit code."""
+    parser = _arg_parser()
+    args = parser.parse_args(argv)
+    if args.batchManifest or args.batchGlob:
+        return int(_batch(args) > 0)
+    if not args.srcModelPath or not args.dstModelPath:
+        parser.error('--srcModelPath and --dstModelPath are required outside of batch mode.')
+    return _convert_cached(args)
+
+
+
+def _main():
+    argv = _sys.argv[1:]
+    # "daemon" serves conversions from warm worker processes, "client" submits one to it
+    if argv[:1] == ['daemon']:
+        from _scripts.daemon import daemon_main
+        _sys.exit(daemon_main(argv[1:]))
+    if argv[:1] == ['client']:
+        from _scripts.daemon import client_main
+        _sys.exit(client_main(argv[1:]))
+
+    profiler = None
+    if '--profile-startup' in argv:
+        # installed before anything heavy is imported
+        from _scripts.startup_profile import ImportProfiler
+        profiler = ImportProfiler().install()
 
-    args = parser.parse_args()
-    ret = _convert(args)
+    try:
+        ret = _run(argv)
+    finally:
+        if profiler is not None:
+            profiler.uninstall()
+            profiler.print_report()
     _sys.exit(int(ret)) # cast to int or else the exit code is always 1
 
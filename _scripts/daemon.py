@@ -0,0 +1,348 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import binascii
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    # Python 2
+    import SocketServer as socketserver
+
+try:
+    import queue as _queue
+except ImportError:
+    # Python 2
+    import Queue as _queue
+
+from _scripts.conversion_cache import DEFAULT_CACHE_DIR
+
+
+# where the daemon listens and clients connect unless told otherwise
+DEFAULT_SOCKET = os.environ.get("DNNCONVERT_SOCKET", os.path.join(DEFAULT_CACHE_DIR, "daemon.sock"))
+
+# platforms without Unix domain sockets use this localhost port
+DEFAULT_PORT = 47305
+
+_HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+# seconds between two liveness checks of the worker running a job
+_POLL_INTERVAL = 1.0
+
+
+# Protocol: the client sends one JSON line {"argv": [...], "cwd": "..."} (or
+# {"shutdown": true}); the daemon answers with JSON lines {"output": "..."}
+# carrying the job's stdout/stderr as it is written, then one
+# {"exit_code": n, "duration": seconds} line.
+# Over TCP, where any local user can connect, requests also carry the
+# "token" the daemon wrote to a file only its owner can read.
+
+
+def token_path(address):
+    return address + ".token"
+
+
+def _write_token(path):
+    token = binascii.hexlify(os.urandom(32)).decode("ascii")
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as of:
+        of.write(token)
+    return token
+
+
+def _read_token(path):
+    try:
+        with open(path, "r") as fin:
+            return fin.read().strip()
+    except (IOError, OSError):
+        return ""
+
+
+def _same_token(given, token):
+    # compare_digest needs both sides of one type, JSON strings are unicode on Python 2
+    if not isinstance(given, type(u"")):
+        return False
+    return hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8"))
+
+
+def _is_alive(pid):
+    if os.name == "nt":
+        # os.kill would send a console event there, rely on job_timeout
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class _QueueWriter(object):
+    """File-like object forwarding everything written to a multiprocessing queue."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+
+    def write(self, text):
+        if text:
+            self.queue.put(text)
+
+
+    def flush(self):
+        pass
+
+
+
+def _worker_init():
+    # the frontends and the libraries they load for every model, keras itself
+    # (--useKeras) is left to the jobs needing it
+    import numpy
+    import converters.caffe.caffe_parser
+    import converters.caffe.caffe_weights
+    import converters.keras.keras2_parser
+    try:
+        import h5py
+    except ImportError:
+        pass
+
+
+def _run_job(argv, cwd, queue):
+    """Run one converter command line in a pool worker, streaming its output through queue."""
+    import traceback
+    from _scripts.converter import _run
+
+    # lets the daemon notice a worker killed in the middle of the job
+    queue.put({"pid" : os.getpid()})
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = _QueueWriter(queue)
+    start = time.time()
+    try:
+        if '--batchManifest' in argv or '--batchGlob' in argv:
+            print("error: batch conversions run their own worker pool, run them without the daemon.")
+            ret = 1
+        else:
+            os.chdir(cwd)
+            ret = int(_run(argv) or 0)
+    except SystemExit as e:
+        # argparse errors
+        ret = e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc(file = sys.stdout)
+        ret = 1
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        queue.put(None)
+    return ret, time.time() - start
+
+
+
+class ConversionDaemon(object):
+    """Serve converter command lines from a pool of warm worker processes.
+
+    The workers import the converter frontends once at startup; every job
+    then only pays for the conversion itself. Jobs are accepted
+    concurrently, at most num_workers run at a time.
+    """
+
+    def __init__(self, address = DEFAULT_SOCKET, num_workers = 2, job_timeout = None):
+        import multiprocessing
+
+        self.address = address
+        self.num_workers = num_workers
+        self.job_timeout = job_timeout
+        self.manager = multiprocessing.Manager()
+        self.pool = multiprocessing.Pool(num_workers, _worker_init)
+        self.server = None
+        self.token = None
+        # the pool never completes the task of a dead worker, join would wait for it forever
+        self._lost_jobs = False
+
+
+    def submit(self, argv, cwd):
+        """Run a job, yielding the protocol messages of its output and exit code.
+
+        A job whose worker dies (killed, out of memory) or that runs longer
+        than job_timeout seconds fails with exit code 1; in the latter case
+        the worker keeps running it to the end.
+        """
+        queue = self.manager.Queue()
+        start = time.time()
+        result = self.pool.apply_async(_run_job, (argv, cwd, queue))
+        pid = None
+        while True:
+            try:
+                message = queue.get(timeout = _POLL_INTERVAL)
+            except _queue.Empty:
+                error = None
+                if pid is not None and not _is_alive(pid):
+                    self._lost_jobs = True
+                    error = "error: the conversion worker died, killed or out of memory.\n"
+                elif self.job_timeout and time.time() - start > self.job_timeout:
+                    error = "error: the conversion did not finish within {} seconds.\n".format(self.job_timeout)
+                if error is not None:
+                    yield {"output" : error}
+                    yield {"exit_code" : 1, "duration" : time.time() - start}
+                    return
+                continue
+            if message is None:
+                break
+            if isinstance(message, dict):
+                pid = message["pid"]
+                continue
+            yield {"output" : message}
+        ret, duration = result.get()
+        yield {"exit_code" : ret, "duration" : duration}
+
+
+    def serve_forever(self):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                request = json.loads(self.rfile.readline().decode("utf-8"))
+                if daemon.token is not None and not _same_token(request.get("token"), daemon.token):
+                    messages = [{"output" : "error: invalid daemon token.\n"}, {"exit_code" : 1, "duration" : 0.0}]
+                elif request.get("shutdown"):
+                    threading.Thread(target = daemon.server.shutdown).start()
+                    messages = [{"exit_code" : 0, "duration" : 0.0}]
+                else:
+                    messages = daemon.submit(request["argv"], request["cwd"])
+                try:
+                    for message in messages:
+                        self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+                        self.wfile.flush()
+                except (IOError, OSError):
+                    # client went away, the job still completes
+                    for message in messages:
+                        pass
+
+        if _HAS_UNIX_SOCKETS:
+            class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+
+            directory = os.path.dirname(self.address)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            # only the owner may submit conversions
+            umask = os.umask(0o077)
+            try:
+                self.server = Server(self.address, Handler)
+            finally:
+                os.umask(umask)
+        else:
+            class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+                daemon_threads = True
+                allow_reuse_address = True
+            # other local users can reach the port, only the owner can read the token
+            self.token = _write_token(token_path(self.address))
+            self.server = Server(("127.0.0.1", DEFAULT_PORT), Handler)
+
+        print ("Conversion daemon listening on [{}] with {} workers.".format(
+            self.address if _HAS_UNIX_SOCKETS else "127.0.0.1:%d" % DEFAULT_PORT, self.num_workers))
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            for path in (self.address, token_path(self.address)):
+                if os.path.exists(path):
+                    os.remove(path)
+            if self._lost_jobs:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+            self.pool.join()
+            self.manager.shutdown()
+        return 0
+
+
+
+def _connect(address):
+    if _HAS_UNIX_SOCKETS:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+    else:
+        sock = socket.create_connection(("127.0.0.1", DEFAULT_PORT))
+    return sock
+
+
+def _exchange(sock, request, address, out):
+    out = sys.stdout if out is None else out
+    if not _HAS_UNIX_SOCKETS:
+        request = dict(request, token = _read_token(token_path(address)))
+    try:
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        fin = sock.makefile("rb")
+        for line in fin:
+            message = json.loads(line.decode("utf-8"))
+            if "output" in message:
+                out.write(message["output"])
+                out.flush()
+            elif "exit_code" in message:
+                return message["exit_code"]
+    except (IOError, OSError) as e:
+        sys.stderr.write("error: connection to the conversion daemon lost: {}\n".format(e))
+        return 1
+    finally:
+        sock.close()
+    sys.stderr.write("error: the conversion daemon closed the connection before the job ended.\n")
+    return 1
+
+
+def send_job(request, address = DEFAULT_SOCKET, out = None):
+    """Send one request to the daemon, copying its output to out; returns the exit code.
+
+    Raises socket.error (OSError) when no daemon is listening. Errors once
+    the request is sent are reported and return 1, the job may have run.
+    """
+    return _exchange(_connect(address), request, address, out)
+
+
+def daemon_main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog = 'daemon', description = 'Serve conversions from warm worker processes over a local socket.')
+    parser.add_argument('--socket', default = DEFAULT_SOCKET, help = 'Unix domain socket to listen on (default from DNNCONVERT_SOCKET or ~/.cache/dnnconvert/daemon.sock).')
+    parser.add_argument('--workers', type = int, default = 2, help = 'Number of conversions run at the same time (default 2).')
+    parser.add_argument('--jobTimeout', type = float, default = None, help = 'Seconds after which a conversion is reported as failed (default no limit).')
+    parser.add_argument('--stop', action = 'store_true', default = False, help = 'Stop the daemon listening on --socket.')
+    args = parser.parse_args(argv)
+
+    if args.stop:
+        try:
+            return send_job({"shutdown" : True}, args.socket)
+        except (IOError, OSError):
+            print("error: no conversion daemon on [{}].".format(args.socket))
+            return 1
+    return ConversionDaemon(args.socket, args.workers, args.jobTimeout).serve_forever()
+
+
+def client_main(argv):
+    """Run a converter command line through the daemon, or in process if none is running."""
+    address = DEFAULT_SOCKET
+    if argv[:1] == ['--socket']:
+        address, argv = argv[1], argv[2:]
+
+    # only a daemon that cannot be reached falls back, once a job is sent
+    # it may have run and is not run again
+    try:
+        sock = _connect(address)
+    except (IOError, OSError):
+        sys.stderr.write("No conversion daemon on [{}], converting in process.\n".format(address))
+        from _scripts.converter import _run
+        return _run(argv)
+    return _exchange(sock, {"argv" : argv, "cwd" : os.getcwd()}, address, None)
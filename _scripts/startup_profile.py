@@ -0,0 +1,66 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import time
+
+try:
+    import builtins
+except ImportError:
+    # Python 2
+    import __builtin__ as builtins
+
+
+class ImportProfiler(object):
+    """Time every first import of a module by wrapping builtins.__import__.
+
+    For each module the cumulative time (its own body and everything it
+    imports) and the self time (without the nested first imports) are
+    recorded, like "python -X importtime" but switchable from the command
+    line and available on every Python version.
+    """
+
+    def __init__(self):
+        self.records = list()
+        self._stack = list()
+        self._original = None
+        self._start = None
+
+
+    def install(self):
+        self._original = builtins.__import__
+        self._start = time.time()
+        builtins.__import__ = self._import
+        return self
+
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+
+    def _import(self, name, globals = None, locals = None, fromlist = (), level = 0):
+        if level > 0 or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.0)
+        start = time.time()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.records.append((elapsed, elapsed - nested, name, len(self._stack)))
+
+
+    def print_report(self, limit = 30):
+        total = time.time() - self._start
+        top_level = sum(e[0] for e in self.records if e[3] == 0)
+        print ("{:>10} {:>10}  {}".format("cumul(ms)", "self(ms)", "module"))
+        for cumulative, own, name, depth in sorted(self.records, reverse = True)[:limit]:
+            print ("{:>10.1f} {:>10.1f}  {}{}".format(cumulative * 1000, own * 1000, "  " * depth, name))
+        print ("{} modules imported in {:.1f} ms of a {:.1f} ms run.".format(len(self.records), top_level * 1000, total * 1000))
@@ -2,22 +2,192 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
+
+
 class GraphNode(object):
 
     def __init__(self, layer):
+        # edge lists keep insertion order, the sets make membership O(1)
         self.in_edges = list()
         self.out_edges = list()
+        self._in_set = set()
+        self._out_set = set()
         self.layer = layer
         self.left_in_edges = 0
 
 
 
+class OrderedSet(object):
+    """Insertion-ordered set of node names, O(1) add, discard and membership."""
+
+    def __init__(self, names = ()):
+        self._items = OrderedDict((name, None) for name in names)
+
+
+    def add(self, name):
+        self._items[name] = None
+
+
+    def discard(self, name):
+        self._items.pop(name, None)
+
+
+    def __contains__(self, name):
+        return name in self._items
+
+
+    def __iter__(self):
+        return iter(self._items)
+
+
+    def __len__(self):
+        return len(self._items)
+
+
+    def __repr__(self):
+        return "OrderedSet(%r)" % list(self._items)
+
+
+
+class _OrderCell(object):
+
+    __slots__ = ('name', 'label', 'prev', 'next')
+
+    def __init__(self, name, label):
+        self.name = name
+        self.label = label
+        self.prev = None
+        self.next = None
+
+
+
+class TopologicalOrder(object):
+    """Topological order that stays valid while nodes and edges are inserted.
+
+    Nodes live in a doubly linked list of cells carrying increasing integer
+    labels, so comparing two positions and inserting next to a node are O(1).
+    When a new edge contradicts the order, only the nodes whose labels lie
+    between its endpoints are reshuffled (Pearce-Kelly).
+    """
+
+    _GAP = 1 << 16
+
+    def __init__(self, names = ()):
+        self._cells = dict()
+        self._head = None
+        self._tail = None
+        for name in names:
+            self.append(name)
+
+
+    def __len__(self):
+        return len(self._cells)
+
+
+    def __contains__(self, name):
+        return name in self._cells
+
+
+    def __iter__(self):
+        cell = self._head
+        while cell is not None:
+            yield cell.name
+            cell = cell.next
+
+
+    def label(self, name):
+        return self._cells[name].label
+
+
+    def append(self, name):
+        label = 0 if self._tail is None else self._tail.label + self._GAP
+        cell = _OrderCell(name, label)
+        if self._tail is None:
+            self._head = cell
+        else:
+            self._tail.next = cell
+            cell.prev = self._tail
+        self._tail = cell
+        self._cells[name] = cell
+
+
+    def insert_after(self, anchor, name):
+        prev = self._cells[anchor]
+        if prev.next is None:
+            self.append(name)
+            return
+
+        if prev.next.label - prev.label < 2:
+            self._relabel()
+        cell = _OrderCell(name, (prev.label + prev.next.label) // 2)
+        cell.prev = prev
+        cell.next = prev.next
+        prev.next.prev = cell
+        prev.next = cell
+        self._cells[name] = cell
+
+
+    def remove(self, name):
+        cell = self._cells.pop(name)
+        if cell.prev is None:
+            self._head = cell.next
+        else:
+            cell.prev.next = cell.next
+        if cell.next is None:
+            self._tail = cell.prev
+        else:
+            cell.next.prev = cell.prev
+
+
+    def _relabel(self):
+        label = 0
+        cell = self._head
+        while cell is not None:
+            cell.label = label
+            label += self._GAP
+            cell = cell.next
+
+
+    def reorder(self, graph, src, dst):
+        """Restore the order after edge src -> dst was added to graph.
+
+        Raises ValueError if the edge closes a cycle.
+        """
+        upper = self._cells[src].label
+        lower = self._cells[dst].label
+        if upper < lower:
+            return
+
+        forward = self._collect(graph, dst, lambda node: node.out_edges, lambda label: label < upper, src)
+        backward = self._collect(graph, src, lambda node: node.in_edges, lambda label: label > lower, None)
+
+        cells = sorted((self._cells[name] for name in forward + backward), key = lambda cell: cell.label)
+        names = sorted(backward, key = self.label) + sorted(forward, key = self.label)
+        for cell, name in zip(cells, names):
+            cell.name = name
+            self._cells[name] = cell
+
+
+    def _collect(self, graph, start, edges, in_window, stop):
+        visited = set([start])
+        stack = [start]
+        while stack:
+            for name in edges(graph.layer_map[stack.pop()]):
+                if name == stop:
+                    raise ValueError("Edge to [%s] creates a cycle." % stop)
+                if not name in visited and in_window(self._cells[name].label):
+                    visited.add(name)
+                    stack.append(name)
+        return list(visited)
+
+
+
 class Graph(object):
- 
-    @classmethod
+
     def __init__(self, model):
         # key: layer_name    value: keras layer
-        self.layer_map = {}
+        self.layer_map = OrderedDict()
         self.input_layers = list()
         self.output_layers = list()
         self.layer_name_map = dict()   # maybe re-direct to defuse or fuse node
@@ -26,7 +196,40 @@ class Graph(object):
 
 
 
-    @classmethod
+    # the order and the input/output layers are maintained in place by the
+    # insert/remove operations; iterate them, or copy with list() to index
+
+    @property
+    def topological_sort(self):
+        return self.topological_order
+
+
+    @topological_sort.setter
+    def topological_sort(self, names):
+        self.topological_order = TopologicalOrder(names)
+
+
+    @property
+    def input_layers(self):
+        return self._input_layers
+
+
+    @input_layers.setter
+    def input_layers(self, names):
+        self._input_layers = OrderedSet(names)
+
+
+    @property
+    def output_layers(self):
+        return self._output_layers
+
+
+    @output_layers.setter
+    def output_layers(self, names):
+        self._output_layers = OrderedSet(names)
+
+
+
     def build(self):
         self._make_input_layers()
         self._make_output_layers()
@@ -34,53 +237,146 @@ class Graph(object):
 
 
 
-    @classmethod
     def _make_input_layers(self):
+        self.input_layers = list()
         for name, layer in self.layer_map.items():
             layer.left_in_edges = len(layer.in_edges)
             if len(layer.in_edges) == 0:
-                self.input_layers.append(name)
+                self.input_layers.add(name)
 
 
-    @classmethod
     def _make_output_layers(self):
+        self.output_layers = list()
         for name, layer in self.layer_map.items():
             if len(layer.out_edges) == 0:
-                self.output_layers.append(name)
+                self.output_layers.add(name)
+
 
 
-    
-    @classmethod
     def get_node(self, name):
         if not name in self.layer_map:
             print ("Error: Graph doesn't have node [%s]." % name)
             return None
         else:
             return self.layer_map[name]
-        
 
-    @classmethod
+
     def _make_connection(self, src, dst):
         if src == dst:
 #            print ("Warning: Graph Construct a self-loop node {}. Ignored.".format(src))
             return
 
-        if not dst in self.layer_map[src].out_edges:
-            self.layer_map[src].out_edges.append(dst)
-        if not src in self.layer_map[dst].in_edges:
-            self.layer_map[dst].in_edges.append(src)
+        src_node = self.layer_map[src]
+        dst_node = self.layer_map[dst]
+        if not dst in src_node._out_set:
+            src_node._out_set.add(dst)
+            src_node.out_edges.append(dst)
+        if not src in dst_node._in_set:
+            dst_node._in_set.add(src)
+            dst_node.in_edges.append(src)
 
 
 
-    @classmethod
     def _get_topological_sort(self):
-        self.topological_sort = self.input_layers[:]
+        topological_sort = list(self.input_layers)
         idx = 0
-        while idx < len(self.topological_sort):
-            current_node = self.get_node(self.topological_sort[idx])
+        while idx < len(topological_sort):
+            current_node = self.get_node(topological_sort[idx])
             for next_node in current_node.out_edges:
                 next_node_info = self.get_node(next_node)
                 next_node_info.left_in_edges -= 1
                 if next_node_info.left_in_edges == 0:
-                    self.topological_sort.append(next_node)
+                    topological_sort.append(next_node)
             idx += 1
+        self.topological_sort = topological_sort
+
+
+
+    def topological_levels(self):
+        """Group nodes into wavefronts: every predecessor of a node in level k is in a level < k."""
+        depth = dict()
+        levels = list()
+        for name in self.topological_order:
+            node = self.layer_map[name]
+            depth[name] = max([depth[pred] + 1 for pred in node.in_edges] or [0])
+            if depth[name] == len(levels):
+                levels.append(list())
+            levels[depth[name]].append(name)
+        return levels
+
+
+
+    def insert_node(self, name, node, after = None):
+        """Add an unconnected node to a built graph.
+
+        The node is placed right after [after] in the topological order (or at
+        the end), so connecting it to its neighbours only touches nodes between
+        them.
+        """
+        self.layer_map[name] = node
+        self.layer_name_map[name] = name
+        if after is None:
+            self.topological_order.append(name)
+        else:
+            self.topological_order.insert_after(after, name)
+        self.input_layers.add(name)
+        self.output_layers.add(name)
+
+
+
+    def remove_node(self, name, bypass = None):
+        """Remove a node and its edges from a built graph, in O(its degree).
+
+        With bypass (the name of one of its predecessors), the node's
+        successors are connected to bypass instead; bypass precedes the node
+        in the order, so the order stays valid without reshuffling.
+        """
+        node = self.layer_map[name]
+        successors = list(node.out_edges)
+        for pred in list(node.in_edges):
+            self.remove_edge(pred, name)
+        for succ in successors:
+            self.remove_edge(name, succ)
+
+        del self.layer_map[name]
+        self.layer_name_map.pop(name, None)
+        self.topological_order.remove(name)
+        self.input_layers.discard(name)
+        self.output_layers.discard(name)
+
+        if bypass is not None:
+            for succ in successors:
+                self.insert_edge(bypass, succ)
+
+
+
+    def insert_edge(self, src, dst):
+        if src == dst or dst in self.layer_map[src]._out_set:
+            return
+
+        self._make_connection(src, dst)
+        try:
+            self.topological_order.reorder(self, src, dst)
+        except ValueError:
+            self.remove_edge(src, dst)
+            raise
+
+        self.output_layers.discard(src)
+        self.input_layers.discard(dst)
+
+
+
+    def remove_edge(self, src, dst):
+        src_node = self.layer_map[src]
+        dst_node = self.layer_map[dst]
+        if not dst in src_node._out_set:
+            return
+
+        src_node._out_set.remove(dst)
+        src_node.out_edges.remove(dst)
+        dst_node._in_set.remove(src)
+        dst_node.in_edges.remove(src)
+        if len(src_node.out_edges) == 0:
+            self.output_layers.add(src)
+        if len(dst_node.in_edges) == 0:
+            self.input_layers.add(dst)
@@ -1,19 +1,65 @@
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
-            
+
+import threading
 import common.IR.graph_pb2 as graph_pb2
 from common.IR.graph_pb2 import NodeDef, GraphDef, DataType
 
 
 class Parser(object):
 
-    @classmethod
     def __init__(self):
+        self._local = threading.local()
         self.IR_graph = GraphDef()
 
 
-    @classmethod
+    @property
+    def IR_graph(self):
+        # inside a gen_IR worker thread, nodes go to that thread's scratch graph
+        return getattr(self._local, "IR_graph", self._IR_graph)
+
+
+    @IR_graph.setter
+    def IR_graph(self, graph):
+        self._IR_graph = graph
+
+
+    def _gen_IR_by_level(self, source_graph, convert, num_workers):
+        """Convert each topological level of source_graph concurrently.
+
+        Every node is converted into its own scratch GraphDef, by a thread of
+        the pool for levels of several nodes, then the scratch nodes are
+        appended to IR_graph in source_graph.topological_sort order, as the
+        sequential conversion emits them.
+        """
+        from multiprocessing.pool import ThreadPool
+
+        def convert_isolated(name):
+            self._local.IR_graph = GraphDef()
+            try:
+                convert(source_graph.get_node(name))
+                return self._local.IR_graph
+            finally:
+                del self._local.IR_graph
+
+        scratches = dict()
+        pool = ThreadPool(num_workers)
+        try:
+            for level in source_graph.topological_levels():
+                if len(level) == 1:
+                    scratches[level[0]] = convert_isolated(level[0])
+                    continue
+                scratches.update(zip(level, pool.map(convert_isolated, level)))
+        finally:
+            pool.close()
+            pool.join()
+
+        for name in source_graph.topological_sort:
+            self.IR_graph.node.extend(scratches[name].node)
+
+
+
     def saveToJson(self, filename = None):
         import google.protobuf.json_format as json_format
         
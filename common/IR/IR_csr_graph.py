@@ -0,0 +1,199 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import common.IR.graph_pb2 as graph_pb2
+from common.utils import load_protobuf_from_file
+
+
+class IRCSRGraphNode(object):
+    """Lightweight view of one node of an IRCSRGraph.
+
+    Views are created on demand by IRCSRGraph.get_node and only hold the
+    graph and the integer node id, so nothing per node is kept alive between
+    queries.
+    """
+
+    __slots__ = ('graph', 'id')
+
+    def __init__(self, graph, node_id):
+        self.graph = graph
+        self.id = node_id
+
+
+    @property
+    def IR_layer(self):
+        return self.graph.model.node[self.id]
+
+
+    @property
+    def layer(self):
+        return self.IR_layer
+
+
+    @property
+    def name(self):
+        return self.graph.names[self.id]
+
+
+    @property
+    def type(self):
+        return self.IR_layer.op
+
+
+    @property
+    def in_edges(self):
+        return [self.graph.names[i] for i in self.graph.predecessors(self.id)]
+
+
+    @property
+    def out_edges(self):
+        return [self.graph.names[i] for i in self.graph.successors(self.id)]
+
+
+
+class IRCSRGraph(object):
+    """Compact, integer-indexed representation of an IR GraphDef.
+
+    Node names are interned to ids following the order of GraphDef.node.
+    Edges are stored as two CSR structures (pred_ptr/pred_idx for fan-in and
+    succ_ptr/succ_idx for fan-out) in int32 NumPy arrays, so degree queries,
+    traversal and topological sort run as array operations.
+    The public surface mirrors IRGraph: build, get_node, input_layers,
+    output_layers and topological_sort (all by name).
+    """
+
+    def __init__(self, model):
+        if isinstance(model, graph_pb2.GraphDef):
+            self.model = model
+        else:
+            self.model = graph_pb2.GraphDef()
+            load_protobuf_from_file(self.model, model)
+
+        self.names = list()
+        self.name_to_id = dict()
+        self.pred_ptr = self.pred_idx = None
+        self.succ_ptr = self.succ_idx = None
+        self.input_layers = list()
+        self.output_layers = list()
+        self.topological_sort = list()
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def build(self):
+        self.names = [layer.name for layer in self.model.node]
+        self.name_to_id = dict((name, idx) for idx, name in enumerate(self.names))
+        num = len(self.names)
+
+        src = list()
+        dst = list()
+        for idx, layer in enumerate(self.model.node):
+            for pred in layer.input:
+                pred_id = self.name_to_id.get(pred)
+                if pred_id is None or pred_id == idx:
+                    continue
+                src.append(pred_id)
+                dst.append(idx)
+
+        src = np.asarray(src, dtype = np.int64)
+        dst = np.asarray(dst, dtype = np.int64)
+
+        # drop duplicated edges, keeping the first occurrence so that input order is preserved
+        _, first = np.unique(src * max(num, 1) + dst, return_index = True)
+        first.sort()
+        src = src[first]
+        dst = dst[first]
+
+        self.pred_ptr, self.pred_idx = IRCSRGraph._to_csr(dst, src, num)
+        self.succ_ptr, self.succ_idx = IRCSRGraph._to_csr(src, dst, num)
+
+        self.input_layers = [self.names[i] for i in np.flatnonzero(self.in_degree() == 0)]
+        self.output_layers = [self.names[i] for i in np.flatnonzero(self.out_degree() == 0)]
+        self.topological_sort = [self.names[i] for i in self.topological_order()]
+
+
+    @staticmethod
+    def _to_csr(rows, cols, num):
+        order = np.argsort(rows, kind = 'mergesort')
+        ptr = np.zeros(num + 1, dtype = np.int32)
+        np.cumsum(np.bincount(rows, minlength = num), out = ptr[1:])
+        return ptr, cols[order].astype(np.int32)
+
+
+    @staticmethod
+    def _gather(ptr, idx, nodes):
+        """Concatenated neighbour lists of all ids in nodes, without a Python loop."""
+        nodes = np.asarray(nodes, dtype = np.int64)
+        starts = ptr[nodes].astype(np.int64)
+        counts = ptr[nodes + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype = idx.dtype)
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        return idx[offsets]
+
+
+    def get_node(self, name):
+        if not name in self.name_to_id:
+            print ("Error: Graph doesn't have node [%s]." % name)
+            return None
+        return IRCSRGraphNode(self, self.name_to_id[name])
+
+
+    def predecessors(self, node_id):
+        return self.pred_idx[self.pred_ptr[node_id] : self.pred_ptr[node_id + 1]]
+
+
+    def successors(self, node_id):
+        return self.succ_idx[self.succ_ptr[node_id] : self.succ_ptr[node_id + 1]]
+
+
+    def in_degree(self):
+        return np.diff(self.pred_ptr)
+
+
+    def out_degree(self):
+        return np.diff(self.succ_ptr)
+
+
+    def topological_levels(self):
+        """Kahn's algorithm run one frontier at a time.
+
+        Returns a list of int32 arrays; every node of level k only depends on
+        nodes of levels < k.
+        """
+        left_in_edges = self.in_degree().astype(np.int64)
+        frontier = np.flatnonzero(left_in_edges == 0)
+        levels = list()
+        while frontier.size > 0:
+            levels.append(frontier.astype(np.int32))
+            succ = IRCSRGraph._gather(self.succ_ptr, self.succ_idx, frontier)
+            if succ.size == 0:
+                break
+            left_in_edges -= np.bincount(succ, minlength = len(left_in_edges))
+            candidates = np.unique(succ)
+            frontier = candidates[left_in_edges[candidates] == 0]
+        return levels
+
+
+    def topological_order(self):
+        levels = self.topological_levels()
+        if len(levels) == 0:
+            return np.empty(0, dtype = np.int32)
+        return np.concatenate(levels)
+
+
+    def descendants(self, name):
+        """Ids of all nodes reachable from the given node (excluding itself)."""
+        seen = np.zeros(len(self.names), dtype = bool)
+        frontier = np.asarray([self.name_to_id[name]])
+        while frontier.size > 0:
+            succ = IRCSRGraph._gather(self.succ_ptr, self.succ_idx, frontier)
+            succ = np.unique(succ[~seen[succ]])
+            seen[succ] = True
+            frontier = succ
+        return np.flatnonzero(seen)
@@ -41,30 +41,108 @@ class IRGraph(Graph):
         return ret
 
     
-    @classmethod
-    def __init__(self, filename):
-        model = graph_pb2.GraphDef()
-        load_protobuf_from_file(model, filename)
+    def __init__(self, model, weight_store = None):
+        if not isinstance(model, graph_pb2.GraphDef):
+            filename = model
+            model = graph_pb2.GraphDef()
+            load_protobuf_from_file(model, filename)
         super(IRGraph, self).__init__(model)
 
+        # sidecar weights (file or blob directory), memory mapped so only the tensors read are loaded
+        if weight_store is not None:
+            from common.IR.weight_store import open_weight_store
+            weight_store = open_weight_store(weight_store)
+        self.weight_store = weight_store
+        # names of the nodes removed from the graph whose NodeDefs are still in self.model
+        self._removed = set()
+
 
   
-    @classmethod
     def build(self):
         self.input_layers = list()
         for i, layer in enumerate(self.model.node):
             self.layer_map[layer.name] = IRGraphNode(layer)
             self.layer_name_map[layer.name] = layer.name
+        # inputs naming no node of the graph are left unconnected
+        for layer in self.model.node:
             for pred in layer.input:
-                self._make_connection(pred, layer.name)
+                if pred in self.layer_map:
+                    self._make_connection(pred, layer.name)
         super(IRGraph, self).build()
 
 
-    @classmethod
-    def saveToJson(filename = None):
-        json_str = json_format.MessageToJson(parser.IR_graph, preserving_proto_field_name = True)
+
+    def get_weight(self, name, key):
+        from common.IR.IR_tensor import get_weight
+        return get_weight(self.get_node(name).IR_layer, key, self.weight_store)
+
+
+
+    def close(self):
+        """Close the weight store opened for this graph (a compressed store runs a thread pool)."""
+        if self.weight_store is not None:
+            self.weight_store.close()
+            self.weight_store = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+    def insert_IR_node(self, IR_node, after = None):
+        """Add a NodeDef (already present in self.model) to the built graph, keeping the order valid."""
+        self.insert_node(IR_node.name, IRGraphNode(IR_node), after)
+        for pred in IR_node.input:
+            self.insert_edge(pred, IR_node.name)
+
+
+
+    def remove_IR_node(self, name):
+        """Remove a node, reconnecting its consumers to its first input, in O(its degree).
+
+        The consumers' NodeDef inputs are rewritten at once; the NodeDef
+        itself stays in self.model until compact(), so removing k nodes costs
+        one pass over self.model instead of k.
+        """
+        IR_node = self.layer_map[name].layer
+        bypass = IR_node.input[0] if len(IR_node.input) > 0 else None
+        consumers = list(self.layer_map[name].out_edges)
+        self.remove_node(name, bypass if bypass in self.layer_map else None)
+
+        for consumer in consumers:
+            inputs = self.layer_map[consumer].layer.input
+            rewired = [bypass if e == name else e for e in inputs]
+            del inputs[:]
+            inputs.extend(e for e in rewired if e is not None)
+        self._removed.add(name)
+
+
+
+    def compact(self):
+        """Drop the NodeDefs of removed nodes from self.model; returns True if any was dropped."""
+        if not self._removed:
+            return False
+        kept = [node for node in self.model.node if not node.name in self._removed]
+        del self.model.node[:]
+        self.model.node.extend(kept)
+        # extend copies the messages, point the graph nodes at the new ones
+        for node in self.model.node:
+            self.layer_map[node.name].layer = node
+        self._removed.clear()
+        return True
+
+
+    def saveToJson(self, filename = None):
+        import google.protobuf.json_format as json_format
+
+        json_str = json_format.MessageToJson(self.model, preserving_proto_field_name = True)
         if filename != None:
-            with open(filename, "wb") as of:
+            with open(filename, "w") as of:
                 of.write(json_str)
             print ("IR saved as {}".format(filename))
         return json_str
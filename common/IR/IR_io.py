@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import base64
+import common.IR.graph_pb2 as graph_pb2
+
+
+# base64 encodes 3 bytes to 4 characters, chunks must be a multiple of 3 to concatenate
+BASE64_CHUNK_SIZE = 3 * (1 << 18)
+
+# GraphDef.node field tag, length-delimited
+_NODE_TAG = b"\x0a"
+
+IR_formats = ("binary", "json", "text")
+
+IR_extensions = {
+        "binary" : ".pb",
+        "json"   : ".json",
+        "text"   : ".pbtxt",
+        }
+
+
+def _varint(value):
+    ret = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            ret.append(byte | 0x80)
+        else:
+            ret.append(byte)
+            return bytes(ret)
+
+
+def write_binary(IR_graph, filename):
+    """Serialize IR_graph node by node; the file is a regular binary GraphDef."""
+    with open(filename, "wb") as of:
+        for node in IR_graph.node:
+            data = node.SerializeToString()
+            of.write(_NODE_TAG)
+            of.write(_varint(len(data)))
+            of.write(data)
+        if IR_graph.version:
+            version = graph_pb2.GraphDef(version = IR_graph.version)
+            of.write(version.SerializeToString())
+
+
+def _strip_tensor_contents(node):
+    """Copy of node without tensor_content, and the attr keys whose content was left out."""
+    stripped = graph_pb2.NodeDef(name = node.name, op = node.op, input = node.input)
+    keys = list()
+    for key in node.attr:
+        attr = node.attr[key]
+        if attr.HasField("tensor") and len(attr.tensor.tensor_content) > 0:
+            tensor = stripped.attr[key].tensor
+            tensor.dtype = attr.tensor.dtype
+            tensor.tensor_shape.CopyFrom(attr.tensor.tensor_shape)
+            tensor.version_number = attr.tensor.version_number
+            keys.append(key)
+        else:
+            stripped.attr[key].CopyFrom(attr)
+    return stripped, keys
+
+
+def _write_base64(of, content):
+    view = memoryview(content)
+    for start in range(0, len(view), BASE64_CHUNK_SIZE):
+        of.write(base64.b64encode(view[start : start + BASE64_CHUNK_SIZE]).decode("ascii"))
+
+
+def write_json(IR_graph, filename):
+    """Write IR_graph as protobuf JSON, one node at a time.
+
+    The output is byte for byte what json_format.MessageToJson(IR_graph,
+    preserving_proto_field_name = True) returns. Each node is converted
+    without its tensor contents, which are streamed in base64 chunks
+    instead, so memory use is bounded by the largest node rather than by a
+    JSON string of the whole model.
+    """
+    from google.protobuf import json_format
+
+    with open(filename, "w") as of:
+        if len(IR_graph.node) == 0 and not IR_graph.version:
+            of.write("{}")
+            return
+
+        of.write("{")
+        if len(IR_graph.node) > 0:
+            of.write("\n  \"node\": [")
+        for idx, node in enumerate(IR_graph.node):
+            stripped, keys = _strip_tensor_contents(node)
+            node_dict = json_format.MessageToDict(stripped, preserving_proto_field_name = True)
+            markers = list()
+            for key in keys:
+                marker = "__tensor_content_%d_%s__" % (idx, key)
+                node_dict["attr"][key]["tensor"]["tensor_content"] = marker
+                markers.append((key, "\"%s\"" % marker))
+
+            text = json.dumps(node_dict, indent = 2).replace("\n", "\n    ")
+            of.write(",\n    " if idx else "\n    ")
+            pos = 0
+            for key, marker in markers:
+                begin = text.index(marker, pos)
+                of.write(text[pos : begin])
+                of.write("\"")
+                _write_base64(of, node.attr[key].tensor.tensor_content)
+                of.write("\"")
+                pos = begin + len(marker)
+            of.write(text[pos:])
+        if len(IR_graph.node) > 0:
+            of.write("\n  ]")
+        if IR_graph.version:
+            of.write(",\n" if len(IR_graph.node) > 0 else "\n")
+            of.write("  \"version\": %d" % IR_graph.version)
+        of.write("\n}")
+
+
+def write_text(IR_graph, filename):
+    """Write IR_graph in protobuf text format, one node at a time."""
+    from google.protobuf import text_format
+
+    with open(filename, "w") as of:
+        for node in IR_graph.node:
+            of.write("node {\n")
+            of.write(text_format.MessageToString(node, indent = 2))
+            of.write("}\n")
+        if IR_graph.version:
+            of.write("version: %d\n" % IR_graph.version)
+
+
+def save_IR(IR_graph, filename, IR_format):
+    writers = {
+            "binary" : write_binary,
+            "json"   : write_json,
+            "text"   : write_text,
+            }
+    if not IR_format in writers:
+        raise ValueError("Unknown IR format [%s], use one of %s." % (IR_format, ", ".join(IR_formats)))
+    writers[IR_format](IR_graph, filename)
+    print ("IR saved as [{}] in {} format.".format(filename, IR_format))
@@ -0,0 +1,96 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import common.IR.graph_pb2 as graph_pb2
+
+
+# IR DataType <-> NumPy dtype; tensor_content is always little-endian.
+np_dtype_map = {
+        graph_pb2.DT_INT8       : np.dtype('<i1'),
+        graph_pb2.DT_INT16      : np.dtype('<i2'),
+        graph_pb2.DT_INT32      : np.dtype('<i4'),
+        graph_pb2.DT_INT64      : np.dtype('<i8'),
+        graph_pb2.DT_UINT8      : np.dtype('<u1'),
+        graph_pb2.DT_UINT16     : np.dtype('<u2'),
+        graph_pb2.DT_UINT32     : np.dtype('<u4'),
+        graph_pb2.DT_UINT64     : np.dtype('<u8'),
+        graph_pb2.DT_FLOAT16    : np.dtype('<f2'),
+        graph_pb2.DT_FLOAT32    : np.dtype('<f4'),
+        graph_pb2.DT_FLOAT64    : np.dtype('<f8'),
+        graph_pb2.DT_COMPLEX64  : np.dtype('<c8'),
+        graph_pb2.DT_COMPLEX128 : np.dtype('<c16'),
+        graph_pb2.DT_BOOL       : np.dtype('?'),
+        }
+
+# suffix of the string attr referencing a tensor kept outside the GraphDef
+REF_SUFFIX = "_ref"
+
+# sparse weights (see common.IR.sparse): format string attr and the attrs of the parts
+SPARSE_FORMAT_SUFFIX = "_sparse_format"
+SPARSE_COMPONENT_SUFFIXES = ("_values", "_indices", "_indptr", "_block_shape")
+
+IR_dtype_map = dict((v.newbyteorder('='), k) for k, v in np_dtype_map.items())
+
+
+def IR_dtype(np_dtype):
+    np_dtype = np.dtype(np_dtype).newbyteorder('=')
+    if not np_dtype in IR_dtype_map:
+        raise TypeError("NumPy dtype [%s] has no IR DataType." % np_dtype)
+    return IR_dtype_map[np_dtype]
+
+
+def ndarray_to_tensor(array, tensor):
+    """Fill a LiteralTensor with the raw little-endian bytes of array."""
+    array = np.asarray(array)
+    tensor.dtype = IR_dtype(array.dtype)
+    del tensor.tensor_shape.dim[:]
+    for e in array.shape:
+        tensor.tensor_shape.dim.add().size = e
+    tensor.tensor_content = np.ascontiguousarray(array, dtype = np_dtype_map[tensor.dtype]).tobytes()
+    return tensor
+
+
+def tensor_shape(tensor):
+    return tuple(e.size for e in tensor.tensor_shape.dim)
+
+
+def tensor_to_ndarray(tensor):
+    """Read-only view of the tensor_content of a LiteralTensor, no element-wise copy."""
+    array = np.frombuffer(tensor.tensor_content, dtype = np_dtype_map[tensor.dtype])
+    return array.reshape(tensor_shape(tensor))
+
+
+def has_weight(IR_node, key):
+    return key in IR_node.attr and IR_node.attr[key].HasField("tensor")
+
+
+def get_weight(IR_node, key, store = None):
+    """Weight [key] of IR_node as an ndarray, None if absent.
+
+    Tensors moved to a weight store (see common.IR.weight_store) are resolved
+    through store; without one they are reported as absent. Sparse weights
+    are returned dense.
+    """
+    if not has_weight(IR_node, key):
+        return None
+    if key + SPARSE_FORMAT_SUFFIX in IR_node.attr:
+        from common.IR.sparse import densify_weight
+        return densify_weight(IR_node, key, store)
+    if key + REF_SUFFIX in IR_node.attr:
+        if store is None:
+            return None
+        return store.get(IR_node.attr[key + REF_SUFFIX].s.decode("utf-8"))
+    return tensor_to_ndarray(IR_node.attr[key].tensor)
+
+
+def set_weight(IR_node, key, array):
+    if key + REF_SUFFIX in IR_node.attr:
+        del IR_node.attr[key + REF_SUFFIX]
+    if key + SPARSE_FORMAT_SUFFIX in IR_node.attr:
+        for suffix in (SPARSE_FORMAT_SUFFIX,) + SPARSE_COMPONENT_SUFFIXES:
+            for name in (key + suffix, key + suffix + REF_SUFFIX):
+                if name in IR_node.attr:
+                    del IR_node.attr[name]
+    return ndarray_to_tensor(array, IR_node.attr[key].tensor)
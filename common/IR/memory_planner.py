@@ -0,0 +1,164 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numbers
+from collections import OrderedDict
+import common.IR.graph_pb2 as graph_pb2
+from common.IR.IR_graph import IRGraph
+from common.IR.shape_inference import ShapeInference
+
+
+# bytes per element of each IR DataType
+dtype_size = {
+        graph_pb2.DT_INT8       : 1,
+        graph_pb2.DT_INT16      : 2,
+        graph_pb2.DT_INT32      : 4,
+        graph_pb2.DT_INT64      : 8,
+        graph_pb2.DT_UINT8      : 1,
+        graph_pb2.DT_UINT16     : 2,
+        graph_pb2.DT_UINT32     : 4,
+        graph_pb2.DT_UINT64     : 8,
+        graph_pb2.DT_FLOAT16    : 2,
+        graph_pb2.DT_FLOAT32    : 4,
+        graph_pb2.DT_FLOAT64    : 8,
+        graph_pb2.DT_COMPLEX64  : 8,
+        graph_pb2.DT_COMPLEX128 : 16,
+        graph_pb2.DT_BOOL       : 1,
+        }
+
+
+def tensor_bytes(shape, dtype):
+    """Size in bytes of a fully known shape, None if any dim (or the dtype) is unknown."""
+    if shape is None or not dtype in dtype_size:
+        return None
+    ret = dtype_size[dtype]
+    for e in shape:
+        if not isinstance(e, numbers.Integral):
+            return None
+        ret *= e
+    return ret
+
+
+
+class MemoryPlanner(object):
+    """Assign every intermediate tensor of the IR to an offset of one shared arena.
+
+    The liveness interval of a node's output runs from its position in the
+    execution order to the position of its last consumer (to the end of the
+    order for graph outputs). Tensors are then placed greedily, largest
+    first, at the lowest aligned offset not overlapping any already placed
+    tensor whose interval intersects theirs.
+    """
+
+    def __init__(self, IR_graph, order = None, batch_size = 1, alignment = 64):
+        self.IR_graph = IR_graph
+        if order is None:
+            graph = IRGraph(IR_graph)
+            graph.build()
+            order = graph.topological_sort
+        self.order = list(order)
+        self.batch_size = batch_size
+        self.alignment = alignment
+
+        self.sizes = OrderedDict()
+        self.intervals = OrderedDict()
+        self.offsets = OrderedDict()
+        self.unplanned = list()
+        self.arena_bytes = 0
+
+
+    def plan(self):
+        self._compute_sizes()
+        self.intervals = MemoryPlanner.liveness(self.IR_graph, self.order)
+        self._assign_offsets()
+        return self
+
+
+    def _compute_sizes(self):
+        inference = ShapeInference(self.IR_graph, self.batch_size)
+        for name in self.order:
+            size = tensor_bytes(inference.shape(name), inference.dtype(name))
+            if size is None:
+                self.unplanned.append(name)
+            else:
+                self.sizes[name] = size
+
+
+    @staticmethod
+    def liveness(IR_graph, order):
+        """name -> (first step, last step) of the output of every node in order."""
+        position = dict((name, idx) for idx, name in enumerate(order))
+        last_use = dict((name, idx) for idx, name in enumerate(order))
+        has_consumer = set()
+        for node in IR_graph.node:
+            if not node.name in position:
+                continue
+            for pred in node.input:
+                if pred in position:
+                    has_consumer.add(pred)
+                    last_use[pred] = max(last_use[pred], position[node.name])
+
+        end = len(order) - 1
+        return OrderedDict((name, (position[name], last_use[name] if name in has_consumer else end)) for name in order)
+
+
+    @staticmethod
+    def peak_bytes(intervals, sizes):
+        """Largest total size of the tensors alive at the same step."""
+        delta = [0] * (len(intervals) + 1)
+        for name, (first, last) in intervals.items():
+            if name in sizes:
+                delta[first] += sizes[name]
+                delta[last + 1] -= sizes[name]
+        peak = live = 0
+        for e in delta:
+            live += e
+            peak = max(peak, live)
+        return peak
+
+
+    def _aligned(self, value):
+        return -(-value // self.alignment) * self.alignment
+
+
+    def _assign_offsets(self):
+        placed = list()
+        for name in sorted(self.sizes, key = lambda e: (-self.sizes[e], self.intervals[e][0])):
+            first, last = self.intervals[name]
+            size = self.sizes[name]
+            conflicts = sorted((offset, end) for offset, end, a, b in placed if a <= last and first <= b)
+
+            offset = 0
+            for begin, end in conflicts:
+                if offset + size <= begin:
+                    break
+                offset = max(offset, self._aligned(end))
+
+            self.offsets[name] = offset
+            placed.append((offset, offset + size, first, last))
+            self.arena_bytes = max(self.arena_bytes, offset + size)
+
+
+    def report(self):
+        return OrderedDict([
+                ("batch_size", self.batch_size),
+                ("tensors", len(self.sizes)),
+                ("unplanned_tensors", len(self.unplanned)),
+                ("naive_bytes", sum(self.sizes.values())),
+                ("peak_live_bytes", MemoryPlanner.peak_bytes(self.intervals, self.sizes)),
+                ("arena_bytes", self.arena_bytes),
+                ])
+
+
+    def write_back(self):
+        """Store buffer_offset/buffer_size attrs on every planned node; returns True if any changed."""
+        changed = False
+        for node in self.IR_graph.node:
+            if not node.name in self.offsets:
+                continue
+            if node.attr["buffer_offset"].i != self.offsets[node.name] or node.attr["buffer_size"].i != self.sizes[node.name]:
+                changed = True
+            node.attr["buffer_offset"].i = self.offsets[node.name]
+            node.attr["buffer_size"].i = self.sizes[node.name]
+        return changed
@@ -0,0 +1,16 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from common.IR.passes.pass_manager import IRPass, PassManager, STANDARD_PIPELINE
+from common.IR.passes.pass_manager import register_pass, get_pass, registered_passes
+
+# import the passes so they get registered
+import common.IR.passes.simplify
+import common.IR.passes.fold_batchnorm
+import common.IR.passes.fuse_activation
+import common.IR.passes.infer_shapes
+import common.IR.passes.plan_memory
+import common.IR.passes.schedule_memory
+import common.IR.passes.quantize
+import common.IR.passes.sparsify
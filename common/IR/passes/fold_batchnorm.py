@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from common.IR.IR_tensor import get_weight, set_weight
+from common.IR.passes.pass_manager import IRPass, register_pass
+
+
+@register_pass
+class FoldBatchNorm(IRPass):
+    """Fold an inference BatchNorm into the Conv*/Fully_connected node feeding it.
+
+    With s = gamma / sqrt(var + epsilon), the producer's kernel is scaled by s
+    along its output-channel (last) axis and its bias becomes
+    (bias - mean) * s + beta, then the BatchNorm node is removed.
+    Only BatchNorms normalizing the producer's channel axis, whose producer
+    has no other consumer and carries its kernel, are folded.
+    """
+
+    name = "fold_batchnorm"
+    after = ("eliminate_dropout",)
+
+    foldable_ops = ("Conv1D", "Conv2D", "Conv3D", "Fully_connected")
+
+    def run(self, IR_graph):
+        graph = self.IR_graph_view(IR_graph)
+        folded = 0
+
+        for bn in list(IR_graph.node):
+            if bn.op != "BatchNorm" or len(bn.input) != 1:
+                continue
+            producer_node = graph.layer_map.get(bn.input[0])
+            if producer_node is None or not producer_node.type in self.foldable_ops:
+                continue
+            producer = producer_node.IR_layer
+            if len(producer_node.out_edges) != 1 or "fused_activation" in producer.attr:
+                continue
+            if not FoldBatchNorm._is_channel_axis(producer, bn.attr["axis"].i):
+                continue
+            if FoldBatchNorm._fold(producer, bn):
+                graph.remove_IR_node(bn.name)
+                folded += 1
+
+        graph.compact()
+        return folded > 0
+
+
+    @staticmethod
+    def _is_channel_axis(producer, axis):
+        if producer.op == "Fully_connected":
+            rank = 2
+        else:
+            rank = len(producer.attr["strides"].list.i) + 2
+
+        if "data_format" in producer.attr and producer.attr["data_format"].s.startswith(b"NC"):
+            return axis == 1
+        return axis == -1 or axis == rank - 1
+
+
+    @staticmethod
+    def _fold(producer, bn):
+        kernel = get_weight(producer, "kernel")
+        mean = get_weight(bn, "mean")
+        var = get_weight(bn, "var")
+        if kernel is None or mean is None or var is None:
+            return False
+        if kernel.dtype.kind != "f" or "kernel_scale" in producer.attr:
+            # quantized kernel
+            return False
+
+        epsilon = bn.attr["epsilon"].f if "epsilon" in bn.attr else 1e-3
+        gamma = get_weight(bn, "gamma")
+        beta = get_weight(bn, "beta")
+        bias = get_weight(producer, "bias")
+
+        scale = 1.0 / np.sqrt(var.astype(np.float64) + epsilon)
+        if gamma is not None:
+            scale = scale * gamma
+        new_bias = -mean * scale
+        if bias is not None:
+            new_bias = new_bias + bias * scale
+        if beta is not None:
+            new_bias = new_bias + beta
+
+        set_weight(producer, "kernel", (kernel * scale).astype(kernel.dtype))
+        set_weight(producer, "bias", new_bias.astype(kernel.dtype))
+        producer.attr["use_bias"].b = True
+        if "fused_activation" in bn.attr:
+            producer.attr["fused_activation"].s = bn.attr["fused_activation"].s
+        return True
@@ -0,0 +1,42 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from common.IR.passes.pass_manager import IRPass, register_pass
+
+
+@register_pass
+class FuseActivation(IRPass):
+    """Fold elementwise activation nodes into the node producing their input.
+
+    This undoes the parsers' activation defusing: a Relu/Sigmoid/Tanh node
+    whose input is a Conv*/Fully_connected/BatchNorm node with no other
+    consumer is removed, and its op is recorded in the producer's
+    fused_activation attr. Softmax is not elementwise, its axis would be lost
+    in the attr, so it stays a node of its own.
+    """
+
+    name = "fuse_activation"
+    after = ("fold_batchnorm",)
+
+    activation_ops = ("Relu", "Sigmoid", "Tanh")
+    fusable_ops = ("Conv1D", "Conv2D", "Conv3D", "Fully_connected", "BatchNorm")
+
+    def run(self, IR_graph):
+        graph = self.IR_graph_view(IR_graph)
+        fused = 0
+
+        for act in list(IR_graph.node):
+            if not act.op in self.activation_ops or len(act.input) != 1:
+                continue
+            producer = graph.layer_map.get(act.input[0])
+            if producer is None or not producer.type in self.fusable_ops:
+                continue
+            if "fused_activation" in producer.IR_layer.attr or len(producer.out_edges) != 1:
+                continue
+            producer.IR_layer.attr["fused_activation"].s = act.op.encode()
+            graph.remove_IR_node(act.name)
+            fused += 1
+
+        graph.compact()
+        return fused > 0
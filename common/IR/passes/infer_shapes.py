@@ -0,0 +1,20 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from common.IR.shape_inference import ShapeInference
+from common.IR.passes.pass_manager import IRPass, register_pass
+
+
+@register_pass
+class InferShapes(IRPass):
+    """Annotate every node with its inferred output_shape (symbolic batch) and dtype."""
+
+    name = "infer_shapes"
+    # the shapes are stale once a rewriting pass changes the graph
+    after = ("eliminate_dropout", "fold_batchnorm", "fuse_activation")
+
+    def run(self, IR_graph):
+        inference = ShapeInference(IR_graph)
+        inference.infer_all()
+        return inference.write_back()
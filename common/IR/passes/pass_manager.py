@@ -0,0 +1,200 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+from collections import OrderedDict
+
+
+_PASS_REGISTRY = OrderedDict()
+
+# Passes run by "--passes standard", completed with their requirements.
+STANDARD_PIPELINE = [
+        "eliminate_dropout",
+        "fold_batchnorm",
+        "fuse_activation",
+        ]
+
+
+def register_pass(pass_class):
+    """Class decorator adding an IRPass subclass to the registry under its name."""
+    if pass_class.name in _PASS_REGISTRY:
+        raise ValueError("IR pass [%s] is registered twice." % pass_class.name)
+    _PASS_REGISTRY[pass_class.name] = pass_class
+    return pass_class
+
+
+def get_pass(name):
+    if not name in _PASS_REGISTRY:
+        raise KeyError("IR pass [%s] is not registered. Available passes: %s." % (name, ", ".join(_PASS_REGISTRY)))
+    return _PASS_REGISTRY[name]
+
+
+def registered_passes():
+    return list(_PASS_REGISTRY)
+
+
+
+class IRPass(object):
+    """Base class of the optimization passes over an IR GraphDef.
+
+    Subclasses set name and implement run(IR_graph), which rewrites the
+    GraphDef in place and returns True if anything changed. requires names
+    passes that must run first and are added to the pipeline if missing;
+    after names passes that must run first only when they are requested too.
+
+    Passes adding or removing nodes do it through IR_graph_view, an
+    IRGraph over the GraphDef updated incrementally, and call its compact()
+    before returning. A PassManager shares one view between its passes, so
+    the graph is built once per pipeline rather than once per pass.
+    """
+
+    name = None
+    requires = ()
+    after = ()
+    options = ()
+
+    # IRGraph set by PassManager, built on first use otherwise
+    graph = None
+
+    def run(self, IR_graph):
+        raise NotImplementedError()
+
+
+    def IR_graph_view(self, IR_graph):
+        if self.graph is None or self.graph.model is not IR_graph:
+            from common.IR.IR_graph import IRGraph
+            self.graph = IRGraph(IR_graph)
+            self.graph.build()
+        return self.graph
+
+
+
+class PassManager(object):
+    """Run a set of registered passes over an IR GraphDef.
+
+    Requested passes are completed with their requirements, which are listed
+    in self.pulled_in, and ordered so every pass runs after the passes it
+    requires or is declared to run after. With fixed_point, the whole
+    pipeline is repeated until no pass reports a change (or max_iterations is
+    reached). Every pass execution is recorded in self.report as a dict with
+    its wall time and node-count delta. With trace_memory, the peak Python
+    memory is recorded as well; tracemalloc slows the passes down, so the
+    times of such a run are not comparable with an untraced one.
+    options (a dict) sets the attributes the passes declare in their options.
+    """
+
+    def __init__(self, pass_names, fixed_point = False, max_iterations = 10, trace_memory = False, options = None):
+        # "standard" expands in place, the passes listed after it run after it
+        expanded = list()
+        for name in pass_names:
+            expanded.extend(STANDARD_PIPELINE if name == "standard" else [name])
+        pass_names = expanded
+        order = PassManager._resolve_order(pass_names)
+        self.passes = [get_pass(name)() for name in order]
+        for ir_pass in self.passes:
+            for key in ir_pass.options:
+                if options and key in options:
+                    setattr(ir_pass, key, options[key])
+        self.pulled_in = [name for name in order if not name in pass_names]
+        self.fixed_point = fixed_point
+        self.max_iterations = max_iterations if fixed_point else 1
+        self.trace_memory = trace_memory
+        self.report = list()
+
+
+    @staticmethod
+    def _resolve_order(pass_names):
+        selected = set()
+        pending = list(pass_names)
+        while pending:
+            name = pending.pop()
+            if not name in selected:
+                selected.add(name)
+                pending.extend(get_pass(name).requires)
+
+        order = list()
+        visiting = set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError("IR pass [%s] has a cyclic dependency." % name)
+            visiting.add(name)
+            pass_class = get_pass(name)
+            for dep in pass_class.requires:
+                visit(dep)
+            for dep in pass_class.after:
+                if dep in selected:
+                    visit(dep)
+            visiting.remove(name)
+            order.append(name)
+
+        for name in pass_names:
+            visit(name)
+        return order
+
+
+    def run(self, IR_graph):
+        from common.IR.IR_graph import IRGraph
+        graph = IRGraph(IR_graph)
+        graph.build()
+        for ir_pass in self.passes:
+            ir_pass.graph = graph
+
+        for iteration in range(self.max_iterations):
+            changed = False
+            for ir_pass in self.passes:
+                changed = self._run_pass(ir_pass, IR_graph, iteration) or changed
+            if not changed:
+                break
+        return self.report
+
+
+    def _run_pass(self, ir_pass, IR_graph, iteration):
+        tracemalloc = None
+        if self.trace_memory:
+            try:
+                import tracemalloc
+            except ImportError:
+                pass
+
+        own_trace = tracemalloc is not None and not tracemalloc.is_tracing()
+        if own_trace:
+            tracemalloc.start()
+
+        nodes_before = len(IR_graph.node)
+        start = time.time()
+        changed = bool(ir_pass.run(IR_graph))
+        elapsed = time.time() - start
+
+        peak_memory = None
+        if own_trace:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        self.report.append(OrderedDict([
+                ("pass", ir_pass.name),
+                ("iteration", iteration),
+                ("changed", changed),
+                ("time", elapsed),
+                ("nodes_before", nodes_before),
+                ("nodes_after", len(IR_graph.node)),
+                ("node_delta", len(IR_graph.node) - nodes_before),
+                ("peak_memory", peak_memory),
+                ]))
+        return changed
+
+
+    def print_report(self):
+        if self.pulled_in:
+            print ("Passes added as requirements: {}".format(", ".join(self.pulled_in)))
+        print ("{:<24} {:>4} {:>10} {:>8} {:>14}".format("pass", "iter", "time(ms)", "nodes", "peak mem(KB)"))
+        for e in self.report:
+            print ("{:<24} {:>4} {:>10.2f} {:>+8d} {:>14}".format(
+                e["pass"],
+                e["iteration"],
+                e["time"] * 1000,
+                e["node_delta"],
+                "-" if e["peak_memory"] is None else e["peak_memory"] // 1024))
@@ -0,0 +1,34 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from common.IR.memory_planner import MemoryPlanner
+from common.IR.passes.pass_manager import IRPass, register_pass
+
+
+@register_pass
+class PlanMemory(IRPass):
+    """Assign activation buffers of one shared arena (buffer_offset/buffer_size attrs).
+
+    Nodes are assumed to execute in GraphDef order, request schedule_memory
+    too to plan for the memory-minimizing order. The batch dimension is
+    sized by batch_size, set from the PassManager options.
+    """
+
+    name = "plan_memory"
+    # plans the final graph, in its scheduled order
+    after = ("eliminate_dropout", "fold_batchnorm", "fuse_activation", "schedule_memory")
+    options = ("batch_size",)
+    batch_size = 1
+
+    def run(self, IR_graph):
+        order = [node.name for node in IR_graph.node]
+        planner = MemoryPlanner(IR_graph, order, batch_size = self.batch_size).plan()
+        report = planner.report()
+        print ("Activation memory (batch {}): naive {} bytes, peak live {} bytes, arena {} bytes, {} tensors not planned.".format(
+            report["batch_size"],
+            report["naive_bytes"],
+            report["peak_live_bytes"],
+            report["arena_bytes"],
+            report["unplanned_tensors"]))
+        return planner.write_back()
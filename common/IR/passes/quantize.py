@@ -0,0 +1,64 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from common.IR.quantization import WeightQuantizer
+from common.IR.passes.pass_manager import IRPass, register_pass
+
+
+class QuantizeWeights(IRPass):
+    """Post-training weight quantization, see common.IR.quantization.WeightQuantizer.
+
+    Runs after fold_batchnorm, when both are requested, so the folded
+    kernels are quantized once.
+    Already quantized weights are left as they are, so the passes are
+    idempotent.
+    """
+
+    after = ("fold_batchnorm",)
+    mode = None
+    per_channel = True
+
+    def run(self, IR_graph):
+        quantizer = WeightQuantizer(self.mode, self.per_channel)
+        changed = quantizer.run(IR_graph)
+        if changed:
+            quantizer.print_report()
+        return changed
+
+
+
+@register_pass
+class QuantizeFP16(QuantizeWeights):
+    name = "quantize_fp16"
+    mode = "fp16"
+
+
+
+@register_pass
+class QuantizeInt8(QuantizeWeights):
+    name = "quantize_int8"
+    mode = "int8"
+
+
+
+@register_pass
+class QuantizeInt8PerTensor(QuantizeWeights):
+    name = "quantize_int8_per_tensor"
+    mode = "int8"
+    per_channel = False
+
+
+
+@register_pass
+class QuantizeUInt8(QuantizeWeights):
+    name = "quantize_uint8"
+    mode = "uint8"
+
+
+
+@register_pass
+class QuantizeUInt8PerTensor(QuantizeWeights):
+    name = "quantize_uint8_per_tensor"
+    mode = "uint8"
+    per_channel = False
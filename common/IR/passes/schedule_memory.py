@@ -0,0 +1,31 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from common.IR.scheduler import MemoryScheduler
+from common.IR.passes.pass_manager import IRPass, register_pass
+
+
+@register_pass
+class ScheduleMemory(IRPass):
+    """Reorder GraphDef.node into the memory-minimizing execution order.
+
+    The batch dimension is sized by batch_size, set from the PassManager
+    options.
+    """
+
+    name = "schedule_memory"
+    # orders the graph the rewriting passes leave
+    after = ("eliminate_dropout", "fold_batchnorm", "fuse_activation")
+    options = ("batch_size",)
+    batch_size = 1
+
+    def run(self, IR_graph):
+        scheduler = MemoryScheduler(IR_graph, batch_size = self.batch_size)
+        scheduler.schedule()
+        report = scheduler.report()
+        print ("Peak activation memory (batch {}): BFS order {} bytes, scheduled order {} bytes.".format(
+            report["batch_size"],
+            report["bfs_peak_bytes"],
+            report["scheduled_peak_bytes"]))
+        return scheduler.apply()
@@ -0,0 +1,20 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from common.IR.passes.pass_manager import IRPass, register_pass
+
+
+@register_pass
+class EliminateDropout(IRPass):
+    """Dropout is the identity at inference time, remove it."""
+
+    name = "eliminate_dropout"
+
+    def run(self, IR_graph):
+        graph = self.IR_graph_view(IR_graph)
+        dropouts = [node.name for node in IR_graph.node if node.op == "Dropout"]
+        for name in dropouts:
+            graph.remove_IR_node(name)
+        graph.compact()
+        return len(dropouts) > 0
@@ -0,0 +1,40 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from common.IR.sparse import WeightSparsifier
+from common.IR.passes.pass_manager import IRPass, register_pass
+
+
+class SparsifyWeights(IRPass):
+    """Encode pruned weights sparse, see common.IR.sparse.WeightSparsifier.
+
+    Runs after fold_batchnorm, when both are requested, since it rewrites
+    kernels densely.
+    """
+
+    after = ("fold_batchnorm",)
+    sparse_format = None
+    min_sparsity = 0.7
+    block_shape = (4, 4)
+
+    def run(self, IR_graph):
+        sparsifier = WeightSparsifier(self.sparse_format, self.min_sparsity, self.block_shape)
+        changed = sparsifier.run(IR_graph)
+        if changed:
+            sparsifier.print_report()
+        return changed
+
+
+
+@register_pass
+class SparsifyCSR(SparsifyWeights):
+    name = "sparsify_csr"
+    sparse_format = "csr"
+
+
+
+@register_pass
+class SparsifyBSR(SparsifyWeights):
+    name = "sparsify_bsr"
+    sparse_format = "bsr"
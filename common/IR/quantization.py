@@ -0,0 +1,193 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from collections import OrderedDict
+import common.IR.graph_pb2 as graph_pb2
+from common.IR.IR_tensor import get_weight, set_weight
+
+
+# attrs stored next to a quantized weight [key]
+SCALE_SUFFIX = "_scale"
+ZERO_POINT_SUFFIX = "_zero_point"
+AXIS_SUFFIX = "_quant_axis"
+
+# weights quantized to 8 bits; biases and normalization statistics stay float
+int8_keys = ("kernel", "recurrent_kernel", "embeddings")
+
+float_dtypes = (graph_pb2.DT_FLOAT32, graph_pb2.DT_FLOAT64)
+
+
+def _reduce_axes(array, axis):
+    if axis is None:
+        return None
+    axis = axis % array.ndim
+    return tuple(e for e in range(array.ndim) if e != axis)
+
+
+def _broadcast(values, array, axis):
+    # per-channel values shaped to broadcast against array along axis
+    if axis is None:
+        return values
+    shape = [1] * array.ndim
+    shape[axis % array.ndim] = -1
+    return values.reshape(shape)
+
+
+def quantize_fp16(array):
+    return np.asarray(array).astype(np.float16)
+
+
+def quantize_int8(array, axis = None, symmetric = True):
+    """Linear 8-bit quantization of array, per tensor (axis None) or per channel along axis.
+
+    Symmetric quantization maps [-max|x|, max|x|] to int8 [-127, 127] with a
+    zero point of 0; asymmetric maps [min(x, 0), max(x, 0)] to uint8
+    [0, 255]. Returns (quantized, scale, zero_point), x ~ (q - zero_point) * scale.
+    """
+    x = np.asarray(array, dtype = np.float32)
+    reduce_axes = _reduce_axes(x, axis)
+
+    if symmetric:
+        scale = np.max(np.abs(x), axis = reduce_axes) / 127.0
+        scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+        zero_point = np.zeros(scale.shape, dtype = np.int8)
+        q = np.clip(np.rint(x / _broadcast(scale, x, axis)), -127, 127).astype(np.int8)
+    else:
+        low = np.minimum(np.min(x, axis = reduce_axes), 0)
+        high = np.maximum(np.max(x, axis = reduce_axes), 0)
+        scale = (high - low) / 255.0
+        scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+        zero_point = np.clip(np.rint(-low / scale), 0, 255).astype(np.uint8)
+        q = np.rint(x / _broadcast(scale, x, axis)) + _broadcast(zero_point, x, axis)
+        q = np.clip(q, 0, 255).astype(np.uint8)
+    return q, scale, zero_point
+
+
+def dequantize(q, scale, zero_point, axis = None):
+    q = np.asarray(q, dtype = np.float32)
+    zero_point = np.asarray(zero_point, dtype = np.float32)
+    scale = np.asarray(scale, dtype = np.float32)
+    return (q - _broadcast(zero_point, q, axis)) * _broadcast(scale, q, axis)
+
+
+def quantization_error(original, restored):
+    """(max absolute error, max absolute error relative to max |original|)."""
+    original = np.asarray(original, dtype = np.float64)
+    max_abs = float(np.max(np.abs(original - restored))) if original.size else 0.0
+    magnitude = float(np.max(np.abs(original))) if original.size else 0.0
+    return max_abs, (max_abs / magnitude if magnitude > 0 else 0.0)
+
+
+def is_quantized(IR_node, key):
+    return key + SCALE_SUFFIX in IR_node.attr
+
+
+def dequantize_weight(IR_node, key, store = None):
+    """Weight [key] of IR_node as float32, undoing an 8-bit quantization if any."""
+    array = get_weight(IR_node, key, store)
+    if array is None or not is_quantized(IR_node, key):
+        return None if array is None else array.astype(np.float32)
+    axis = IR_node.attr[key + AXIS_SUFFIX].i if key + AXIS_SUFFIX in IR_node.attr else None
+    return dequantize(array,
+            get_weight(IR_node, key + SCALE_SUFFIX, store),
+            get_weight(IR_node, key + ZERO_POINT_SUFFIX, store),
+            axis)
+
+
+
+class WeightQuantizer(object):
+    """Quantize the weights of every node of an IR GraphDef in place.
+
+    mode "fp16" casts every float32/float64 weight to float16. Modes "int8"
+    (symmetric) and "uint8" (asymmetric) quantize the int8_keys weights,
+    per channel along their last (output channel) axis or per tensor, and
+    store the scale and zero point in the key + SCALE_SUFFIX and
+    key + ZERO_POINT_SUFFIX attrs (the axis in key + AXIS_SUFFIX).
+    Every quantized tensor is recorded in self.report with its size before
+    and after and its quantization error.
+    """
+
+    modes = ("fp16", "int8", "uint8")
+
+    def __init__(self, mode, per_channel = True):
+        if not mode in self.modes:
+            raise ValueError("Unknown quantization mode [%s], use one of %s." % (mode, ", ".join(self.modes)))
+        self.mode = mode
+        self.per_channel = per_channel
+        self.report = list()
+
+
+    def _candidate_keys(self, IR_node):
+        for key in IR_node.attr:
+            attr = IR_node.attr[key]
+            if not attr.HasField("tensor") or not attr.tensor.dtype in float_dtypes:
+                continue
+            if len(attr.tensor.tensor_content) == 0:
+                # empty or kept in a weight store
+                continue
+            if key.endswith(SCALE_SUFFIX) or key.endswith(ZERO_POINT_SUFFIX):
+                continue
+            if self.mode == "fp16" or key in int8_keys:
+                yield key
+
+
+    def run(self, IR_graph):
+        for node in IR_graph.node:
+            for key in sorted(self._candidate_keys(node)):
+                self._quantize(node, key)
+        return len(self.report) > 0
+
+
+    def _quantize(self, IR_node, key):
+        original = get_weight(IR_node, key)
+        if self.mode == "fp16":
+            quantized = quantize_fp16(original)
+            restored = quantized
+            bytes_after = quantized.nbytes
+            set_weight(IR_node, key, quantized)
+        else:
+            axis = -1 if self.per_channel and original.ndim > 0 else None
+            quantized, scale, zero_point = quantize_int8(original, axis, self.mode == "int8")
+            restored = dequantize(quantized, scale, zero_point, axis)
+            bytes_after = quantized.nbytes + scale.nbytes + zero_point.nbytes
+            set_weight(IR_node, key, quantized)
+            set_weight(IR_node, key + SCALE_SUFFIX, scale)
+            set_weight(IR_node, key + ZERO_POINT_SUFFIX, zero_point)
+            if axis is not None:
+                IR_node.attr[key + AXIS_SUFFIX].i = axis
+
+        max_abs, max_rel = quantization_error(original, restored)
+        self.report.append(OrderedDict([
+                ("node", IR_node.name),
+                ("key", key),
+                ("mode", self.mode),
+                ("bytes_before", original.nbytes),
+                ("bytes_after", bytes_after),
+                ("max_abs_error", max_abs),
+                ("max_rel_error", max_rel),
+                ]))
+
+
+    def summary(self):
+        before = sum(e["bytes_before"] for e in self.report)
+        after = sum(e["bytes_after"] for e in self.report)
+        return OrderedDict([
+                ("mode", self.mode),
+                ("per_channel", self.per_channel),
+                ("tensors", len(self.report)),
+                ("bytes_before", before),
+                ("bytes_after", after),
+                ("ratio", after / before if before else 1.0),
+                ])
+
+
+    def print_report(self):
+        print ("{:<32} {:<18} {:>12} {:>12} {:>12} {:>12}".format("node", "weight", "bytes", "quantized", "max abs err", "max rel err"))
+        for e in self.report:
+            print ("{:<32} {:<18} {:>12} {:>12} {:>12.3e} {:>12.3e}".format(
+                e["node"], e["key"], e["bytes_before"], e["bytes_after"], e["max_abs_error"], e["max_rel_error"]))
+        summary = self.summary()
+        print ("Quantized {} tensors to {}: {} bytes -> {} bytes ({:.1%}).".format(
+            summary["tensors"], summary["mode"], summary["bytes_before"], summary["bytes_after"], summary["ratio"]))
@@ -0,0 +1,98 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+from common.IR.IR_graph import IRGraph
+from common.IR.IR_csr_graph import IRCSRGraph
+from common.IR.memory_planner import MemoryPlanner, tensor_bytes
+from common.IR.shape_inference import ShapeInference
+
+
+class MemoryScheduler(object):
+    """Choose a topological order of the IR that keeps live activation memory low.
+
+    Greedy list scheduling: among the nodes whose inputs are all computed,
+    run the one whose execution grows live memory the least, i.e. its output
+    size minus the inputs it is the last consumer of. Ties go to the node
+    that became ready last, which keeps working down the current branch,
+    then to the GraphDef order. On branchy graphs this finishes a branch before opening
+    the next one instead of keeping every branch alive as BFS does.
+    The graph is walked by node id over its IRCSRGraph adjacency.
+    """
+
+    def __init__(self, IR_graph, batch_size = 1):
+        self.IR_graph = IR_graph
+        self.batch_size = batch_size
+        self.sizes = dict()
+        self.order = list()
+
+
+    def schedule(self):
+        inference = ShapeInference(self.IR_graph, self.batch_size)
+        # integer ids and deduplicated CSR adjacency, in GraphDef order
+        graph = IRCSRGraph(self.IR_graph)
+        graph.build()
+        names = graph.names
+        sizes = list()
+        for name in names:
+            self.sizes[name] = tensor_bytes(inference.shape(name), inference.dtype(name)) or 0
+            sizes.append(self.sizes[name])
+        preds = [graph.predecessors(idx).tolist() for idx in range(len(names))]
+        consumers = [graph.successors(idx).tolist() for idx in range(len(names))]
+
+        remaining = graph.out_degree().tolist()
+        waiting = graph.in_degree().tolist()
+        ready = dict((idx, 0) for idx, count in enumerate(waiting) if count == 0)
+
+        def growth(idx):
+            freed = sum(sizes[p] for p in preds[idx] if remaining[p] == 1)
+            return (sizes[idx] - freed, -ready[idx], idx)
+
+        order = list()
+        while ready:
+            idx = min(ready, key = growth)
+            del ready[idx]
+            order.append(idx)
+            for pred in preds[idx]:
+                remaining[pred] -= 1
+            for succ in consumers[idx]:
+                waiting[succ] -= 1
+                if waiting[succ] == 0:
+                    ready[succ] = len(order)
+
+        if len(order) != len(names):
+            raise ValueError("IR graph has a cycle, it cannot be scheduled.")
+        self.order = [names[idx] for idx in order]
+        return self.order
+
+
+
+    def report(self, baseline_order = None):
+        """Peak live activation bytes of the baseline (IRGraph BFS) order and of the scheduled order."""
+        if not self.order:
+            self.schedule()
+        if baseline_order is None:
+            graph = IRGraph(self.IR_graph)
+            graph.build()
+            baseline_order = graph.topological_sort
+
+        baseline = MemoryPlanner.peak_bytes(MemoryPlanner.liveness(self.IR_graph, baseline_order), self.sizes)
+        scheduled = MemoryPlanner.peak_bytes(MemoryPlanner.liveness(self.IR_graph, self.order), self.sizes)
+        return OrderedDict([
+                ("batch_size", self.batch_size),
+                ("bfs_peak_bytes", baseline),
+                ("scheduled_peak_bytes", scheduled),
+                ])
+
+
+    def apply(self):
+        """Reorder IR_graph.node to the scheduled order; returns True if the order changed."""
+        if not self.order:
+            self.schedule()
+        if [node.name for node in self.IR_graph.node] == self.order:
+            return False
+        # sorted in place: the NodeDefs stay the messages IRGraph views point at
+        position = dict((name, idx) for idx, name in enumerate(self.order))
+        self.IR_graph.node.sort(key = lambda node: position[node.name])
+        return True
@@ -0,0 +1,325 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numbers
+import common.IR.graph_pb2 as graph_pb2
+
+
+# Name of the symbolic batch dimension, stored as TensorShape.Dim(size = -1, name = BATCH).
+BATCH = "batch"
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _is_known(dim):
+    return isinstance(dim, numbers.Integral) and not isinstance(dim, bool)
+
+
+def _product(dims):
+    ret = 1
+    for e in dims:
+        if not _is_known(e):
+            return None
+        ret *= e
+    return ret
+
+
+
+class ShapeInference(object):
+    """Static shape and dtype inference over an IR GraphDef.
+
+    A shape is a tuple whose entries are ints, None (unknown size) or the
+    BATCH symbol; an unknown rank is None. Results are memoized per node, so
+    every node is inferred once whatever the number of queries.
+    With batch_size None the batch dimension stays symbolic, otherwise it is
+    replaced by batch_size.
+    """
+
+    shape_functions = {
+            "DataInput"       : "_infer_DataInput",
+            "Conv1D"          : "_infer_convolution",
+            "Conv2D"          : "_infer_convolution",
+            "Conv3D"          : "_infer_convolution",
+            "MaxPool2D"       : "_infer_pooling",
+            "AvgPool2D"       : "_infer_pooling",
+            "GlobalMaxPool1D" : "_infer_global_pooling",
+            "GlobalAvgPool2D" : "_infer_global_pooling",
+            "Fully_connected" : "_infer_Fully_connected",
+            "Flatten"         : "_infer_Flatten",
+            "Reshape"         : "_infer_Reshape",
+            "pad"             : "_infer_pad",
+            "Concat"          : "_infer_Concat",
+            "Add"             : "_infer_identity",
+            "Embedding"       : "_infer_Embedding",
+            "LSTM"            : "_infer_recurrent",
+            "GRU"             : "_infer_recurrent",
+            "Keras Lambda"    : "_infer_Lambda",
+            "Dropout"         : "_infer_identity",
+            "BatchNorm"       : "_infer_identity",
+            "Relu"            : "_infer_identity",
+            "Sigmoid"         : "_infer_identity",
+            "Tanh"            : "_infer_identity",
+            "Softmax"         : "_infer_identity",
+            "LRN"             : "_infer_identity",
+            "Scale"           : "_infer_identity",
+            "Eltwise"         : "_infer_identity",
+            }
+
+    def __init__(self, IR_graph, batch_size = None):
+        self.IR_graph = IR_graph
+        self.nodes = dict((node.name, node) for node in IR_graph.node)
+        self.batch = BATCH if batch_size is None else batch_size
+        self._shapes = dict()
+        self._dtypes = dict()
+
+
+    def shape(self, name):
+        self._infer_upto(name)
+        return self._shapes[name]
+
+
+    def dtype(self, name):
+        self._infer_upto(name)
+        return self._dtypes[name]
+
+
+    def infer_all(self):
+        for node in self.IR_graph.node:
+            self._infer_upto(node.name)
+        return self._shapes
+
+
+    def _infer_upto(self, name):
+        # iterative post-order, deep graphs must not hit the recursion limit
+        stack = [name]
+        while stack:
+            current = stack[-1]
+            if current in self._shapes:
+                stack.pop()
+                continue
+            node = self.nodes[current]
+            pending = [e for e in node.input if e in self.nodes and not e in self._shapes]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            self._infer_node(node)
+
+
+    def _infer_node(self, node):
+        inputs = [self._shapes.get(e) for e in node.input]
+        func = self.shape_functions.get(node.op)
+        shape = None
+        if func is not None:
+            try:
+                shape = getattr(self, func)(node, inputs)
+            except (IndexError, TypeError, ValueError):
+                shape = None
+        self._shapes[node.name] = None if shape is None else tuple(shape)
+
+        if "dtype" in node.attr and node.attr["dtype"].type != graph_pb2.DT_UNDEFINED:
+            dtype = node.attr["dtype"].type
+        elif node.op == "Embedding":
+            dtype = graph_pb2.DT_FLOAT32
+        elif len(node.input) > 0 and node.input[0] in self._dtypes:
+            dtype = self._dtypes[node.input[0]]
+        else:
+            dtype = graph_pb2.DT_UNDEFINED
+        self._dtypes[node.name] = dtype
+
+
+    def write_back(self):
+        """Store every inferred shape as the output_shape attr (and dtype if missing).
+
+        Returns True if any attr changed.
+        """
+        changed = False
+        for node in self.IR_graph.node:
+            new_shape = graph_pb2.TensorShape()
+            ShapeInference.to_proto(self.shape(node.name), new_shape)
+            if node.attr["output_shape"].shape != new_shape:
+                node.attr["output_shape"].shape.CopyFrom(new_shape)
+                changed = True
+            if not "dtype" in node.attr and self._dtypes[node.name] != graph_pb2.DT_UNDEFINED:
+                node.attr["dtype"].type = self._dtypes[node.name]
+                changed = True
+        return changed
+
+
+    @staticmethod
+    def to_proto(shape, tensor_shape):
+        if shape is None:
+            tensor_shape.unknown_rank = True
+            return tensor_shape
+        for e in shape:
+            dim = tensor_shape.dim.add()
+            if _is_known(e):
+                dim.size = e
+            else:
+                dim.size = -1
+                if e is not None:
+                    dim.name = e
+        return tensor_shape
+
+
+    def from_proto(self, tensor_shape):
+        if tensor_shape.unknown_rank:
+            return None
+        shape = list()
+        for idx, e in enumerate(tensor_shape.dim):
+            if e.size >= 0:
+                shape.append(e.size)
+            elif idx == 0 or e.name == BATCH:
+                shape.append(self.batch)
+            else:
+                shape.append(None)
+        return shape
+
+
+    @staticmethod
+    def _channels_first(node):
+        return "data_format" in node.attr and node.attr["data_format"].s.startswith(b"NC")
+
+
+    @staticmethod
+    def _spatial_axes(node, rank):
+        if ShapeInference._channels_first(node):
+            return list(range(2, rank))
+        return list(range(1, rank - 1))
+
+
+    @staticmethod
+    def _window(size, kernel, stride, padding, pads = (0, 0), ceil_mode = False):
+        if not _is_known(size):
+            return None
+        if padding == b"SAME":
+            return _ceil_div(size, stride)
+        padded = size + pads[0] + pads[1]
+        if not ceil_mode:
+            return (padded - kernel) // stride + 1
+        ret = _ceil_div(padded - kernel, stride) + 1
+        # caffe: the last window starts inside the input or the leading padding
+        if pads[0] > 0 and (ret - 1) * stride >= size + pads[0]:
+            ret -= 1
+        return ret
+
+
+    @staticmethod
+    def _pads(node, dim):
+        if node.attr["padding"].s != b"EXPLICIT":
+            return [(0, 0)] * dim
+        pads = list(node.attr["pads"].list.i)
+        return [(pads[2 * i], pads[2 * i + 1]) for i in range(dim)]
+
+
+    def _infer_identity(self, node, inputs):
+        return inputs[0]
+
+
+    def _infer_DataInput(self, node, inputs):
+        if not "shape" in node.attr:
+            return None
+        return self.from_proto(node.attr["shape"].shape)
+
+
+    def _infer_convolution(self, node, inputs):
+        x = inputs[0]
+        strides = list(node.attr["strides"].list.i)
+        dim = len(strides)
+        kernel = list(node.attr["filter"].list.i)[:dim]
+        if "dilations" in node.attr:
+            kernel = [(k - 1) * d + 1 for k, d in zip(kernel, node.attr["dilations"].list.i)]
+        filters = node.attr["filter"].list.i[-1]
+        padding = node.attr["padding"].s
+        pads = ShapeInference._pads(node, dim)
+
+        spatial = [x[i] for i in ShapeInference._spatial_axes(node, len(x))]
+        spatial = [ShapeInference._window(spatial[i], kernel[i], strides[i], padding, pads[i]) for i in range(dim)]
+
+        if ShapeInference._channels_first(node):
+            return [x[0], filters] + spatial
+        return [x[0]] + spatial + [filters]
+
+
+    def _infer_pooling(self, node, inputs):
+        # ksize and strides are laid out like the data
+        x = list(inputs[0])
+        axes = ShapeInference._spatial_axes(node, len(x))
+        if "global_pooling" in node.attr and node.attr["global_pooling"].b:
+            for i in axes:
+                x[i] = 1
+            return x
+        ksize = list(node.attr["ksize"].list.i)
+        strides = list(node.attr["strides"].list.i)
+        padding = node.attr["padding"].s
+        pads = ShapeInference._pads(node, len(axes))
+        ceil_mode = "ceil_mode" in node.attr and node.attr["ceil_mode"].b
+        for idx, i in enumerate(axes):
+            x[i] = ShapeInference._window(x[i], ksize[i], strides[i], padding, pads[idx], ceil_mode)
+        return x
+
+
+    def _infer_global_pooling(self, node, inputs):
+        x = inputs[0]
+        return [x[0], x[-1]]
+
+
+    def _infer_Fully_connected(self, node, inputs):
+        # with an axis (caffe), the dimensions from it on are flattened
+        if "axis" in node.attr:
+            return list(inputs[0][:node.attr["axis"].i]) + [node.attr["units"].i]
+        return list(inputs[0][:-1]) + [node.attr["units"].i]
+
+
+    def _infer_Flatten(self, node, inputs):
+        x = inputs[0]
+        return [x[0], _product(x[1:])]
+
+
+    def _infer_Reshape(self, node, inputs):
+        x = inputs[0]
+        target = list(node.attr["Tshape"].list.i)
+        if -1 in target:
+            total = _product(x[1:])
+            known = _product([e for e in target if e != -1])
+            target[target.index(-1)] = None if total is None else total // known
+        return [x[0]] + target
+
+
+    def _infer_pad(self, node, inputs):
+        x = list(inputs[0])
+        padding = list(node.attr["padding"].list.i)
+        for idx in range(len(padding) // 2):
+            if _is_known(x[idx + 1]):
+                x[idx + 1] += padding[2 * idx] + padding[2 * idx + 1]
+        return x
+
+
+    def _infer_Concat(self, node, inputs):
+        if any(e is None for e in inputs):
+            return None
+        axis = node.attr["axis"].i if "axis" in node.attr else -1
+        ret = list(inputs[0])
+        axis = axis % len(ret)
+        sizes = [e[axis] for e in inputs]
+        ret[axis] = sum(sizes) if all(_is_known(e) for e in sizes) else None
+        return ret
+
+
+    def _infer_Embedding(self, node, inputs):
+        return list(inputs[0]) + [node.attr["output_dim"].i]
+
+
+    def _infer_recurrent(self, node, inputs):
+        x = inputs[0]
+        units = node.attr["units"].i
+        if node.attr["return_sequences"].b:
+            return [x[0], x[1], units]
+        return [x[0], units]
+
+
+    def _infer_Lambda(self, node, inputs):
+        return self.from_proto(node.attr["output_shape"].shape)
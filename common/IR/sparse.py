@@ -0,0 +1,194 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from collections import OrderedDict
+from common.IR.IR_tensor import get_weight, set_weight, tensor_shape
+from common.IR.IR_tensor import SPARSE_FORMAT_SUFFIX, SPARSE_COMPONENT_SUFFIXES
+from common.IR.quantization import is_quantized
+
+
+VALUES_SUFFIX, INDICES_SUFFIX, INDPTR_SUFFIX, BLOCK_SHAPE_SUFFIX = SPARSE_COMPONENT_SUFFIXES
+
+sparse_formats = ("csr", "bsr")
+
+# weights worth encoding sparse, as for quantization
+sparse_keys = ("kernel", "recurrent_kernel", "embeddings")
+
+
+def _as_matrix(array):
+    # N-D weights are seen as (prod(leading dims), last dim), last is the output channel axis
+    array = np.asarray(array)
+    if array.ndim == 0:
+        return array.reshape(1, 1)
+    return array.reshape(-1, array.shape[-1])
+
+
+def _indptr(counts):
+    indptr = np.zeros(len(counts) + 1, dtype = np.int32)
+    np.cumsum(counts, out = indptr[1:])
+    return indptr
+
+
+def encode_csr(array):
+    """(values, column indices, row pointers) of the matrix view of array."""
+    matrix = _as_matrix(array)
+    rows, cols = np.nonzero(matrix)
+    return matrix[rows, cols], cols.astype(np.int32), _indptr(np.count_nonzero(matrix, axis = 1))
+
+
+def decode_csr(values, indices, indptr, shape):
+    rows = len(indptr) - 1
+    matrix = np.zeros((rows, shape[-1] if shape else 1), dtype = values.dtype)
+    matrix[np.repeat(np.arange(rows), np.diff(indptr)), indices] = values
+    return matrix.reshape(shape)
+
+
+def _blocks(matrix, block_shape):
+    rows, cols = matrix.shape
+    block_rows, block_cols = block_shape
+    return matrix.reshape(rows // block_rows, block_rows, cols // block_cols, block_cols).transpose(0, 2, 1, 3)
+
+
+def encode_bsr(array, block_shape):
+    """(block values, block column indices, block row pointers) of the matrix view of array.
+
+    Only blocks with a non-zero element are stored; the matrix dims must be
+    multiples of block_shape.
+    """
+    matrix = _as_matrix(array)
+    if matrix.shape[0] % block_shape[0] or matrix.shape[1] % block_shape[1]:
+        raise ValueError("Shape %s is not a multiple of the block shape %s." % (matrix.shape, tuple(block_shape)))
+    blocks = _blocks(matrix, block_shape)
+    nonzero = blocks.any(axis = (2, 3))
+    block_rows, block_cols = np.nonzero(nonzero)
+    return blocks[block_rows, block_cols], block_cols.astype(np.int32), _indptr(np.count_nonzero(nonzero, axis = 1))
+
+
+def decode_bsr(values, indices, indptr, shape, block_shape):
+    rows = int(np.prod(shape[:-1], dtype = np.int64)) if len(shape) > 1 else 1
+    cols = shape[-1] if shape else 1
+    blocks = np.zeros((rows // block_shape[0], cols // block_shape[1]) + tuple(block_shape), dtype = values.dtype)
+    blocks[np.repeat(np.arange(len(indptr) - 1), np.diff(indptr)), indices] = values
+    return blocks.transpose(0, 2, 1, 3).reshape(shape)
+
+
+def encode(array, sparse_format = "csr", block_shape = None):
+    if sparse_format == "csr":
+        return encode_csr(array)
+    if sparse_format == "bsr":
+        return encode_bsr(array, block_shape)
+    raise ValueError("Unknown sparse format [%s], use one of %s." % (sparse_format, ", ".join(sparse_formats)))
+
+
+def is_sparse(IR_node, key):
+    return key + SPARSE_FORMAT_SUFFIX in IR_node.attr
+
+
+def densify_weight(IR_node, key, store = None):
+    """Dense ndarray of the sparse weight [key] of IR_node, None if a part is missing."""
+    values = get_weight(IR_node, key + VALUES_SUFFIX, store)
+    indices = get_weight(IR_node, key + INDICES_SUFFIX, store)
+    indptr = get_weight(IR_node, key + INDPTR_SUFFIX, store)
+    if values is None or indices is None or indptr is None:
+        return None
+
+    shape = tensor_shape(IR_node.attr[key].tensor)
+    sparse_format = IR_node.attr[key + SPARSE_FORMAT_SUFFIX].s
+    if sparse_format == b"csr":
+        return decode_csr(values, indices, indptr, shape)
+    if sparse_format == b"bsr":
+        return decode_bsr(values, indices, indptr, shape, list(IR_node.attr[key + BLOCK_SHAPE_SUFFIX].list.i))
+    raise ValueError("Unknown sparse format [%s] of %s/%s." % (sparse_format, IR_node.name, key))
+
+
+def set_sparse_weight(IR_node, key, array, sparse_format = "csr", block_shape = None, parts = None):
+    """Store array as the sparse weight [key]: the tensor attr keeps dtype and shape, the parts go to sibling attrs.
+
+    parts is the result of encode(array, sparse_format, block_shape) if
+    already computed. Returns the bytes of the encoded parts.
+    """
+    if parts is None:
+        parts = encode(array, sparse_format, block_shape)
+    values, indices, indptr = parts
+
+    # also drops a previous reference or encoding of [key]
+    set_weight(IR_node, key, np.zeros(0, dtype = array.dtype))
+    tensor = IR_node.attr[key].tensor
+    del tensor.tensor_shape.dim[:]
+    for e in array.shape:
+        tensor.tensor_shape.dim.add().size = e
+
+    set_weight(IR_node, key + VALUES_SUFFIX, values)
+    set_weight(IR_node, key + INDICES_SUFFIX, indices)
+    set_weight(IR_node, key + INDPTR_SUFFIX, indptr)
+    if sparse_format == "bsr":
+        IR_node.attr[key + BLOCK_SHAPE_SUFFIX].list.i.extend(block_shape)
+    IR_node.attr[key + SPARSE_FORMAT_SUFFIX].s = sparse_format.encode("utf-8")
+    return values.nbytes + indices.nbytes + indptr.nbytes
+
+
+
+class WeightSparsifier(object):
+    """Encode the sparse_keys weights of an IR GraphDef in CSR or block-sparse (BSR) form.
+
+    A weight is encoded when at least min_sparsity of its elements are zero
+    and the encoding is smaller than the dense tensor. Quantized weights are
+    left dense. Every weight examined
+    is recorded in self.report with its density and bytes saved.
+    """
+
+    def __init__(self, sparse_format = "csr", min_sparsity = 0.7, block_shape = (4, 4)):
+        if not sparse_format in sparse_formats:
+            raise ValueError("Unknown sparse format [%s], use one of %s." % (sparse_format, ", ".join(sparse_formats)))
+        self.sparse_format = sparse_format
+        self.min_sparsity = min_sparsity
+        self.block_shape = list(block_shape)
+        self.report = list()
+
+
+    def run(self, IR_graph):
+        changed = False
+        for node in IR_graph.node:
+            for key in sparse_keys:
+                if key in node.attr and not is_sparse(node, key) and not is_quantized(node, key):
+                    changed = self._sparsify(node, key) or changed
+        return changed
+
+
+    def _sparsify(self, IR_node, key):
+        array = get_weight(IR_node, key)
+        if array is None or array.size == 0:
+            return False
+
+        density = np.count_nonzero(array) / array.size
+        encoded = False
+        sparse_bytes = array.nbytes
+        if 1.0 - density >= self.min_sparsity:
+            matrix = _as_matrix(array)
+            if self.sparse_format == "csr" or (matrix.shape[0] % self.block_shape[0] == 0 and matrix.shape[1] % self.block_shape[1] == 0):
+                parts = encode(array, self.sparse_format, self.block_shape)
+                if sum(e.nbytes for e in parts) < array.nbytes:
+                    sparse_bytes = set_sparse_weight(IR_node, key, array, self.sparse_format, self.block_shape, parts)
+                    encoded = True
+
+        self.report.append(OrderedDict([
+                ("node", IR_node.name),
+                ("key", key),
+                ("format", self.sparse_format if encoded else "dense"),
+                ("density", density),
+                ("bytes_dense", array.nbytes),
+                ("bytes_saved", array.nbytes - sparse_bytes),
+                ]))
+        return encoded
+
+
+    def print_report(self):
+        print ("{:<32} {:<18} {:<6} {:>8} {:>12} {:>12}".format("node", "weight", "format", "density", "bytes", "saved"))
+        for e in self.report:
+            print ("{:<32} {:<18} {:<6} {:>8.1%} {:>12} {:>12}".format(
+                e["node"], e["key"], e["format"], e["density"], e["bytes_dense"], e["bytes_saved"]))
+        print ("Sparse encoding saved {} of {} bytes.".format(
+            sum(e["bytes_saved"] for e in self.report),
+            sum(e["bytes_dense"] for e in self.report)))
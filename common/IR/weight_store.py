@@ -0,0 +1,447 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import zlib
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from common.IR.IR_tensor import np_dtype_map, tensor_shape, ndarray_to_tensor, REF_SUFFIX
+
+
+WEIGHT_STORE_VERSION = 1
+
+# codec name -> (compress, decompress), stdlib only
+codecs = {
+        "zlib" : (zlib.compress, zlib.decompress),
+        }
+try:
+    import lzma
+    codecs["lzma"] = (lzma.compress, lzma.decompress)
+except ImportError:
+    # Python 2 has no lzma module
+    pass
+
+
+def index_path(path):
+    return path + ".json"
+
+
+
+class WeightStoreWriter(object):
+    """Write tensors back to back into one flat binary file.
+
+    Every tensor starts at an offset aligned to alignment bytes and is stored
+    little-endian and C-contiguous. The offset, dtype and shape of each key
+    are saved in a JSON index next to the data file (path + ".json").
+    """
+
+    def __init__(self, path, alignment = 64):
+        self.path = path
+        self.alignment = alignment
+        self.index = OrderedDict()
+        self._file = open(path, "wb")
+        self._offset = 0
+
+
+    def add(self, key, array):
+        if key in self.index:
+            raise KeyError("Weight store already has tensor [%s]." % key)
+
+        array = np.asarray(array)
+        # ascontiguousarray returns 0-d arrays as 1-d
+        array = np.ascontiguousarray(array, dtype = array.dtype.newbyteorder('<')).reshape(array.shape)
+        padding = -self._offset % self.alignment
+        if padding:
+            self._write(b"\0" * padding)
+            self._offset += padding
+
+        self.index[key] = OrderedDict([
+                ("offset", self._offset),
+                ("dtype", array.dtype.str),
+                ("shape", list(array.shape)),
+                ])
+        self._write(memoryview(array.reshape(-1).view(np.uint8)))
+        self._offset += array.nbytes
+        return key
+
+
+    def _write(self, data):
+        self._file.write(data)
+
+
+    def _index(self):
+        return OrderedDict([
+                ("version", WEIGHT_STORE_VERSION),
+                ("alignment", self.alignment),
+                ("tensors", self.index)])
+
+
+    def close(self):
+        self._file.close()
+        with open(index_path(self.path), "w") as of:
+            json.dump(self._index(), of)
+        return self._offset
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+class WeightStore(object):
+    """Read-only access to a weight store through numpy.memmap.
+
+    Opening only reads the JSON index and maps the data file; get returns an
+    ndarray view over the mapping, so only the pages of the tensors actually
+    touched are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(index_path(path), "r") as fin:
+            self.index = json.load(fin)["tensors"]
+        if os.path.getsize(path) > 0:
+            self._data = np.memmap(path, dtype = np.uint8, mode = "r")
+        else:
+            self._data = np.zeros(0, dtype = np.uint8)
+
+
+    def __contains__(self, key):
+        return key in self.index
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def keys(self):
+        return list(self.index)
+
+
+    def close(self):
+        # views returned by get keep the mapping alive
+        self._data = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def get(self, key):
+        entry = self.index[key]
+        return np.ndarray(
+                shape = tuple(entry["shape"]),
+                dtype = np.dtype(str(entry["dtype"])),
+                buffer = self._data,
+                offset = entry["offset"])
+
+
+
+class BlobStore(object):
+    """Content-addressed tensor store: one .npy file per distinct tensor.
+
+    A tensor is keyed by the sha256 of its dtype, shape and bytes, and lives
+    in directory/<first 2 hex digits>/<digest>.npy. Identical tensors, within
+    one model or across the models converted into the same directory, are
+    written once; add returns the digest, used as the IR reference. Works as
+    both the writer and the reader side of externalize_weights/get_weight.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.bytes_written = 0
+        self.bytes_reused = 0
+        self.tensors_written = 0
+        self.tensors_reused = 0
+        # digests returned by add, the blobs the externalized IR refers to
+        self.references = list()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+
+    @staticmethod
+    def digest(array):
+        hasher = hashlib.sha256()
+        hasher.update(("%s%s" % (array.dtype.str, list(array.shape))).encode("utf-8"))
+        hasher.update(memoryview(array.reshape(-1).view(np.uint8)))
+        return hasher.hexdigest()
+
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + ".npy")
+
+
+    def __contains__(self, digest):
+        return os.path.isfile(self.blob_path(digest))
+
+
+    def keys(self):
+        return [e[:-len(".npy")] for _, _, files in os.walk(self.directory) for e in files if e.endswith(".npy")]
+
+
+    def add(self, key, array):
+        array = np.asarray(array)
+        # ascontiguousarray returns 0-d arrays as 1-d
+        array = np.ascontiguousarray(array, dtype = array.dtype.newbyteorder('<')).reshape(array.shape)
+        digest = BlobStore.digest(array)
+        self.references.append(digest)
+        if digest in self:
+            self.bytes_reused += array.nbytes
+            self.tensors_reused += 1
+            return digest
+
+        path = self.blob_path(digest)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # created meanwhile by another conversion
+                pass
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as of:
+            np.save(of, array)
+        os.rename(temp_path, path)
+        self.bytes_written += array.nbytes
+        self.tensors_written += 1
+        return digest
+
+
+    def get(self, digest):
+        path = self.blob_path(digest)
+        try:
+            return np.load(path, mmap_mode = "r")
+        except ValueError:
+            # empty arrays cannot be mapped
+            return np.load(path)
+
+
+    def close(self):
+        return self.bytes_written
+
+
+    def report(self):
+        return OrderedDict([
+                ("tensors_written", self.tensors_written),
+                ("tensors_reused", self.tensors_reused),
+                ("bytes_written", self.bytes_written),
+                ("bytes_saved", self.bytes_reused),
+                ])
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+class CompressedWeightStoreWriter(WeightStoreWriter):
+    """WeightStoreWriter compressing its data file in independent fixed-size chunks.
+
+    The tensors are laid out exactly as in an uncompressed store; that byte
+    stream is cut into chunk_size chunks, each compressed on its own with
+    the zlib or lzma codec. The index additionally lists the (offset, size)
+    of every compressed chunk, so readers can decompress chunks in parallel
+    and only the chunks a tensor spans.
+    """
+
+    def __init__(self, path, codec = "zlib", chunk_size = 1 << 20, alignment = 64):
+        if not codec in codecs:
+            raise ValueError("Unknown weight codec [%s], use one of %s." % (codec, ", ".join(codecs)))
+        super(CompressedWeightStoreWriter, self).__init__(path, alignment)
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self.chunks = list()
+        self._pending = bytearray()
+        self._compressed_offset = 0
+
+
+    def _write(self, data):
+        self._pending += data
+        while len(self._pending) >= self.chunk_size:
+            self._flush_chunk(bytes(self._pending[:self.chunk_size]))
+            del self._pending[:self.chunk_size]
+
+
+    def _flush_chunk(self, data):
+        compressed = codecs[self.codec][0](data)
+        self._file.write(compressed)
+        self.chunks.append((self._compressed_offset, len(compressed)))
+        self._compressed_offset += len(compressed)
+
+
+    def _index(self):
+        index = super(CompressedWeightStoreWriter, self)._index()
+        index["codec"] = self.codec
+        index["chunk_size"] = self.chunk_size
+        index["size"] = self._offset
+        index["chunks"] = self.chunks
+        return index
+
+
+    def close(self):
+        if len(self._pending) > 0:
+            self._flush_chunk(bytes(self._pending))
+            self._pending = bytearray()
+        super(CompressedWeightStoreWriter, self).close()
+        return self._compressed_offset
+
+
+
+class CompressedWeightStore(object):
+    """Read-only access to a CompressedWeightStoreWriter store.
+
+    get decompresses only the chunks spanned by the tensor, in a thread pool
+    of num_workers threads when there are several (zlib and lzma release
+    the GIL). load_all decompresses the whole store in parallel once, after
+    which get returns views. The compressed file is memory mapped. close,
+    or leaving a with block, stops the thread pool.
+    """
+
+    def __init__(self, path, num_workers = 4):
+        self.path = path
+        with open(index_path(path), "r") as fin:
+            index = json.load(fin)
+        self.index = index["tensors"]
+        self.codec = index["codec"]
+        self.chunk_size = index["chunk_size"]
+        self.size = index["size"]
+        self.chunks = index["chunks"]
+        self.num_workers = num_workers
+        self._data = None
+        self._pool = None
+        # mapped, only the chunks decompressed are read from disk
+        if os.path.getsize(path) > 0:
+            self._compressed = np.memmap(path, dtype = np.uint8, mode = "r")
+        else:
+            self._compressed = np.zeros(0, dtype = np.uint8)
+
+
+    def __contains__(self, key):
+        return key in self.index
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def keys(self):
+        return list(self.index)
+
+
+    def _decompress_chunk(self, idx):
+        offset, size = self.chunks[idx]
+        return codecs[self.codec][1](self._compressed[offset : offset + size].tobytes())
+
+
+    def _decompress_chunks(self, ids):
+        if self.num_workers > 1 and len(ids) > 1:
+            if self._pool is None:
+                from multiprocessing.pool import ThreadPool
+                self._pool = ThreadPool(self.num_workers)
+            return self._pool.map(self._decompress_chunk, ids)
+        return [self._decompress_chunk(e) for e in ids]
+
+
+    def load_all(self):
+        if self._data is None:
+            self._data = b"".join(self._decompress_chunks(list(range(len(self.chunks)))))
+        return self._data
+
+
+    def get(self, key):
+        entry = self.index[key]
+        dtype = np.dtype(str(entry["dtype"]))
+        count = int(np.prod(entry["shape"], dtype = np.int64))
+        if self._data is not None:
+            return np.frombuffer(self._data, dtype = dtype, count = count, offset = entry["offset"]).reshape(entry["shape"])
+        if count == 0:
+            return np.zeros(entry["shape"], dtype = dtype)
+
+        first = entry["offset"] // self.chunk_size
+        last = (entry["offset"] + count * dtype.itemsize - 1) // self.chunk_size
+        data = b"".join(self._decompress_chunks(list(range(first, last + 1))))
+        return np.frombuffer(data, dtype = dtype, count = count, offset = entry["offset"] - first * self.chunk_size).reshape(entry["shape"])
+
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+def load_throughput(store):
+    """Read every tensor of store; returns (bytes, seconds) to compare store formats."""
+    import time
+    start = time.time()
+    total = 0
+    for key in store.keys():
+        # copy, so memory mapped stores really read the data
+        total += np.array(store.get(key)).nbytes
+    return total, time.time() - start
+
+
+
+def open_weight_store(path):
+    """Reader for path: a BlobStore for a directory, otherwise a (compressed) sidecar file store."""
+    if os.path.isdir(path):
+        return BlobStore(path)
+    with open(index_path(path), "r") as fin:
+        compressed = "codec" in json.load(fin)
+    if compressed:
+        return CompressedWeightStore(path)
+    return WeightStore(path)
+
+
+
+def externalize_weights(IR_graph, writer):
+    """Move every tensor_content of IR_graph into a weight store writer.
+
+    The tensor attr keeps its dtype and shape with an empty content, and the
+    node gets a "<key>_ref" string attr holding the store key. Returns the
+    number of bytes moved out of the GraphDef.
+    """
+    moved = 0
+    for node in IR_graph.node:
+        for key in list(node.attr):
+            attr = node.attr[key]
+            if not attr.HasField("tensor") or len(attr.tensor.tensor_content) == 0:
+                continue
+            array = np.frombuffer(attr.tensor.tensor_content, dtype = np_dtype_map[attr.tensor.dtype])
+            ref = writer.add(node.name + "/" + key, array.reshape(tensor_shape(attr.tensor)))
+            moved += len(attr.tensor.tensor_content)
+            attr.tensor.tensor_content = b""
+            node.attr[key + REF_SUFFIX].s = ref.encode("utf-8")
+    return moved
+
+
+def internalize_weights(IR_graph, store):
+    """Inverse of externalize_weights: copy referenced tensors back into the GraphDef."""
+    for node in IR_graph.node:
+        for key in [e for e in node.attr if e.endswith(REF_SUFFIX)]:
+            tensor_key = key[:-len(REF_SUFFIX)]
+            ndarray_to_tensor(store.get(node.attr[key].s.decode("utf-8")), node.attr[tensor_key].tensor)
+            del node.attr[key]
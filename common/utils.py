@@ -2,30 +2,174 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
 
-def load_protobuf_from_file(container, filename):
-#    if not file_io.file_exists(filename):
-#        raise IOError("File %s does not exist." % filename)
 
-    # First try to read it as a binary file.
+# binary files larger than this are memory-mapped instead of read
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# parsed text files are cached in binary format in filename + CACHE_SUFFIX
+CACHE_SUFFIX = ".pbcache"
+_CACHE_MAGIC = b"PBCACHE1\n"
+
+_SNIFF_BYTES = 256
+
+
+def _looks_like_text(head):
+    """Guess from the first bytes of a file whether it is a text format protobuf."""
+    try:
+        text = head.decode('UTF-8')
+    except UnicodeDecodeError as e:
+        # a multi-byte character may be cut at the end of head
+        if e.start < len(head) - 3:
+            return False
+        text = head[:e.start].decode('UTF-8')
+
+    for ch in text:
+        if ord(ch) < 32 and not ch in "\t\n\r":
+            return False
+    text = text.lstrip()
+    return len(text) == 0 or text[0].isalpha() or text[0] in "#["
+
+
+def _parse_binary(container, filename, size):
     with open(filename, 'rb') as fin:
-        file_content = fin.read()
+        if size < MMAP_THRESHOLD:
+            container.ParseFromString(fin.read())
+            return container
+        import mmap
+        buf = mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            container.ParseFromString(buf)
+        except TypeError:
+            # protobuf runtimes without buffer protocol support
+            container.ParseFromString(buf[:])
+        finally:
+            try:
+                buf.close()
+            except BufferError:
+                pass
+    return container
+
+
+def _parse_text(container, file_content):
+    from google.protobuf import text_format
+    text_format.Parse(file_content.decode('UTF-8'), container, allow_unknown_extension=True)
+    return container
 
+
+def _read_text_cache(container, filename, stat, file_content):
+    """Fill container from the binary cache of a text file, returns False on a miss.
+
+    The cache is valid if it was written for the same message type and
+    either the source mtime and size, or the source content hash, match.
+    A truncated or corrupt cache is a miss too.
+    """
+    import json
+    import hashlib
+    from google.protobuf.message import DecodeError
+
+    cache_path = filename + CACHE_SUFFIX
+    if not os.path.isfile(cache_path):
+        return False
     try:
-        container.ParseFromString(file_content)
-        print("Parse file [%s] with binary format successfully." % (filename))
+        with open(cache_path, 'rb') as fin:
+            if fin.readline() != _CACHE_MAGIC:
+                return False
+            header = json.loads(fin.readline().decode('UTF-8'))
+            if not isinstance(header, dict) or header.get("type") != container.DESCRIPTOR.full_name:
+                return False
+            if header.get("mtime") != stat.st_mtime or header.get("size") != stat.st_size:
+                if header.get("sha1") != hashlib.sha1(file_content).hexdigest():
+                    return False
+            body = fin.read()
+        # a truncated body may still parse, into a partial message
+        if len(body) != header.get("length"):
+            return False
+        container.ParseFromString(body)
+    except (IOError, OSError, ValueError, EOFError, DecodeError):
+        container.Clear()
+        return False
+    return True
+
+
+def _write_text_cache(container, filename, stat, file_content):
+    import json
+    import hashlib
+
+    cache_path = filename + CACHE_SUFFIX
+    body = container.SerializeToString()
+    header = json.dumps({
+            "type"   : container.DESCRIPTOR.full_name,
+            "mtime"  : stat.st_mtime,
+            "size"   : stat.st_size,
+            "sha1"   : hashlib.sha1(file_content).hexdigest(),
+            "length" : len(body)})
+    temp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+    try:
+        with open(temp_path, 'wb') as of:
+            of.write(_CACHE_MAGIC)
+            of.write(header.encode('UTF-8') + b"\n")
+            of.write(body)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        os.rename(temp_path, cache_path)
+    except (IOError, OSError):
+        # read-only location, just go without the cache
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def load_protobuf_from_file(container, filename, cache = True):
+    """Parse a binary or text format protobuf file into container.
+
+    The format is guessed from the first bytes of the file, the other one is
+    only tried if that guess fails to parse. Large binary files are parsed
+    from a memory mapping; text files are parsed once and then loaded from a
+    binary cache next to them (see CACHE_SUFFIX) while unchanged.
+    """
+    if not os.path.isfile(filename):
+        raise IOError("File %s does not exist." % filename)
+
+    stat = os.stat(filename)
+    with open(filename, 'rb') as fin:
+        head = fin.read(_SNIFF_BYTES)
+
+    binary_first = not _looks_like_text(head)
+    if binary_first:
+        try:
+            _parse_binary(container, filename, stat.st_size)
+            print("Parse file [%s] with binary format successfully." % (filename))
+            return container
+        except Exception as e:  # pylint: disable=broad-except
+            print("Info: Trying to parse file [%s] with binary format but failed with error [%s]." % (filename, str(e)))
+            container.Clear()
+
+    with open(filename, 'rb') as fin:
+        file_content = fin.read()
+
+    if cache and _read_text_cache(container, filename, stat, file_content):
+        print("Parse file [%s] from its binary cache successfully." % (filename))
         return container
-    except Exception as e:  # pylint: disable=broad-except
-        print("Info: Trying to parse file [%s] with binary format but failed with error [%s]." % (filename, str(e)))
+    container.Clear()
 
-    # Next try to read it as a text file.
     try:
-        from google.protobuf import text_format    
-        text_format.Parse(file_content.decode('UTF-8'), container, allow_unknown_extension=True)
+        _parse_text(container, file_content)
         print("Parse file [%s] with text format successfully." % (filename))
-    except text_format.ParseError as e:
-        raise IOError("Cannot parse file %s: %s." % (filename, str(e)))
+    except Exception as text_error:  # pylint: disable=broad-except
+        # the text guess was wrong, a binary file whose first bytes happen to be printable
+        container.Clear()
+        if binary_first:
+            raise IOError("Cannot parse file %s: %s." % (filename, str(text_error)))
+        try:
+            container.ParseFromString(file_content)
+        except Exception:  # pylint: disable=broad-except
+            raise IOError("Cannot parse file %s: %s." % (filename, str(text_error)))
+        print("Parse file [%s] with binary format successfully." % (filename))
+        return container
 
+    if cache:
+        _write_text_cache(container, filename, stat, file_content)
     return container
 
 
@@ -55,13 +55,11 @@ class CaffeGraph(Graph):
         return True
   
 
-    @classmethod
     def __init__(self, model, phase):
         super(CaffeGraph, self).__init__(model)
         self.phase = phase
  
 
-    @classmethod
     def build(self):
         todo_layer = list()
         inplace_rename_map = dict()
@@ -96,7 +94,6 @@ class CaffeGraph(Graph):
 
 
 
-    @classmethod
     def _inplace_handler(self, layer, rename_map):
         if len(layer.bottom) != 1:
             return
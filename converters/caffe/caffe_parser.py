@@ -2,12 +2,14 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numbers
 import os
 
 from converters.caffe.caffe_graph import CaffeGraph
 import common.IR.graph_pb2 as graph_pb2
 from common.IR.graph_pb2 import NodeDef, GraphDef, DataType
 from common.DataStructure.parser import Parser
+from common.IR.IR_tensor import set_weight
 
 class CaffeParser(Parser):
    
@@ -43,24 +45,31 @@ class CaffeParser(Parser):
         loaded_model = caffe_pb2.NetParameter()
         load_protobuf_from_file(loaded_model, model_network_path)
 
-        # Load the model weights
-        """
-        loaded_model = model_from_json(loaded_model_json)
-        if os.path.isfile(model_weight_path) == True:
-            loaded_model.load_weights(model_weight_path)
-        else:
-            print("Warning: Caffe Model Weight File [%s] is not found." % (model_weight_path))
-        """
         print ("Caffe model file [%s] loaded successfully." % model_network_path)
         return loaded_model
 
 
 
-    @classmethod
+    @staticmethod
+    def _load_weights(model_weight_path):
+        """Load the layer blobs of a .caffemodel as ndarrays, keyed by layer name."""
+        from converters.caffe.caffe_weights import load_caffemodel
+
+        if not model_weight_path or os.path.isfile(model_weight_path) == False:
+            print("Warning: Caffe Model Weight File [%s] is not found." % (model_weight_path))
+            return dict()
+
+        weights = load_caffemodel(model_weight_path)
+        print ("Caffe weight file [%s] loaded successfully." % model_weight_path)
+        return weights
+
+
+
     def __init__(self, model, phase):
         super(CaffeParser, self).__init__()
         
         # load model files into caffe graph
+        self.weights = CaffeParser._load_weights(model[1])
         model = CaffeParser._load_model(model[0], model[1])
 
         # Build network graph
@@ -69,22 +78,28 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
-    def gen_IR(self):
-        for layer in self.caffe_graph.topological_sort:
-            current_node = self.caffe_graph.get_node(layer)
-            node_type = current_node.type
-
-            if hasattr(self, "rename_" + node_type):
-                func = getattr(self, "rename_" + node_type)
-                func(current_node)
-            else:
-                print("CaffeParser has not supported operator [%s]." % (node_type))
-                self.rename_UNKNOWN(current_node)
+    def gen_IR(self, num_workers = 1):
+        if num_workers > 1:
+            self._gen_IR_by_level(self.caffe_graph, self._convert_node, num_workers)
+        else:
+            for layer in self.caffe_graph.topological_sort:
+                self._convert_node(self.caffe_graph.get_node(layer))
 
         print (self.IR_graph)
 
 
+
+    def _convert_node(self, current_node):
+        node_type = current_node.type
+
+        if hasattr(self, "rename_" + node_type):
+            func = getattr(self, "rename_" + node_type)
+            func(current_node)
+        else:
+            print("CaffeParser has not supported operator [%s]." % (node_type))
+            self.rename_UNKNOWN(current_node)
+
+
     @staticmethod
     def _copy_and_reop(source_node, IR_node, new_op = None):
         node_info = source_node.layer
@@ -104,6 +119,17 @@ class CaffeParser(Parser):
 
 
 
+    def _convert_weights(self, source_node, IR_node, keys, converters = None):
+        if not source_node.name in self.weights:
+            return
+
+        for idx, (key, blob) in enumerate(zip(keys, self.weights[source_node.name])):
+            if converters is not None and converters[idx] is not None:
+                blob = converters[idx](blob)
+            set_weight(IR_node, key, blob)
+
+
+
     @staticmethod
     def _copy_shape(source_node, target_node):
         if hasattr(source_node, "output_shape"):
@@ -139,7 +165,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def _defuse_activation(self, source_node):
         if source_node.activation == "":
             return
@@ -152,44 +177,74 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
+    @staticmethod
+    def _spatial_param(param, name, default, prefix = None):
+        """Per spatial dimension value of a caffe param, from prefix_h/prefix_w or name."""
+        prefix = prefix or name
+        if prefix + "_h" in param.DESCRIPTOR.fields_by_name and param.HasField(prefix + "_h"):
+            return [getattr(param, prefix + "_h"), getattr(param, prefix + "_w")]
+        value = getattr(param, name)
+        if isinstance(value, numbers.Integral):
+            value = [value] if param.HasField(name) else []
+        value = list(value) or [default]
+        return value * 2 if len(value) == 1 else value
+
+
+
+    @staticmethod
+    def _convert_pads(pads, IR_node):
+        # caffe pads both sides by the same amount, stored as [begin, end] per spatial dimension
+        if any(pads):
+            IR_node.attr["padding"].s = b"EXPLICIT"
+            for e in pads:
+                IR_node.attr["pads"].list.i.extend([e, e])
+        else:
+            IR_node.attr["padding"].s = b"VALID"
+
+
+
     def _convert_convolution(self, source_node, IR_node):
         # name, op
-        CaffeParser._copy_and_reop(source_node, IR_node)
+        CaffeParser._copy_and_reop(source_node, IR_node, "Conv2D")
 
         # input edge
         CaffeParser._convert_inedge(source_node, IR_node, self.caffe_graph.layer_name_map)
-        
-        # padding        
-#        Keras2Parser._convert_padding(keras_node, IR_node)
 
-        """
-        # filter
-        for e in keras_node.keras_layer.kernel_size:
-            IR_node.attr["filter"].list.i.append(e)
+        param = source_node.layer.convolution_param
+        kernel = CaffeParser._spatial_param(param, "kernel_size", None, "kernel")
 
-        if self.data_format == "channels_last":
-            IR_node.attr["filter"].list.i.append(keras_node.keras_layer.input_shape[-1])
+        # padding
+        CaffeParser._convert_pads(CaffeParser._spatial_param(param, "pad", 0), IR_node)
+
+        # filter, [kh, kw, in, out]; the input channels are only known from the weights
+        IR_node.attr["filter"].list.i.extend(kernel)
+        if source_node.name in self.weights:
+            IR_node.attr["filter"].list.i.append(self.weights[source_node.name][0].shape[1] * param.group)
         else:
-            IR_node.attr["filter"].list.i.append(keras_node.keras_layer.input_shape[1])
-        IR_node.attr["filter"].list.i.append(keras_node.keras_layer.filters)
-        """
+            IR_node.attr["filter"].list.i.append(-1)
+        IR_node.attr["filter"].list.i.append(param.num_output)
+
+        # strides, dilations
+        IR_node.attr["strides"].list.i.extend(CaffeParser._spatial_param(param, "stride", 1))
+        dilations = CaffeParser._spatial_param(param, "dilation", 1)
+        if any(e != 1 for e in dilations):
+            IR_node.attr["dilations"].list.i.extend(dilations)
+        if param.group != 1:
+            IR_node.attr["group"].i = param.group
+
         # use_bias
-        IR_node.attr["use_bias"].b = source_node.layer.convolution_param.bias_term
-        """
-        # strides
-        for e in keras_node.keras_layer.strides:
-            IR_node.attr["strides"].list.i.append(e)
+        IR_node.attr["use_bias"].b = param.bias_term
 
-        while len(IR_node.attr["strides"].list.i) < dim:
-            IR_node.attr["strides"].list.i.append(IR_node.attr["strides"].list.i.at(0))
+        # data_format
+        IR_node.attr["data_format"].s = b"NCHW"
+
+        # weights, caffe kernel OIHW to the IR's HWIO
+        self._convert_weights(source_node, IR_node, ["kernel", "bias"], [
+            lambda blob: blob.transpose(2, 3, 1, 0),
+            lambda blob: blob.reshape(-1)])
 
-        # activation
-        self._defuse_activation(source_node)
-        """
 
 
-    @classmethod
     def _convert_padding_api(self, keras_node, IR_node, mode):
          # name, op
         Keras2Parser._copy_and_reop(keras_node, IR_node, "pad")
@@ -206,7 +261,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_UNKNOWN(self, source_node):
         # only for training
         IR_node = self.IR_graph.node.add()
@@ -218,46 +272,60 @@ class CaffeParser(Parser):
         CaffeParser._convert_inedge(source_node, IR_node, self.caffe_graph.layer_name_map)
 
 
-    @classmethod
     def rename_Data(self, source_node):
         self.rename_DataInput(source_node)
 
 
-    @classmethod
     def rename_DataInput(self, source_node):
         # only for training
         IR_node = self.IR_graph.node.add()
         
         # name, op
         CaffeParser._copy_and_reop(source_node, IR_node, "DataInput")
-        
-        # shape
-#        Keras2Parser._copy_shape(source_node.keras_layer, IR_node)
+
+        # caffe blobs are float
+        IR_node.attr["dtype"].type = graph_pb2.DT_FLOAT32
+
+
+
+    def rename_Input(self, source_node):
+        IR_node = self.IR_graph.node.add()
+
+        # name, op
+        CaffeParser._copy_and_reop(source_node, IR_node, "DataInput")
+
+        # caffe blobs are float
+        IR_node.attr["dtype"].type = graph_pb2.DT_FLOAT32
+
+        # shape, the first dimension is the batch
+        shapes = source_node.layer.input_param.shape
+        if len(shapes) == 0:
+            IR_node.attr["shape"].shape.unknown_rank = True
+            return
+        for idx, e in enumerate(shapes[0].dim):
+            new_dim = IR_node.attr["shape"].shape.dim.add()
+            new_dim.size = -1 if idx == 0 else e
 
 
 
-    @classmethod
     def rename_Conv1D(self, keras_node):
         IR_node = self.IR_graph.node.add()        
         self._convert_convolution(keras_node, IR_node, 1)
 
 
 
-    @classmethod
     def rename_Convolution(self, source_node):
         IR_node = self.IR_graph.node.add() 
         self._convert_convolution(source_node, IR_node)
 
 
 
-    @classmethod
     def rename_Conv3D(self, source_node):
         IR_node = self.IR_graph.node.add()         
         self._convert_convolution(keras_node, IR_node, 3)
        
 
 
-    @classmethod
     def rename_GlobalMaxPooling1D(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -269,7 +337,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_GlobalAveragePooling2D(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -281,7 +348,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_MaxPooling2D(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -321,7 +387,110 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
+    def rename_Pooling(self, source_node):
+        import converters.caffe.caffe_pb2 as caffe_pb2
+
+        IR_node = self.IR_graph.node.add()
+        param = source_node.layer.pooling_param
+        if param.pool == caffe_pb2.PoolingParameter.MAX:
+            op = "MaxPool2D"
+        elif param.pool == caffe_pb2.PoolingParameter.AVE:
+            op = "AvgPool2D"
+        else:
+            print("CaffeParser has not supported pooling method [%s]." % (param.pool))
+            op = source_node.type
+
+        # name, op
+        CaffeParser._copy_and_reop(source_node, IR_node, op)
+
+        # input edge
+        CaffeParser._convert_inedge(source_node, IR_node, self.caffe_graph.layer_name_map)
+
+        # data_format, ksize and strides are laid out like the data
+        IR_node.attr["data_format"].s = b"NCHW"
+
+        if param.global_pooling:
+            IR_node.attr["global_pooling"].b = True
+            return
+
+        # padding, caffe rounds the output size up
+        CaffeParser._convert_pads(CaffeParser._spatial_param(param, "pad", 0), IR_node)
+        IR_node.attr["ceil_mode"].b = True
+
+        # strides
+        IR_node.attr["strides"].list.i.extend([1, 1] + CaffeParser._spatial_param(param, "stride", 1))
+
+        # ksize
+        IR_node.attr["ksize"].list.i.extend([1, 1] + CaffeParser._spatial_param(param, "kernel_size", None, "kernel"))
+
+
+
+    def rename_Concat(self, source_node):
+        IR_node = self.IR_graph.node.add()
+
+        # name, op
+        CaffeParser._copy_and_reop(source_node, IR_node)
+
+        # input edge
+        CaffeParser._convert_inedge(source_node, IR_node, self.caffe_graph.layer_name_map)
+
+        # axis
+        param = source_node.layer.concat_param
+        IR_node.attr["axis"].i = param.concat_dim if param.HasField("concat_dim") and not param.HasField("axis") else param.axis
+
+
+
+    def rename_InnerProduct(self, source_node):
+        IR_node = self.IR_graph.node.add()
+
+        # name, op
+        CaffeParser._copy_and_reop(source_node, IR_node, "Fully_connected")
+
+        # input edge
+        CaffeParser._convert_inedge(source_node, IR_node, self.caffe_graph.layer_name_map)
+
+        # units
+        num_output = source_node.layer.inner_product_param.num_output
+        IR_node.attr["units"].i = num_output
+
+        # axis, the dimensions from it on are flattened
+        IR_node.attr["axis"].i = source_node.layer.inner_product_param.axis
+
+        # use_bias
+        IR_node.attr["use_bias"].b = source_node.layer.inner_product_param.bias_term
+
+        # weights, caffe (out, in) to the IR's (in, out)
+        self._convert_weights(source_node, IR_node, ["kernel", "bias"], [
+            lambda blob: blob.reshape(num_output, -1).T,
+            lambda blob: blob.reshape(-1)])
+
+
+
+    def rename_BatchNorm(self, source_node):
+        IR_node = self.IR_graph.node.add()
+
+        # name, op
+        CaffeParser._copy_and_reop(source_node, IR_node, "BatchNorm")
+
+        # input edge
+        CaffeParser._convert_inedge(source_node, IR_node, self.caffe_graph.layer_name_map)
+
+        # axis, caffe is channels first; scale and shift live in a following Scale layer
+        IR_node.attr["axis"].i = 1
+        IR_node.attr["scale"].b = False
+        IR_node.attr["center"].b = False
+        IR_node.attr["epsilon"].f = source_node.layer.batch_norm_param.eps
+
+        # weights, caffe stores the running sums and their scale factor
+        if source_node.name in self.weights and len(self.weights[source_node.name]) == 3:
+            mean, var, factor = self.weights[source_node.name]
+            factor = factor.reshape(-1)[0]
+            factor = 0.0 if factor == 0 else 1.0 / factor
+            set_weight(IR_node, "mean", (mean.reshape(-1) * factor).astype(mean.dtype))
+            set_weight(IR_node, "var", (var.reshape(-1) * factor).astype(var.dtype))
+
+
+
     def rename_Dropout(self, source_node):
         # only for training
         IR_node = self.IR_graph.node.add()
@@ -335,7 +504,6 @@ class CaffeParser(Parser):
         IR_node.attr["keep_prob"].f = source_node.layer.dropout_param.dropout_ratio
   
 
-    @classmethod
     def rename_Dense(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -356,7 +524,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_Flatten(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -368,7 +535,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_Activation(self, keras_node):
         IR_node = self.IR_graph.node.add()
 
@@ -379,7 +545,6 @@ class CaffeParser(Parser):
         Keras2Parser._convert_inedge(keras_node, IR_node, self.keras_graph.layer_name_map)
 
 
-    @classmethod
     def rename_ReLU(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -391,7 +556,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_Embedding(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -412,7 +576,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_LSTM(self, keras_node):
         IR_node = self.IR_graph.node.add()
 
@@ -437,7 +600,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_GRU(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -455,7 +617,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_Add(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -467,7 +628,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_Concatenate(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -478,7 +638,6 @@ class CaffeParser(Parser):
         Keras2Parser._convert_inedge(source_node, IR_node, self.keras_graph.layer_name_map)
 
 
-    @classmethod
     def rename_Reshape(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -493,7 +652,6 @@ class CaffeParser(Parser):
             IR_node.attr["Tshape"].list.i.append(e)
 
 
-    @classmethod
     def rename_Lambda(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -516,7 +674,6 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_BatchNormalization(self, keras_node):
         IR_node = self.IR_graph.node.add()
 
@@ -534,14 +691,12 @@ class CaffeParser(Parser):
 
 
 
-    @classmethod
     def rename_ZeroPadding2D(self, keras_node):
         IR_node = self.IR_graph.node.add()
         self._convert_padding_api(keras_node, IR_node, "CONSTANT")
 
 
 
-    @classmethod
     def rename_AveragePooling2D(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -0,0 +1,217 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import mmap
+import numpy as np
+from collections import OrderedDict
+
+
+# protobuf wire types
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH = 2
+WIRE_FIXED32 = 5
+
+# BlobProto field numbers, see caffe.proto
+_BLOB_NUM, _BLOB_CHANNELS, _BLOB_HEIGHT, _BLOB_WIDTH = 1, 2, 3, 4
+_BLOB_DATA = 5
+_BLOB_SHAPE = 7
+_BLOB_DOUBLE_DATA = 8
+
+# NetParameter field -> (layer message, blobs field of that message)
+_NET_LAYER_FIELDS = {
+        100 : ("LayerParameter", 7),
+        2   : ("V1LayerParameter", 6),
+        }
+
+
+def read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        if not isinstance(byte, int):
+            byte = ord(byte)
+        result |= (byte & 0x7f) << shift
+        pos += 1
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_field_spans(buf, start = 0, end = None):
+    """Walk the top-level fields of a serialized message in buf[start:end].
+
+    Yields (field number, wire type, value, field begin): value is the
+    integer for varints, and the (begin, end) byte range of the payload for
+    the other wire types, so that length-delimited payloads are never copied.
+    field begin is the offset of the field's tag.
+    """
+    pos = start
+    end = len(buf) if end is None else end
+    while pos < end:
+        begin = pos
+        tag, pos = read_varint(buf, pos)
+        field, wire_type = tag >> 3, tag & 7
+        if wire_type == WIRE_VARINT:
+            value, pos = read_varint(buf, pos)
+            yield field, wire_type, value, begin
+        elif wire_type == WIRE_LENGTH:
+            size, pos = read_varint(buf, pos)
+            yield field, wire_type, (pos, pos + size), begin
+            pos += size
+        elif wire_type == WIRE_FIXED32:
+            yield field, wire_type, (pos, pos + 4), begin
+            pos += 4
+        elif wire_type == WIRE_FIXED64:
+            yield field, wire_type, (pos, pos + 8), begin
+            pos += 8
+        else:
+            raise ValueError("Unsupported protobuf wire type %d." % wire_type)
+
+
+def iter_fields(buf, start = 0, end = None):
+    """iter_field_spans without the field begin offsets."""
+    for field, wire_type, value, _ in iter_field_spans(buf, start, end):
+        yield field, wire_type, value
+
+
+def _varint_end(buf, begin):
+    # end of the varint field whose tag starts at begin
+    _, pos = read_varint(buf, begin)
+    _, pos = read_varint(buf, pos)
+    return pos
+
+
+def _unpack_varints(buf, begin, end):
+    ret = list()
+    pos = begin
+    while pos < end:
+        value, pos = read_varint(buf, pos)
+        ret.append(value)
+    return ret
+
+
+def blob_to_ndarray(buf, start = 0, end = None):
+    """Decode a serialized caffe BlobProto into an ndarray.
+
+    Packed data/double_data payloads are wrapped with numpy.frombuffer, so the
+    result is a view over buf (no per-element decoding). The shape comes from
+    BlobProto.shape or, for legacy blobs, num/channels/height/width.
+    """
+    chunks = list()
+    dtype = None
+    shape = list()
+    legacy = dict()
+
+    for field, wire_type, value in iter_fields(buf, start, end):
+        if field in (_BLOB_DATA, _BLOB_DOUBLE_DATA):
+            field_dtype = np.dtype('<f4') if field == _BLOB_DATA else np.dtype('<f8')
+            if dtype is not None and dtype != field_dtype:
+                raise ValueError("BlobProto mixes data and double_data.")
+            dtype = field_dtype
+            begin, stop = value
+            chunks.append(np.frombuffer(buf, dtype = dtype, count = (stop - begin) // dtype.itemsize, offset = begin))
+        elif field == _BLOB_SHAPE:
+            for dim_field, dim_wire, dim_value in iter_fields(buf, value[0], value[1]):
+                if dim_wire == WIRE_LENGTH:
+                    shape.extend(_unpack_varints(buf, dim_value[0], dim_value[1]))
+                else:
+                    shape.append(dim_value)
+        elif field in (_BLOB_NUM, _BLOB_CHANNELS, _BLOB_HEIGHT, _BLOB_WIDTH):
+            legacy[field] = value
+
+    if dtype is None:
+        data = np.zeros(0, dtype = np.float32)
+    elif len(chunks) == 1:
+        data = chunks[0]
+    else:
+        data = np.concatenate(chunks)
+
+    if not shape:
+        # legacy 4D blob, callers reshape to the layer's own layout
+        shape = [legacy.get(e, 0) for e in (_BLOB_NUM, _BLOB_CHANNELS, _BLOB_HEIGHT, _BLOB_WIDTH)]
+        if int(np.prod(shape)) != data.size:
+            shape = [data.size]
+    return data.reshape(shape)
+
+
+def blob_proto_to_ndarray(blob):
+    """Convert a parsed BlobProto message, going through its serialized bytes in bulk."""
+    return blob_to_ndarray(blob.SerializeToString())
+
+
+class CaffeModelReader(object):
+    """Stream the layers of a binary .caffemodel out of a memory-mapped file.
+
+    The NetParameter is never parsed as a whole: its layer (and legacy
+    layers) entries are walked one at a time on the wire format. Every
+    layer is yielded as a LayerParameter (V1LayerParameter for legacy
+    models) parsed without its blobs, together with the blobs as ndarray
+    views over the mapping. Memory use is bounded by what the caller keeps,
+    the file pages themselves are only read in when touched.
+    """
+
+    def __init__(self, model_weight_path):
+        self.path = model_weight_path
+        with open(model_weight_path, 'rb') as fin:
+            if os.fstat(fin.fileno()).st_size > 0:
+                self._buf = mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ)
+            else:
+                self._buf = b""
+
+
+    def __iter__(self):
+        return self.layers()
+
+
+    def layers(self):
+        import converters.caffe.caffe_pb2 as caffe_pb2
+
+        buf = self._buf
+        for field, wire_type, value in iter_fields(buf):
+            if wire_type != WIRE_LENGTH or not field in _NET_LAYER_FIELDS:
+                continue
+
+            message, blobs_field = _NET_LAYER_FIELDS[field]
+            layer = getattr(caffe_pb2, message)()
+            params = list()
+            blobs = list()
+            for layer_field, layer_wire, layer_value, begin in iter_field_spans(buf, value[0], value[1]):
+                if layer_field == blobs_field and layer_wire == WIRE_LENGTH:
+                    blobs.append(blob_to_ndarray(buf, layer_value[0], layer_value[1]))
+                else:
+                    stop = layer_value[1] if isinstance(layer_value, tuple) else _varint_end(buf, begin)
+                    params.append(buf[begin : stop])
+            layer.ParseFromString(b"".join(params))
+            yield layer, blobs
+
+
+    def close(self):
+        # views handed out keep the mapping alive, it is unmapped with the last of them
+        self._buf = b""
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def load_caffemodel(model_weight_path):
+    """Read the blobs of every layer of a binary .caffemodel.
+
+    Returns an OrderedDict layer name -> list of ndarrays, covering both
+    NetParameter.layer and the legacy NetParameter.layers. The arrays are
+    views over the memory-mapped file.
+    """
+    weights = OrderedDict()
+    with CaffeModelReader(model_weight_path) as reader:
+        for layer, blobs in reader:
+            if len(blobs) > 0:
+                weights[layer.name] = blobs
+    return weights
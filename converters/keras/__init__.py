@@ -7,9 +7,14 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import keras as _keras
 import logging as _logging
-if _keras.backend.backend() != 'tensorflow':
-    _HAS_KERAS_TF = False
-    _HAS_KERAS2_TF = False
-    _logging.warn('Currently, only Keras models with TensorFlow backend can be converted to CoreML.')
+
+# keras (and so TensorFlow) is only imported by the modules of this package
+# that need it, importing the package itself stays free of frameworks
+
+
+def _check_keras_backend(keras):
+    if keras.backend.backend() != 'tensorflow':
+        _logging.warn('Currently, only Keras models with TensorFlow backend can be converted to CoreML.')
+        return False
+    return True
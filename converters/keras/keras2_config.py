@@ -0,0 +1,567 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import base64
+import struct
+import marshal
+import numpy as np
+
+
+# layers whose output has the shape of their (first) input
+_SHAPE_PRESERVING = (
+        "Activation", "Dropout", "SpatialDropout1D", "SpatialDropout2D", "SpatialDropout3D",
+        "GaussianNoise", "GaussianDropout", "AlphaDropout", "BatchNormalization", "Masking",
+        "LeakyReLU", "PReLU", "ELU", "ThresholdedReLU", "Softmax",
+        )
+
+_ELEMENTWISE_MERGES = ("Add", "Subtract", "Multiply", "Average", "Maximum", "Minimum")
+
+_RECURRENT = ("SimpleRNN", "GRU", "LSTM")
+
+_NESTED_MODELS = ("Model", "Sequential")
+
+# attributes Keras layers always carry although their config may leave them out
+_LAYER_DEFAULTS = {
+        "Dropout" : {"seed" : None, "noise_shape" : None},
+        }
+
+# computed from the graph, never read from the config (Lambda has an "output_shape" entry)
+_SHAPE_ATTRS = ("input_shape", "output_shape")
+
+
+def image_data_format():
+    """image_data_format of the Keras config file, as keras.backend.image_data_format() reports it."""
+    keras_dir = os.environ.get("KERAS_HOME") or os.path.join(os.path.expanduser("~"), ".keras")
+    try:
+        with open(os.path.join(keras_dir, "keras.json"), "r") as fin:
+            return json.load(fin).get("image_data_format", "channels_last")
+    except (IOError, OSError, ValueError):
+        return "channels_last"
+
+
+
+class _Function(object):
+    """Stands for an activation or Lambda function, of which the parser only reads the name."""
+
+    def __init__(self, name):
+        self.__name__ = name
+
+
+
+def _py2_code_name(data):
+    """co_name of a Python 2 marshalled code object, as Keras 2.0 dumps Lambda functions."""
+    refs = list()
+
+    def int32(pos):
+        return struct.unpack("<i", data[pos : pos + 4])[0]
+
+    def read(pos):
+        kind = data[pos : pos + 1]
+        pos += 1
+        if kind in (b"0", b"N", b"F", b"T", b"S", b"."):
+            return None, pos
+        if kind == b"i":
+            return int32(pos), pos + 4
+        if kind == b"I" or kind == b"g":
+            return None, pos + 8
+        if kind == b"y":
+            return None, pos + 16
+        if kind == b"l":
+            return None, pos + 4 + 2 * abs(int32(pos))
+        if kind == b"f":
+            return None, pos + 1 + ord(data[pos : pos + 1])
+        if kind in (b"s", b"t", b"u"):
+            size = int32(pos)
+            value = data[pos + 4 : pos + 4 + size]
+            if kind == b"t":
+                refs.append(value)
+            return value, pos + 4 + size
+        if kind == b"R":
+            return refs[int32(pos)], pos + 4
+        if kind in (b"(", b"[", b"<", b">"):
+            items = list()
+            count = int32(pos)
+            pos += 4
+            for _ in range(count):
+                item, pos = read(pos)
+                items.append(item)
+            return items, pos
+        if kind == b"c":
+            # argcount, nlocals, stacksize, flags; code, consts, names, varnames,
+            # freevars, cellvars, filename, name; firstlineno; lnotab
+            pos += 16
+            for _ in range(7):
+                _, pos = read(pos)
+            name, pos = read(pos)
+            _, pos = read(pos + 4)
+            return name, pos
+        raise ValueError("Unknown marshal type %r." % kind)
+
+    name, _ = read(0)
+    return name.decode("utf-8")
+
+
+def _lambda_function_name(config):
+    function = config.get("function")
+    if config.get("function_type") == "function":
+        return function
+    if isinstance(function, (list, tuple)):
+        function = function[0]
+
+    # Keras 2.0 stores the raw marshalled code, later versions base64 encode it
+    data = function.encode("raw_unicode_escape")
+    candidates = [data]
+    try:
+        candidates.append(base64.b64decode(data))
+    except (TypeError, ValueError):
+        pass
+    for data in candidates:
+        try:
+            return marshal.loads(data).co_name
+        except (ValueError, EOFError, TypeError, AttributeError):
+            pass
+        try:
+            return _py2_code_name(data)
+        except (ValueError, IndexError, AttributeError, UnicodeDecodeError, struct.error):
+            pass
+    return "<lambda>"
+
+
+def _conv_output_length(length, filter_size, padding, stride, dilation = 1):
+    if length is None:
+        return None
+    filter_size = filter_size + (filter_size - 1) * (dilation - 1)
+    # "same" and "causal" keep the length
+    if padding == "valid":
+        length = length - filter_size + 1
+    elif padding == "full":
+        length = length + filter_size - 1
+    return (length + stride - 1) // stride
+
+
+def _channels_first(layer, rank):
+    return rank > 1 and layer.data_format == "channels_first"
+
+
+def _spatial_shape(layer, input_shape, rank, sizes, strides, dilation = None):
+    spatial = input_shape[2:] if _channels_first(layer, rank) else input_shape[1 : 1 + rank]
+    return [_conv_output_length(spatial[i], sizes[i], layer.padding, strides[i], dilation[i] if dilation else 1) for i in range(rank)]
+
+
+def _with_channels(layer, input_shape, spatial, channels):
+    if _channels_first(layer, len(spatial)):
+        return (input_shape[0], channels) + tuple(spatial)
+    return (input_shape[0],) + tuple(spatial) + (channels,)
+
+
+def _conv_shape(layer, input_shape):
+    rank = len(layer.kernel_size)
+    spatial = _spatial_shape(layer, input_shape, rank, layer.kernel_size, layer.strides, layer.dilation_rate)
+    return _with_channels(layer, input_shape, spatial, layer.filters)
+
+
+def _pool_shape(layer, input_shape):
+    rank = len(layer.pool_size)
+    strides = layer.strides or layer.pool_size
+    spatial = _spatial_shape(layer, input_shape, rank, layer.pool_size, strides)
+    channels = input_shape[1] if _channels_first(layer, rank) else input_shape[-1]
+    return _with_channels(layer, input_shape, spatial, channels)
+
+
+def _global_pool_shape(layer, input_shape):
+    channels_first = len(input_shape) > 3 and layer.data_format == "channels_first"
+    return (input_shape[0], input_shape[1] if channels_first else input_shape[-1])
+
+
+def _zero_padding_shape(layer, input_shape):
+    rank = len(layer.padding)
+    spatial = input_shape[2:] if _channels_first(layer, rank) else input_shape[1 : 1 + rank]
+    spatial = [None if e is None else e + sum(pad) for e, pad in zip(spatial, layer.padding)]
+    channels = input_shape[1] if _channels_first(layer, rank) else input_shape[-1]
+    return _with_channels(layer, input_shape, spatial, channels)
+
+
+def _upsampling_shape(layer, input_shape):
+    size = layer.size if isinstance(layer.size, (list, tuple)) else [layer.size]
+    rank = len(size)
+    spatial = input_shape[2:] if _channels_first(layer, rank) else input_shape[1 : 1 + rank]
+    spatial = [None if e is None else e * n for e, n in zip(spatial, size)]
+    channels = input_shape[1] if _channels_first(layer, rank) else input_shape[-1]
+    return _with_channels(layer, input_shape, spatial, channels)
+
+
+def _flatten_shape(layer, input_shape):
+    if None in input_shape[1:]:
+        return (input_shape[0], None)
+    return (input_shape[0], int(np.prod(input_shape[1:])))
+
+
+def _reshape_shape(layer, input_shape):
+    target = list(layer.target_shape)
+    if -1 in target and not None in input_shape[1:]:
+        known = int(np.prod([e for e in target if e != -1]))
+        target[target.index(-1)] = int(np.prod(input_shape[1:])) // known
+    return (input_shape[0],) + tuple(None if e == -1 else e for e in target)
+
+
+def _embedding_shape(layer, input_shape):
+    shape = list(input_shape)
+    if layer.input_length:
+        shape[1] = layer.input_length
+    return tuple(shape) + (layer.output_dim,)
+
+
+def _recurrent_shape(layer, input_shape):
+    if layer.return_sequences:
+        return (input_shape[0], input_shape[1], layer.units)
+    return (input_shape[0], layer.units)
+
+
+def _elementwise_shape(layer, input_shapes):
+    ret = list()
+    for dims in zip(*input_shapes):
+        ret.append(None if None in dims else max(dims))
+    return tuple(ret)
+
+
+def _concatenate_shape(layer, input_shapes):
+    ret = list(input_shapes[0])
+    axis = layer.axis % len(ret)
+    dims = [e[axis] for e in input_shapes]
+    ret[axis] = None if None in dims else sum(dims)
+    return tuple(ret)
+
+
+def _lambda_shape(layer, input_shape):
+    output_shape = layer.config.get("output_shape")
+    if layer.config.get("output_shape_type", "raw") == "raw" and isinstance(output_shape, list):
+        batch = input_shape[0][0] if isinstance(input_shape, list) else input_shape[0]
+        return (batch,) + tuple(output_shape)
+    if not isinstance(input_shape, list):
+        # Keras with TensorFlow infers it by calling the function, shape preserving ones are the common case
+        return input_shape
+    return None
+
+
+_shape_functions = {
+        "Dense"                  : lambda layer, shape : tuple(shape[:-1]) + (layer.units,),
+        "Conv1D"                 : _conv_shape,
+        "Conv2D"                 : _conv_shape,
+        "Conv3D"                 : _conv_shape,
+        "SeparableConv2D"        : _conv_shape,
+        "MaxPooling1D"           : _pool_shape,
+        "MaxPooling2D"           : _pool_shape,
+        "MaxPooling3D"           : _pool_shape,
+        "AveragePooling1D"       : _pool_shape,
+        "AveragePooling2D"       : _pool_shape,
+        "AveragePooling3D"       : _pool_shape,
+        "GlobalMaxPooling1D"     : _global_pool_shape,
+        "GlobalMaxPooling2D"     : _global_pool_shape,
+        "GlobalAveragePooling1D" : _global_pool_shape,
+        "GlobalAveragePooling2D" : _global_pool_shape,
+        "ZeroPadding1D"          : _zero_padding_shape,
+        "ZeroPadding2D"          : _zero_padding_shape,
+        "UpSampling1D"           : _upsampling_shape,
+        "UpSampling2D"           : _upsampling_shape,
+        "UpSampling3D"           : _upsampling_shape,
+        "Flatten"                : _flatten_shape,
+        "Reshape"                : _reshape_shape,
+        "Permute"                : lambda layer, shape : (shape[0],) + tuple(shape[e] for e in layer.dims),
+        "RepeatVector"           : lambda layer, shape : (shape[0], layer.n, shape[1]),
+        "Embedding"              : _embedding_shape,
+        "Concatenate"            : _concatenate_shape,
+        "Lambda"                 : _lambda_shape,
+        }
+
+for e in _SHAPE_PRESERVING:
+    _shape_functions[e] = lambda layer, shape : tuple(shape)
+for e in _RECURRENT:
+    _shape_functions[e] = _recurrent_shape
+for e in _ELEMENTWISE_MERGES:
+    _shape_functions[e] = _elementwise_shape
+
+
+
+class KerasConfigNode(object):
+    """One call of a layer, as keras.engine.topology.Node: the layers and output tensors it reads."""
+
+    def __init__(self, inbound_layers, node_indices, tensor_indices):
+        self.inbound_layers = inbound_layers
+        self.node_indices = node_indices
+        self.tensor_indices = tensor_indices
+
+
+
+class KerasConfigLayer(object):
+    """A Keras layer rebuilt from its config entry, exposing the attributes Keras2Parser reads.
+
+    Config entries read as attributes, the ones Keras normalizes in the
+    layer constructors (activations, padding, data_format) are normalized
+    the same way. input_shape and output_shape only exist once known and,
+    as in Keras, when all calls of the layer share them.
+    """
+
+    def __init__(self, class_name, config, data_format, nested_model = None):
+        self.class_name = class_name
+        self.config = config
+        self.name = config["name"]
+        self.inbound_nodes = list()
+        self.nested_model = nested_model
+        self.node_output_shapes = list()
+        self._weights = list()
+
+        for key, value in _LAYER_DEFAULTS.get(class_name, dict()).items():
+            setattr(self, key, config.get(key, value))
+        if "activation" in config:
+            self.activation = _Function(config["activation"])
+        if "data_format" in config:
+            self.data_format = config["data_format"] or data_format
+        if class_name == "Lambda":
+            self.function = _Function(_lambda_function_name(config))
+        if class_name.startswith("ZeroPadding"):
+            self.padding = KerasConfigLayer._normalize_padding(config["padding"], 2 if class_name == "ZeroPadding2D" else 1)
+        if class_name == "InputLayer" or "batch_input_shape" in config:
+            self.dtype = config.get("dtype") or "float32"
+
+
+    @staticmethod
+    def _normalize_padding(padding, rank):
+        if isinstance(padding, int):
+            return ((padding, padding),) * rank
+        if rank == 1:
+            return (tuple(padding),)
+        return tuple((e, e) if isinstance(e, int) else tuple(e) for e in padding)
+
+
+    def __getattr__(self, name):
+        config = self.__dict__.get("config")
+        if config is None or name in _SHAPE_ATTRS or not name in config:
+            raise AttributeError("'%s' layer [%s] has no attribute '%s'." % (self.__dict__.get("class_name"), self.__dict__.get("name"), name))
+        return config[name]
+
+
+    def get_weights(self):
+        return list(self._weights)
+
+
+    def compute_output_shapes(self, input_shapes):
+        """Output shapes of a call of the layer on tensors of input_shapes, None if unknown."""
+        if self.nested_model is not None:
+            return self.nested_model.output_shapes
+        if self.class_name == "InputLayer":
+            return [tuple(self.config["batch_input_shape"])]
+
+        if not input_shapes or None in input_shapes:
+            return None
+        function = _shape_functions.get(self.class_name)
+        if function is None:
+            return None
+        input_shape = input_shapes[0] if len(input_shapes) == 1 else input_shapes
+        try:
+            shape = function(self, input_shape)
+        except (TypeError, IndexError, ValueError, ZeroDivisionError):
+            return None
+        return None if shape is None else [shape]
+
+
+    def _node_input_shapes(self, idx):
+        node = self.inbound_nodes[idx]
+        if self.class_name == "InputLayer":
+            return self.node_output_shapes[idx]
+        if not node.inbound_layers:
+            if self.nested_model is None:
+                return None
+            # node 0 of a model reads the model's own inputs
+            node_layers = [(e, 0, 0) for e in self.nested_model.input_layers]
+        else:
+            node_layers = zip(node.inbound_layers, node.node_indices, node.tensor_indices)
+        shapes = [e.node_output_shapes[n][t] if n < len(e.node_output_shapes) and e.node_output_shapes[n] else None
+                for e, n, t in node_layers]
+        return None if None in shapes else shapes
+
+
+    def _set_shapes(self):
+        # as Keras, the shapes are layer attributes when all calls of the layer share them
+        outputs = self.node_output_shapes
+        if outputs and outputs[0] is not None and all(e == outputs[0] for e in outputs):
+            self.output_shape = outputs[0][0] if len(outputs[0]) == 1 else outputs[0]
+        inputs = [self._node_input_shapes(idx) for idx in range(len(self.inbound_nodes))]
+        if inputs and inputs[0] is not None and all(e == inputs[0] for e in inputs):
+            self.input_shape = inputs[0][0] if len(inputs[0]) == 1 else inputs[0]
+
+
+
+class KerasConfigModel(object):
+    """A Keras Model or Sequential rebuilt from its JSON config, without Keras.
+
+    Offers what Keras2Graph and Keras2Parser read from a keras model: the
+    layers with their inbound nodes, attributes, output shapes and weights.
+    A Sequential model gets the "<first layer>_input" InputLayer Keras
+    creates for it. Shapes are computed from the input shapes of the config
+    for the layers in _shape_functions.
+    """
+
+    def __init__(self, model_config, data_format = None):
+        self.class_name = model_config["class_name"]
+        self.data_format = data_format or image_data_format()
+        config = model_config["config"]
+        self.layers = list()
+        self._layer_map = dict()
+
+        if self.class_name == "Sequential":
+            self._build_sequential(config["layers"] if isinstance(config, dict) else config)
+            self.name = config.get("name", "sequential") if isinstance(config, dict) else "sequential"
+        else:
+            self._build_model(config)
+            self.name = config.get("name", "model")
+        self._compute_shapes()
+
+
+    def _new_layer(self, layer_config):
+        class_name = layer_config["class_name"]
+        nested_model = None
+        if class_name in _NESTED_MODELS:
+            nested_model = KerasConfigModel(layer_config, self.data_format)
+            config = dict(name = layer_config.get("name") or nested_model.name)
+        else:
+            config = layer_config["config"]
+        layer = KerasConfigLayer(class_name, config, self.data_format, nested_model)
+        if nested_model is not None:
+            # node 0 of a model links its own inputs to its outputs, calls start at 1
+            layer.inbound_nodes.append(KerasConfigNode([], [], []))
+        self._layer_map[layer.name] = layer
+        return layer
+
+
+    def _build_sequential(self, layer_configs):
+        prev = None
+        self.input_layers = list()
+        for idx, layer_config in enumerate(layer_configs):
+            layer = self._new_layer(layer_config)
+            if idx == 0 and "batch_input_shape" in layer.config:
+                prev = KerasConfigLayer("InputLayer", dict(
+                        name = layer.name + "_input",
+                        batch_input_shape = layer.config["batch_input_shape"],
+                        dtype = layer.config.get("dtype") or "float32",
+                        sparse = False), self.data_format)
+                self._layer_map[prev.name] = prev
+                prev.inbound_nodes.append(KerasConfigNode([], [], []))
+                self.input_layers.append(prev)
+            if prev is not None:
+                layer.inbound_nodes.append(KerasConfigNode([prev], [0], [0]))
+            self.layers.append(layer)
+            prev = layer
+        self.output_layers = [(prev, 0, 0)] if prev is not None else list()
+
+
+    def _build_model(self, config):
+        for layer_config in config["layers"]:
+            self.layers.append(self._new_layer(layer_config))
+
+        for layer, layer_config in zip(self.layers, config["layers"]):
+            for node_config in layer_config["inbound_nodes"]:
+                layer.inbound_nodes.append(KerasConfigNode(
+                        [self._layer_map[e[0]] for e in node_config],
+                        [e[1] for e in node_config],
+                        [e[2] for e in node_config]))
+            if layer.class_name == "InputLayer" and not layer.inbound_nodes:
+                layer.inbound_nodes.append(KerasConfigNode([], [], []))
+
+        self.input_layers = [self._layer_map[e[0]] for e in config.get("input_layers", list())]
+        self.output_layers = [(self._layer_map[e[0]], e[1], e[2]) for e in config.get("output_layers", list())]
+
+
+    def _compute_shapes(self):
+        # layers come in topological order in Keras configs, further passes
+        # only resolve calls of shared layers that read later ones
+        for layer in self._layer_map.values():
+            layer.node_output_shapes = [None] * len(layer.inbound_nodes)
+        pending = [(layer, idx) for layer in self._layer_map.values() for idx in range(len(layer.inbound_nodes))]
+        done = set()
+
+        while pending:
+            unresolved = list()
+            for layer, idx in pending:
+                node = layer.inbound_nodes[idx]
+                refs = list(zip(node.inbound_layers, node.node_indices, node.tensor_indices))
+                if not all((e.name, n) in done or n >= len(e.inbound_nodes) for e, n, t in refs):
+                    unresolved.append((layer, idx))
+                    continue
+                inputs = list()
+                for e, n, t in refs:
+                    outputs = e.node_output_shapes[n] if n < len(e.node_output_shapes) else None
+                    inputs.append(outputs[t] if outputs is not None and t < len(outputs) else None)
+                layer.node_output_shapes[idx] = layer.compute_output_shapes(inputs)
+                done.add((layer.name, idx))
+            if len(unresolved) == len(pending):
+                break
+            pending = unresolved
+
+        for layer in self._layer_map.values():
+            layer._set_shapes()
+
+
+    @property
+    def output_shapes(self):
+        ret = list()
+        for layer, node_index, tensor_index in self.output_layers:
+            outputs = layer.node_output_shapes[node_index] if node_index < len(layer.node_output_shapes) else None
+            if outputs is None or tensor_index >= len(outputs):
+                return None
+            ret.append(outputs[tensor_index])
+        return ret
+
+
+    def get_layer(self, name):
+        return self._layer_map[name]
+
+
+    def load_weights(self, filename):
+        """Read the weights of a Keras HDF5 file (model.save or save_weights) into the layers, by layer name."""
+        import h5py
+
+        with h5py.File(filename, "r") as fin:
+            group = fin["model_weights"] if "model_weights" in fin else fin
+            for layer_name in group.attrs["layer_names"]:
+                layer_name = _decode(layer_name)
+                if not layer_name in self._layer_map:
+                    continue
+                layer_group = group[layer_name]
+                self._layer_map[layer_name]._weights = [np.asarray(layer_group[_decode(e)]) for e in layer_group.attrs["weight_names"]]
+
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def load_json_model(model_network_path, model_weight_path = None):
+    """KerasConfigModel of a Keras model JSON file, with the weights of model_weight_path if it exists."""
+    with open(model_network_path, "r") as fin:
+        model = KerasConfigModel(json.load(fin))
+
+    if model_weight_path and os.path.isfile(model_weight_path):
+        model.load_weights(model_weight_path)
+    elif model_weight_path:
+        print("Warning: Keras Model Weight File [%s] is not found." % (model_weight_path))
+
+    print ("Keras model file [%s] loaded successfully." % model_network_path)
+    return model
+
+
+def load_h5_model(filename):
+    """KerasConfigModel of a Keras model saved with model.save, weights included."""
+    import h5py
+
+    with h5py.File(filename, "r") as fin:
+        model_config = fin.attrs.get("model_config")
+        if model_config is None:
+            raise ValueError("No model found in [%s], it holds weights only: give the network with kerasJsonPath." % filename)
+    model = KerasConfigModel(json.loads(_decode(model_config)))
+    model.load_weights(filename)
+
+    print ("Keras model file [%s] loaded successfully." % filename)
+    return model
@@ -30,22 +30,33 @@ class Keras2Emitter(object):
             'sigmoid' : "Sigmoid",
             "tanh"    : "Tanh"
             }
+
+    fused_activation_map = {
+            "Relu"    : "relu",
+            "Softmax" : "softmax",
+            "Sigmoid" : "sigmoid",
+            "Tanh"    : "tanh"
+            }
     
 
-    @classmethod
     def __init__(self, filename):
         self.IR_graph = IRGraph(filename)
         self.IR_graph.build()
 
 
 
-    @classmethod
-    def gen_code(self, output_filename):
+    def gen_code(self, output_filename, memory_order = False):
         of = open(output_filename, "w")
 
         of.write("def KitModel():\n")
-        
-        for layer in self.IR_graph.topological_sort:
+
+        if memory_order:
+            from common.IR.scheduler import MemoryScheduler
+            order = MemoryScheduler(self.IR_graph.model).schedule()
+        else:
+            order = self.IR_graph.topological_sort
+
+        for layer in order:
             current_node = self.IR_graph.get_node(layer)
             node_type = current_node.type
 
@@ -57,12 +68,6 @@ class Keras2Emitter(object):
                 print("KerasEmitter has not supported operator [%s]." % (node_type))
                 self.emit_UNKNOWN(current_node)
 
-            for next_node in current_node.out_edges:
-                next_node_info = self.IR_graph.get_node(next_node)
-                next_node_info.left_in_edges -= 1
-                if next_node_info.left_in_edges == 0:
-                    traverse_nodes.append(next_node)
-
 
         last_line = "{:<15} = Model(inputs = [{}], outputs = [{}])".format(
                 "model",
@@ -86,6 +91,15 @@ class Keras2Emitter(object):
 
 
     
+    @staticmethod
+    def _emit_activation_arg(IR_node):
+        if not "fused_activation" in IR_node.IR_layer.attr:
+            return ""
+        return ", activation = \'{}\'".format(
+                Keras2Emitter.fused_activation_map[IR_node.IR_layer.attr["fused_activation"].s.decode()])
+
+
+
     @staticmethod
     def _emit_convolution(IR_node):
         dim = len(IR_node.IR_layer.attr["strides"].list.i)
@@ -104,10 +118,10 @@ class Keras2Emitter(object):
 
         use_bias = IR_node.IR_layer.attr["use_bias"].b 
 
-        padding = IR_node.IR_layer.attr["padding"].s
+        padding = IR_node.IR_layer.attr["padding"].s.decode()
         padding = padding.lower()
 
-        ret = "{:<15} = Conv{}D(filters = {}, kernel_size = ({}), strides = ({}), padding = \'{}\', use_bias = {})({})".format(
+        ret = "{:<15} = Conv{}D(filters = {}, kernel_size = ({}), strides = ({}), padding = \'{}\', use_bias = {}{})({})".format(
                 IR_node.name, 
                 dim,
                 filter,
@@ -115,6 +129,7 @@ class Keras2Emitter(object):
                 strides,
                 padding,
                 use_bias,
+                Keras2Emitter._emit_activation_arg(IR_node),
                 IR_node.in_edges[0])
 
         return ret
@@ -124,12 +139,14 @@ class Keras2Emitter(object):
     def _emit_pooling(IR_node, func):
         dim = len(IR_node.IR_layer.attr["strides"].list.i) - 2
 
-        padding = IR_node.IR_layer.attr["padding"].s
+        padding = IR_node.IR_layer.attr["padding"].s.decode()
         padding = padding.lower()
 
         pool_size = list()
         strides = list()
-        for idx in range(1, dim + 1):
+        channels_first = "data_format" in IR_node.IR_layer.attr and IR_node.IR_layer.attr["data_format"].s.startswith(b"NC")
+        first = 2 if channels_first else 1
+        for idx in range(first, first + dim):
             pool_size.append(IR_node.IR_layer.attr['ksize'].list.i[idx])
             strides.append(IR_node.IR_layer.attr['strides'].list.i[idx])
         pool_size = listToStr(pool_size)
@@ -150,13 +167,11 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_UNKNOWN(self, IR_node):
         print(IR_node.IR_layer.name)
 
 
 
-    @classmethod
     def emit_DataInput(self, IR_node):
         shape_str = IRGraph.shapeToStr(IR_node.IR_layer.attr["shape"].shape)
         code = "{:<15} = Input(shape = ({},), dtype = \"{}\")".format(
@@ -166,25 +181,21 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_Conv1D(self, IR_node):
         return Keras2Emitter._emit_convolution(IR_node)
 
 
 
-    @classmethod
     def emit_Conv2D(self, IR_node):
         return Keras2Emitter._emit_convolution(IR_node)
 
 
 
-    @classmethod
     def emit_Conv3D(self, IR_node):
         return Keras2Emitter._emit_convolution(IR_node)
        
 
 
-    @classmethod
     def emit_GlobalMaxPool1D(self, IR_node):
         code = "{:<15} = GlobalMaxPooling1D()({})".format(
                 IR_node.name, 
@@ -193,7 +204,6 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_GlobalAvgPool2D(self, IR_node):
         code = "{:<15} = GlobalAveragePooling2D()({})".format(
                 IR_node.name, 
@@ -202,21 +212,18 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_MaxPool2D(self, IR_node):
         code = Keras2Emitter._emit_pooling(IR_node, "MaxPooling")
         return code
 
 
 
-    @classmethod
     def emit_AvgPool2D(self, IR_node):
         code = Keras2Emitter._emit_pooling(IR_node, "AveragePooling")
         return code
 
 
 
-    @classmethod
     def emit_Dropout(self, IR_node):
         seed = 'None'
         if 'seed' in IR_node.IR_layer.attr:
@@ -232,22 +239,21 @@ class Keras2Emitter(object):
  
 
 
-    @classmethod
     def emit_Fully_connected(self, IR_node):
         units = IR_node.IR_layer.attr["units"].i
         use_bias = IR_node.IR_layer.attr["use_bias"].b
 
-        ret = "{:<15} = Dense(units = {}, use_bias = {})({})".format(
+        ret = "{:<15} = Dense(units = {}, use_bias = {}{})({})".format(
                 IR_node.name, 
                 units,
                 use_bias,
+                Keras2Emitter._emit_activation_arg(IR_node),
                 IR_node.in_edges[0])
 
         return ret
 
 
 
-    @classmethod
     def emit_Flatten(self, IR_node):
         code = "{:<15} = Flatten()({})".format(
             IR_node.name, IR_node.in_edges[0])
@@ -255,7 +261,6 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_Tanh(self, IR_node):
         code = "{:<15} = Activation(\'tanh\')({})".format(
                 IR_node.name, IR_node.in_edges[0])
@@ -263,7 +268,6 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_Relu(self, IR_node):
         code = "{:<15} = Activation(\'relu\')({})".format(
                 IR_node.name, IR_node.in_edges[0])
@@ -271,7 +275,6 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_Softmax(self, IR_node):
         code = "{:<15} = Activation(\'softmax\')({})".format(
                 IR_node.name, IR_node.in_edges[0])
@@ -279,7 +282,6 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_Sigmoid(self, IR_node):
         code = "{:<15} = Activation(\'sigmoid\')({})".format(
                 IR_node.name, IR_node.in_edges[0])
@@ -287,7 +289,6 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_Embedding(self, IR_node):
         ret = "{:<15} = Embedding(input_dim = {}, output_dim = {}, mask_zero = {})({})".format(
                 IR_node.name, 
@@ -300,7 +301,6 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_RNNs(self, IR_node, func):
         # for Keras
         if "dropout" in IR_node.IR_layer.attr:
@@ -322,45 +322,45 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def emit_LSTM(self, IR_node):
         return self.emit_RNNs(IR_node, "LSTM")
 
 
 
-    @classmethod
     def emit_GRU(self, IR_node):
         return self.emit_RNNs(IR_node, "GRU")
 
 
 
-    @classmethod
     def emit_Add(self, IR_node):
         code = Keras2Emitter._emit_merge(IR_node, "add")
         return code
 
 
 
-    @classmethod
     def emit_Concat(self, IR_node):
         code = Keras2Emitter._emit_merge(IR_node, "concatenate")
         return code
 
 
-    @classmethod
     def emit_BatchNorm(self, IR_node):
-        code = "{:<15} = BatchNormalization(name = '{}', axis = {}, scale = {})({})".format(
-                IR_node.name,
+        code = "BatchNormalization(name = '{}', axis = {}, scale = {})({})".format(
                 IR_node.name,
                 IR_node.IR_layer.attr['axis'].i,
                 IR_node.IR_layer.attr['scale'].b,
                 IR_node.in_edges[0])
-        return code
+
+        # Keras BatchNormalization has no activation argument
+        if "fused_activation" in IR_node.IR_layer.attr:
+            code = "Activation(\'{}\')({})".format(
+                    self.fused_activation_map[IR_node.IR_layer.attr["fused_activation"].s.decode()],
+                    code)
+
+        return "{:<15} = {}".format(IR_node.name, code)
 
 
-    @classmethod
     def emit_pad(self, IR_node):
-        if IR_node.IR_layer.attr['mode'].s == "CONSTANT":
+        if IR_node.IR_layer.attr['mode'].s == b"CONSTANT":
             func = "ZeroPadding"
 
         dim = len(IR_node.IR_layer.attr['padding'].list.i) // 2
@@ -383,7 +383,6 @@ class Keras2Emitter(object):
 
 
 
-    @classmethod
     def rename_Reshape(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -3,8 +3,8 @@ from __future__ import division
 from __future__ import print_function
 
 import os
-import keras as _keras
 from common.DataStructure.graph import GraphNode, Graph
+from converters.keras.keras2_config import KerasConfigLayer, KerasConfigModel
 
 
 class Keras2GraphNode(GraphNode):        
@@ -22,6 +22,8 @@ class Keras2GraphNode(GraphNode):
 
     @property
     def type(self):
+        if isinstance(self.layer, KerasConfigLayer):
+            return self.layer.class_name
         return self.layer.__class__.__name__
 
 
@@ -34,16 +36,16 @@ class Keras2GraphNode(GraphNode):
 
 class Keras2Graph(Graph):
   
-    @classmethod
     def __init__(self, model):
        # sanity check.
-        if not (type(model) == _keras.models.Sequential or type(model) == _keras.models.Model):
-            raise TypeError("Keras layer of type %s is not supported." % type(model))
+        if not isinstance(model, KerasConfigModel):
+            import keras as _keras
+            if not (type(model) == _keras.models.Sequential or type(model) == _keras.models.Model):
+                raise TypeError("Keras layer of type %s is not supported." % type(model))
         super(Keras2Graph, self).__init__(model)
         self.model = model
   
   
-    @classmethod
     def build(self):
         self.input_layers = list()
         for i, layer in enumerate(self.model.layers):
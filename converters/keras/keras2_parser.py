@@ -4,11 +4,18 @@ from __future__ import print_function
 
 import os
 
-import keras as _keras
 from converters.keras.keras2_graph import Keras2Graph
+from converters.keras.keras2_config import KerasConfigModel, load_json_model, load_h5_model
 import common.IR.graph_pb2 as graph_pb2
 from common.IR.graph_pb2 import NodeDef, GraphDef, DataType
 from common.DataStructure.parser import Parser
+from common.IR.IR_tensor import set_weight
+
+try:
+    basestring
+except NameError:
+    # Python 3
+    basestring = str
 
 
 class Keras2Parser(Parser):
@@ -69,37 +76,63 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
-    def __init__(self, model):
+    def __init__(self, model, use_keras = False):
+        """model is a .h5 file, a (network .json, weights .h5) tuple or a keras model.
+
+        Model files are read from their JSON config without Keras (see
+        keras2_config) unless use_keras is set, then Keras rebuilds the model.
+        """
         super(Keras2Parser, self).__init__()
 
         # load model files into Keras graph
         if isinstance(model, basestring):
-            model = _keras.models.load_model(model)
+            if use_keras:
+                import keras as _keras
+                model = _keras.models.load_model(model)
+            else:
+                model = load_h5_model(model)
+            self.weight_loaded = True
         elif isinstance(model, tuple):
-            model = Keras2Parser._load_model(model[0], model[1])
-
-        _keras.utils.plot_model(model, "model.png", show_shapes = True)
+            self.weight_loaded = os.path.isfile(model[1])
+            if use_keras:
+                model = Keras2Parser._load_model(model[0], model[1])
+            else:
+                model = load_json_model(model[0], model[1])
+        else:
+            self.weight_loaded = True
 
         # Build network graph
-        self.data_format = _keras.backend.image_data_format()
+        if isinstance(model, KerasConfigModel):
+            self.data_format = model.data_format
+        else:
+            import keras as _keras
+            from converters.keras import _check_keras_backend
+            _check_keras_backend(_keras)
+            _keras.utils.plot_model(model, "model.png", show_shapes = True)
+            self.data_format = _keras.backend.image_data_format()
         self.keras_graph =  Keras2Graph(model)
         self.keras_graph.build()
 
 
 
-    @classmethod
-    def gen_IR(self):
-        for layer in self.keras_graph.topological_sort:
-            current_node = self.keras_graph.get_node(layer)
-            node_type = current_node.type
+    def gen_IR(self, num_workers = 1):
+        if num_workers > 1:
+            self._gen_IR_by_level(self.keras_graph, self._convert_node, num_workers)
+        else:
+            for layer in self.keras_graph.topological_sort:
+                self._convert_node(self.keras_graph.get_node(layer))
 
-            if hasattr(self, "rename_" + node_type):
-                func = getattr(self, "rename_" + node_type)
-                func(current_node)
-            else:
-                print("KerasParser has not supported operator [%s]." % (node_type))
-                self.rename_UNKNOWN(current_node)
+
+
+    def _convert_node(self, current_node):
+        node_type = current_node.type
+
+        if hasattr(self, "rename_" + node_type):
+            func = getattr(self, "rename_" + node_type)
+            func(current_node)
+        else:
+            print("KerasParser has not supported operator [%s]." % (node_type))
+            self.rename_UNKNOWN(current_node)
 
 
 
@@ -138,26 +171,43 @@ class Keras2Parser(Parser):
     @staticmethod
     def _convert_dataformat(source_node, target_node):
         if source_node.keras_layer.data_format == 'channels_last':
-            target_node.attr["data_format"].s = "NHWC"
+            target_node.attr["data_format"].s = b"NHWC"
         elif source_node.keras_layer.data_format == 'channels_first':
-            target_node.attr["data_format"].s = "NCHW"
+            target_node.attr["data_format"].s = b"NCHW"
         else:
             print("Warning: [%s] don't have data format info." % (source_node.keras_layer.name))
 
 
 
+    @staticmethod
+    def _pooling_window(IR_node, h, w):
+        if "data_format" in IR_node.attr and IR_node.attr["data_format"].s == b"NCHW":
+            return [1, 1, h, w]
+        return [1, h, w, 1]
+
+
+
     @staticmethod
     def _convert_padding(source_node, target_node):
         if source_node.keras_layer.padding == 'valid':
-            target_node.attr["padding"].s = "VALID"
+            target_node.attr["padding"].s = b"VALID"
         elif source_node.keras_layer.padding == 'same':
-            target_node.attr["padding"].s = "SAME"
+            target_node.attr["padding"].s = b"SAME"
         else:
             print ("Error: Invalid embedding [%s]!" % (source_node.keras_layer.padding))
 
 
 
-    @classmethod
+    def _convert_weights(self, keras_node, IR_node, keys):
+        # without a weight file the layers only hold their initializer values
+        if not self.weight_loaded:
+            return
+
+        for key, weight in zip(keys, keras_node.keras_layer.get_weights()):
+            set_weight(IR_node, key, weight)
+
+
+
     def _defuse_activation(self, keras_node):
         if keras_node.keras_layer.activation == None:
             return
@@ -173,7 +223,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def _convert_convolution(self, keras_node, IR_node, dim):
          # name, op
         Keras2Parser._copy_and_reop(keras_node, IR_node)
@@ -204,12 +253,14 @@ class Keras2Parser(Parser):
         while len(IR_node.attr["strides"].list.i) < dim:
             IR_node.attr["strides"].list.i.append(IR_node.attr["strides"].list.i.at(0))
 
+        # weights
+        self._convert_weights(keras_node, IR_node, ["kernel", "bias"])
+
         # activation
         self._defuse_activation(keras_node)
 
 
 
-    @classmethod
     def _convert_padding_api(self, keras_node, IR_node, mode):
          # name, op
         Keras2Parser._copy_and_reop(keras_node, IR_node, "pad")
@@ -217,7 +268,7 @@ class Keras2Parser(Parser):
         # input edge
         Keras2Parser._convert_inedge(keras_node, IR_node, self.keras_graph.layer_name_map)
         
-        IR_node.attr['mode'].s = mode
+        IR_node.attr['mode'].s = mode.encode()
 
         # padding
         for e in keras_node.keras_layer.padding:
@@ -226,7 +277,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_UNKNOWN(self, source_node):
         # only for training
         IR_node = self.IR_graph.node.add()
@@ -239,7 +289,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_InputLayer(self, source_node):
         # only for training
         IR_node = self.IR_graph.node.add()
@@ -255,28 +304,24 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_Conv1D(self, keras_node):
         IR_node = self.IR_graph.node.add()        
         self._convert_convolution(keras_node, IR_node, 1)
 
 
 
-    @classmethod
     def rename_Conv2D(self, keras_node):
         IR_node = self.IR_graph.node.add()         
         self._convert_convolution(keras_node, IR_node, 2)
 
 
 
-    @classmethod
     def rename_Conv3D(self, source_node):
         IR_node = self.IR_graph.node.add()         
-        self._convert_convolution(keras_node, IR_node, 3)
+        self._convert_convolution(source_node, IR_node, 3)
        
 
 
-    @classmethod
     def rename_GlobalMaxPooling1D(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -288,7 +333,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_GlobalAveragePooling2D(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -300,7 +344,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_MaxPooling2D(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -313,6 +356,9 @@ class Keras2Parser(Parser):
         # padding
         Keras2Parser._convert_padding(source_node, IR_node)
 
+        # data_format, ksize and strides are laid out like the data
+        Keras2Parser._convert_dataformat(source_node, IR_node)
+
         # strides
         if isinstance(source_node.keras_layer.strides, tuple) or isinstance(source_node.keras_layer.strides, list):
             sh, sw = source_node.keras_layer.strides
@@ -320,10 +366,7 @@ class Keras2Parser(Parser):
             sh = source_node.keras_layer.strides
             sw = sh
 
-        IR_node.attr["strides"].list.i.append(1)
-        IR_node.attr["strides"].list.i.append(sh)
-        IR_node.attr["strides"].list.i.append(sw)
-        IR_node.attr["strides"].list.i.append(1)
+        IR_node.attr["strides"].list.i.extend(Keras2Parser._pooling_window(IR_node, sh, sw))
 
         # pool_size
         if isinstance(source_node.keras_layer.pool_size, tuple) or isinstance(source_node.keras_layer.pool_size, list):
@@ -332,15 +375,11 @@ class Keras2Parser(Parser):
             ph = source_node.keras_layer.pool_size
             pw = ph
     
-        IR_node.attr["ksize"].list.i.append(1)
-        IR_node.attr["ksize"].list.i.append(ph)
-        IR_node.attr["ksize"].list.i.append(pw)
-        IR_node.attr["ksize"].list.i.append(1)
+        IR_node.attr["ksize"].list.i.extend(Keras2Parser._pooling_window(IR_node, ph, pw))
 
 
 
 
-    @classmethod
     def rename_Dropout(self, source_node):
         # only for training
         IR_node = self.IR_graph.node.add()
@@ -357,7 +396,6 @@ class Keras2Parser(Parser):
   
 
 
-    @classmethod
     def rename_Dense(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -373,12 +411,14 @@ class Keras2Parser(Parser):
         # use_bias
         IR_node.attr["use_bias"].b = source_node.keras_layer.use_bias
 
+        # weights
+        self._convert_weights(source_node, IR_node, ["kernel", "bias"])
+
         # activation
         self._defuse_activation(source_node)
 
 
 
-    @classmethod
     def rename_Flatten(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -390,7 +430,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_Activation(self, keras_node):
         IR_node = self.IR_graph.node.add()
 
@@ -402,7 +441,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_Embedding(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -421,9 +459,11 @@ class Keras2Parser(Parser):
         # mask_zero
         IR_node.attr["mask_zero"].b = source_node.keras_layer.mask_zero
 
+        # weights
+        self._convert_weights(source_node, IR_node, ["embeddings"])
+
 
 
-    @classmethod
     def rename_LSTM(self, keras_node):
         IR_node = self.IR_graph.node.add()
 
@@ -443,12 +483,17 @@ class Keras2Parser(Parser):
         IR_node.attr["dropout"].f = keras_node.keras_layer.dropout
         IR_node.attr["recurrent_dropout"].f = keras_node.keras_layer.recurrent_dropout
 
+        # return_sequences
+        IR_node.attr["return_sequences"].b = keras_node.keras_layer.return_sequences
+
+        # weights
+        self._convert_weights(keras_node, IR_node, ["kernel", "recurrent_kernel", "bias"])
+
         # activation
         self._defuse_activation(keras_node)
 
 
 
-    @classmethod
     def rename_GRU(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -461,12 +506,17 @@ class Keras2Parser(Parser):
         # units
         IR_node.attr["units"].i = source_node.keras_layer.units
 
+        # return_sequences
+        IR_node.attr["return_sequences"].b = source_node.keras_layer.return_sequences
+
+        # weights
+        self._convert_weights(source_node, IR_node, ["kernel", "recurrent_kernel", "bias"])
+
         # activation
         self._defuse_activation(source_node)
 
 
 
-    @classmethod
     def rename_Add(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -478,7 +528,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_Concatenate(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -488,13 +537,15 @@ class Keras2Parser(Parser):
         # input edge
         Keras2Parser._convert_inedge(source_node, IR_node, self.keras_graph.layer_name_map)
 
+        # axis
+        IR_node.attr['axis'].i = source_node.keras_layer.axis
+
 
-    @classmethod
     def rename_Reshape(self, source_node):
         IR_node = self.IR_graph.node.add()
 
         # name, op
-        Keras2Parser._copy_and_reop(source_node, IR_node, 'Concat')
+        Keras2Parser._copy_and_reop(source_node, IR_node, 'Reshape')
         
         # input edge
         Keras2Parser._convert_inedge(source_node, IR_node, self.keras_graph.layer_name_map)
@@ -504,7 +555,6 @@ class Keras2Parser(Parser):
             IR_node.attr["Tshape"].list.i.append(e)
 
 
-    @classmethod
     def rename_Lambda(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -514,7 +564,7 @@ class Keras2Parser(Parser):
         # input edge
         Keras2Parser._convert_inedge(source_node, IR_node, self.keras_graph.layer_name_map)
 
-        IR_node.attr['function'].s = source_node.keras_layer.function.__name__
+        IR_node.attr['function'].s = source_node.keras_layer.function.__name__.encode()
         for dim in source_node.keras_layer.output_shape:
             new_dim = IR_node.attr["output_shape"].shape.dim.add()
             if dim == None:
@@ -527,7 +577,6 @@ class Keras2Parser(Parser):
 
 
 
-    @classmethod
     def rename_BatchNormalization(self, keras_node):
         IR_node = self.IR_graph.node.add()
 
@@ -543,16 +592,28 @@ class Keras2Parser(Parser):
         # scale
         IR_node.attr['scale'].b = keras_node.keras_layer.scale
 
+        # center
+        IR_node.attr['center'].b = keras_node.keras_layer.center
+
+        # epsilon
+        IR_node.attr['epsilon'].f = keras_node.keras_layer.epsilon
+
+        # weights, gamma and beta only exist with scale and center
+        keys = list()
+        if keras_node.keras_layer.scale:
+            keys.append("gamma")
+        if keras_node.keras_layer.center:
+            keys.append("beta")
+        self._convert_weights(keras_node, IR_node, keys + ["mean", "var"])
+
 
 
-    @classmethod
     def rename_ZeroPadding2D(self, keras_node):
         IR_node = self.IR_graph.node.add()
         self._convert_padding_api(keras_node, IR_node, "CONSTANT")
 
 
 
-    @classmethod
     def rename_AveragePooling2D(self, source_node):
         IR_node = self.IR_graph.node.add()
 
@@ -565,6 +626,9 @@ class Keras2Parser(Parser):
         # padding
         Keras2Parser._convert_padding(source_node, IR_node)
 
+        # data_format, ksize and strides are laid out like the data
+        Keras2Parser._convert_dataformat(source_node, IR_node)
+
         # strides
         if isinstance(source_node.keras_layer.strides, tuple) or isinstance(source_node.keras_layer.strides, list):
             sh, sw = source_node.keras_layer.strides
@@ -572,10 +636,7 @@ class Keras2Parser(Parser):
             sh = source_node.keras_layer.strides
             sw = sh
 
-        IR_node.attr["strides"].list.i.append(1)
-        IR_node.attr["strides"].list.i.append(sh)
-        IR_node.attr["strides"].list.i.append(sw)
-        IR_node.attr["strides"].list.i.append(1)
+        IR_node.attr["strides"].list.i.extend(Keras2Parser._pooling_window(IR_node, sh, sw))
 
         # pool_size
         if isinstance(source_node.keras_layer.pool_size, tuple) or isinstance(source_node.keras_layer.pool_size, list):
@@ -584,7 +645,4 @@ class Keras2Parser(Parser):
             ph = source_node.keras_layer.pool_size
             pw = ph
     
-        IR_node.attr["ksize"].list.i.append(1)
-        IR_node.attr["ksize"].list.i.append(ph)
-        IR_node.attr["ksize"].list.i.append(pw)
-        IR_node.attr["ksize"].list.i.append(1)
+        IR_node.attr["ksize"].list.i.extend(Keras2Parser._pooling_window(IR_node, ph, pw))
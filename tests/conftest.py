@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the converter imports its packages (common, converters, _scripts) from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from google.protobuf import json_format, text_format
+
+import common.IR.IR_io as IR_io
+from common.IR.graph_pb2 import GraphDef
+from common.IR.IR_tensor import set_weight
+
+
+def _graph():
+    graph = GraphDef(version = 3)
+    graph.node.add(name = "data", op = "DataInput")
+    conv = graph.node.add(name = "conv", op = "Conv2D", input = ["data"])
+    conv.attr["strides"].list.i.extend([1, 1])
+    conv.attr["padding"].s = b"VALID"
+    conv.attr["use_bias"].b = True
+    set_weight(conv, "kernel", np.arange(3 * 3 * 4 * 8, dtype = np.float32).reshape(3, 3, 4, 8))
+    set_weight(conv, "bias", np.zeros(8, dtype = np.float32))
+    graph.node.add(name = "relu", op = "Relu", input = ["conv"])
+    return graph
+
+
+
+class IRWriterTest(unittest.TestCase):
+
+    graphs = {
+        "model"   : _graph(),
+        "empty"   : GraphDef(),
+        "version" : GraphDef(version = 3),
+        "nodes"   : GraphDef(node = [_graph().node[0]]),
+        }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def _write(self, writer, graph, mode = "r"):
+        path = os.path.join(self.directory, "graph")
+        writer(graph, path)
+        with open(path, mode) as fin:
+            return fin.read()
+
+
+    def test_binary(self):
+        for name, graph in self.graphs.items():
+            data = self._write(IR_io.write_binary, graph, "rb")
+            self.assertEqual(data, graph.SerializeToString(), name)
+            self.assertEqual(GraphDef.FromString(data), graph, name)
+
+
+    def test_text(self):
+        for name, graph in self.graphs.items():
+            data = self._write(IR_io.write_text, graph)
+            self.assertEqual(data, text_format.MessageToString(graph), name)
+            self.assertEqual(text_format.Parse(data, GraphDef()), graph, name)
+
+
+    def test_json(self):
+        for name, graph in self.graphs.items():
+            data = self._write(IR_io.write_json, graph)
+            self.assertEqual(data, json_format.MessageToJson(graph, preserving_proto_field_name = True), name)
+            self.assertEqual(json_format.Parse(data, GraphDef()), graph, name)
+
+
+    def test_json_base64_chunks(self):
+        # tensor contents longer than a chunk are encoded chunk by chunk
+        chunk_size = IR_io.BASE64_CHUNK_SIZE
+        IR_io.BASE64_CHUNK_SIZE = 6
+        try:
+            data = self._write(IR_io.write_json, self.graphs["model"])
+        finally:
+            IR_io.BASE64_CHUNK_SIZE = chunk_size
+        self.assertEqual(data, json_format.MessageToJson(self.graphs["model"], preserving_proto_field_name = True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import converters.caffe.caffe_pb2 as caffe_pb2
+from common.IR.IR_tensor import get_weight
+from converters.caffe.caffe_parser import CaffeParser
+from converters.caffe.caffe_weights import CaffeModelReader, blob_proto_to_ndarray, load_caffemodel
+
+
+_PROTOTXT = """
+name: "model"
+layer { name: "data" type: "Input" top: "data" input_param { shape { dim: 1 dim: 2 dim: 5 dim: 5 } } }
+layer { name: "conv" type: "Convolution" bottom: "data" top: "conv"
+        convolution_param { num_output: 3 kernel_size: 2 stride: 2 } }
+layer { name: "relu" type: "ReLU" bottom: "conv" top: "conv" }
+layer { name: "ip" type: "InnerProduct" bottom: "conv" top: "ip" inner_product_param { num_output: 4 } }
+"""
+
+
+def _blob(blob, array, double = False, legacy = False):
+    if legacy:
+        # deprecated num/channels/height/width dims
+        blob.num, blob.channels, blob.height, blob.width = (1,) * (4 - array.ndim) + array.shape
+    else:
+        blob.shape.dim.extend(array.shape)
+    if double:
+        blob.double_data.extend(array.reshape(-1).tolist())
+    else:
+        blob.data.extend(array.reshape(-1).tolist())
+
+
+
+class CaffeWeightsTest(unittest.TestCase):
+
+    kernel = np.arange(3 * 2 * 2 * 2, dtype = np.float32).reshape(3, 2, 2, 2) / 8
+    bias = np.array([0.5, -1.0, 2.0], dtype = np.float32)
+    # fully connected weights of a legacy model, (out, in)
+    ip_kernel = np.arange(4 * 12, dtype = np.float32).reshape(4, 12) - 20
+    ip_bias = np.arange(4, dtype = np.float64) / 3
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.caffemodel = os.path.join(self.directory, "model.caffemodel")
+        net = caffe_pb2.NetParameter(name = "model")
+        conv = net.layer.add(name = "conv", type = "Convolution")
+        _blob(conv.blobs.add(), self.kernel)
+        _blob(conv.blobs.add(), self.bias)
+        net.layer.add(name = "relu", type = "ReLU")
+        ip = net.layers.add(name = "ip", type = caffe_pb2.V1LayerParameter.INNER_PRODUCT)
+        _blob(ip.blobs.add(), self.ip_kernel, legacy = True)
+        _blob(ip.blobs.add(), self.ip_bias, double = True)
+        with open(self.caffemodel, "wb") as of:
+            of.write(net.SerializeToString())
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_load_caffemodel(self):
+        weights = load_caffemodel(self.caffemodel)
+        # layers without blobs are left out, legacy layers entries (field 2, first on the wire) are read
+        self.assertEqual(list(weights), ["ip", "conv"])
+        kernel, bias = weights["conv"]
+        self.assertEqual(kernel.dtype, np.float32)
+        np.testing.assert_array_equal(kernel, self.kernel)
+        np.testing.assert_array_equal(bias, self.bias)
+
+        ip_kernel, ip_bias = weights["ip"]
+        self.assertEqual(ip_kernel.shape, (1, 1, 4, 12))
+        np.testing.assert_array_equal(ip_kernel.reshape(4, 12), self.ip_kernel)
+        self.assertEqual(ip_bias.dtype, np.float64)
+        np.testing.assert_array_equal(ip_bias.reshape(-1), self.ip_bias)
+
+
+    def test_reader_layers(self):
+        with CaffeModelReader(self.caffemodel) as reader:
+            layers = [(type(layer).__name__, layer.name, len(layer.blobs), len(blobs)) for layer, blobs in reader]
+        # parsed without their blobs, which come as arrays
+        self.assertEqual(layers, [
+            ("V1LayerParameter", "ip", 0, 2),
+            ("LayerParameter", "conv", 0, 2),
+            ("LayerParameter", "relu", 0, 0),
+            ])
+
+
+    def test_blob_proto_to_ndarray(self):
+        blob = caffe_pb2.BlobProto()
+        _blob(blob, self.kernel)
+        np.testing.assert_array_equal(blob_proto_to_ndarray(blob), self.kernel)
+        blob = caffe_pb2.BlobProto()
+        _blob(blob, self.ip_bias, double = True)
+        self.assertEqual(blob_proto_to_ndarray(blob).dtype, np.float64)
+        self.assertEqual(blob_proto_to_ndarray(caffe_pb2.BlobProto()).size, 0)
+
+
+    def test_parser_weights(self):
+        prototxt = os.path.join(self.directory, "model.prototxt")
+        with open(prototxt, "w") as of:
+            of.write(_PROTOTXT)
+        parser = CaffeParser((prototxt, self.caffemodel), "TEST")
+        parser.gen_IR()
+        nodes = dict((node.name, node) for node in parser.IR_graph.node)
+
+        # caffe OIHW kernels become HWIO
+        conv = nodes["conv"]
+        self.assertEqual(get_weight(conv, "kernel").shape, (2, 2, 2, 3))
+        np.testing.assert_array_equal(get_weight(conv, "kernel"), self.kernel.transpose(2, 3, 1, 0))
+        np.testing.assert_array_equal(get_weight(conv, "bias"), self.bias)
+        self.assertEqual(list(conv.attr["filter"].list.i), [2, 2, 2, 3])
+
+        # (out, in) fully connected weights become (in, out), double_data stays float64
+        ip = nodes["ip"]
+        np.testing.assert_array_equal(get_weight(ip, "kernel"), self.ip_kernel.T)
+        self.assertEqual(get_weight(ip, "bias").dtype, np.float64)
+        np.testing.assert_array_equal(get_weight(ip, "bias"), self.ip_bias)
+
+
+if __name__ == "__main__":
+    unittest.main()
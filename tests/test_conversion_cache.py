@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from _scripts.conversion_cache import ConversionCache, converter_fingerprint
+
+
+class ConversionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ConversionCache(self._path("cache"))
+        self.source = self._write("model.prototxt", "layer {}")
+        self.output = self._path("out", "model.json")
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+
+    def _write(self, name, content):
+        path = self._path(name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as of:
+            of.write(content)
+        return path
+
+
+    def _key(self, options = None):
+        return self.cache.key({"caffeProtoTxtPath" : self.source}, options or {"irFormat" : "json"})
+
+
+    def test_hit_and_miss(self):
+        key = self._key()
+        self.assertFalse(self.cache.restore(key, {"ir_json" : self.output}))
+
+        self._write(os.path.join("out", "model.json"), "{}")
+        self.cache.store(key, {"ir_json" : self.output})
+        os.remove(self.output)
+        self.assertTrue(self.cache.restore(key, {"ir_json" : self.output}))
+        with open(self.output, "r") as fin:
+            self.assertEqual(fin.read(), "{}")
+
+        # other options, or other outputs, are another conversion
+        self.assertNotEqual(self._key({"irFormat" : "text"}), key)
+        self.assertFalse(self.cache.restore(key, {"ir_text" : self.output}))
+
+
+    def test_source_change_invalidates(self):
+        key = self._key()
+        self.assertEqual(self._key(), key)
+        # same size, so the (size, mtime) memo must not hide the change
+        self._write("model.prototxt", "layer {x}")
+        os.utime(self.source, (0, 0))
+        self.assertNotEqual(self._key(), key)
+
+
+    def test_missing_blob_is_a_miss(self):
+        key = self._key()
+        self._write(os.path.join("out", "model.json"), "{}")
+        self.cache.store(key, {"ir_json" : self.output}, ["digest"])
+        self.assertFalse(self.cache.restore(key, {"ir_json" : self.output}, lambda digest: False))
+        self.assertTrue(self.cache.restore(key, {"ir_json" : self.output}, lambda digest: True))
+
+
+    def test_fingerprint_covers_converter_sources_only(self):
+        root = self._path("package")
+        for name in ("common/a.py", "converters/b.proto", "_scripts/c.py", "tests/test_d.py", "example/e.py"):
+            self._write(os.path.join("package", name), "x = 1\n")
+        fingerprint = converter_fingerprint(root)
+
+        self._write(os.path.join("package", "tests", "test_d.py"), "x = 2\n")
+        self._write(os.path.join("package", "example", "e.py"), "x = 2\n")
+        self.assertEqual(converter_fingerprint(root), fingerprint)
+
+        self._write(os.path.join("package", "converters", "b.proto"), "x = 2\n")
+        self.assertNotEqual(converter_fingerprint(root), fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
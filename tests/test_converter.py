@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LENET = os.path.join(_ROOT, "example", "caffe", "lenet_train_test.prototxt")
+
+
+class ConverterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # the text parse cache is written next to the prototxt
+        self.prototxt = os.path.join(self.directory, "lenet.prototxt")
+        shutil.copy(_LENET, self.prototxt)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+
+    def _run(self, *argv):
+        """Run the converter command line in a new interpreter; returns its exit code and output."""
+        process = subprocess.Popen([sys.executable, _ROOT] + list(argv), cwd = self.directory,
+                stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+        output = process.communicate()[0].decode("utf-8", "replace")
+        return process.returncode, output
+
+
+    def test_batch_manifest(self):
+        manifest = self._path("manifest.json")
+        with open(manifest, "w") as of:
+            json.dump([
+                {"srcModelPath" : self._path("lenet.caffemodel"), "caffeProtoTxtPath" : self.prototxt,
+                 "dstModelPath" : self._path("out", "lenet.json")},
+                {"srcModelPath" : self._path("missing.caffemodel"), "caffeProtoTxtPath" : self._path("missing.prototxt"),
+                 "dstModelPath" : self._path("out", "missing.json")},
+                ], of)
+
+        ret, output = self._run("--batchManifest", manifest, "--batchWorkers", "2",
+                "--batchSummary", self._path("summary.json"), "--no-cache")
+        self.assertEqual(ret, 1, output)
+        with open(self._path("summary.json"), "r") as fin:
+            summary = json.load(fin)
+        self.assertEqual([e["status"] for e in summary], ["ok", "failed"])
+        self.assertTrue(os.path.isfile(self._path("out", "lenet.json")))
+        self.assertFalse(os.path.isfile(self._path("out", "missing.json")))
+
+
+    def test_caffe_imports_no_keras(self):
+        script = "\n".join([
+            "import sys",
+            "from _scripts.converter import _run",
+            "ret = _run(sys.argv[1:])",
+            "print(sorted(e for e in sys.modules if e.split('.')[0] in ('keras', 'tensorflow', 'h5py') or e.startswith('converters.keras')))",
+            "sys.exit(ret)",
+            ])
+        process = subprocess.Popen([sys.executable, "-c", script,
+                "--caffeProtoTxtPath", self.prototxt, "--srcModelPath", self._path("lenet.caffemodel"),
+                "--dstModelPath", self._path("lenet.json"), "--no-cache"],
+                cwd = _ROOT, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+        output = process.communicate()[0].decode("utf-8", "replace")
+        self.assertEqual(process.returncode, 0, output)
+        self.assertEqual(output.splitlines()[-1], "[]")
+
+
+    def test_profile_startup(self):
+        ret, output = self._run("--profile-startup", "--caffeProtoTxtPath", self.prototxt,
+                "--srcModelPath", self._path("lenet.caffemodel"), "--dstModelPath", self._path("lenet.json"), "--no-cache")
+        self.assertEqual(ret, 0, output)
+        self.assertIn("modules imported in", output)
+
+
+    def test_conversion_cache(self):
+        # a weight file without blobs, the cache key needs every source to exist
+        from converters.caffe.caffe_pb2 import NetParameter
+        with open(self._path("lenet.caffemodel"), "wb") as of:
+            of.write(NetParameter(name = "LeNet").SerializeToString())
+        argv = ["--caffeProtoTxtPath", self.prototxt, "--srcModelPath", self._path("lenet.caffemodel"),
+                "--dstModelPath", self._path("lenet.json"), "--cacheDir", self._path("cache")]
+        for hit in (False, True):
+            ret, output = self._run(*argv)
+            self.assertEqual(ret, 0, output)
+            self.assertEqual("Conversion cache hit" in output, hit, output)
+
+        with open(self.prototxt, "a") as of:
+            of.write("\n")
+        ret, output = self._run(*argv)
+        self.assertEqual(ret, 0, output)
+        self.assertNotIn("Conversion cache hit", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
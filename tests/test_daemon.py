@@ -0,0 +1,141 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import sys
+import time
+import shutil
+import signal
+import tempfile
+import threading
+import unittest
+
+import _scripts.converter as converter
+import _scripts.daemon as daemon
+
+
+_LENET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "example", "caffe", "lenet_train_test.prototxt")
+
+
+def _sleeping_run(argv):
+    # stands for a long conversion, in the pool workers forked from the test
+    with open(argv[0], "w") as of:
+        of.write(str(os.getpid()))
+    print("started")
+    sys.stdout.flush()
+    time.sleep(float(argv[1]))
+    return 0
+
+
+
+@unittest.skipUnless(daemon._HAS_UNIX_SOCKETS, "the daemon tests use a Unix domain socket")
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, "daemon.sock")
+        self.poll_interval = daemon._POLL_INTERVAL
+        daemon._POLL_INTERVAL = 0.1
+        self.thread = None
+
+
+    def tearDown(self):
+        if self.thread is not None and self.thread.is_alive():
+            daemon.daemon_main(["--socket", self.address, "--stop"])
+            self.thread.join(30)
+        daemon._POLL_INTERVAL = self.poll_interval
+        shutil.rmtree(self.directory)
+
+
+    def _start(self):
+        server = daemon.ConversionDaemon(self.address, 2)
+        self.thread = threading.Thread(target = server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        deadline = time.time() + 30
+        while not os.path.exists(self.address):
+            self.assertLess(time.time(), deadline, "the daemon did not start")
+            time.sleep(0.05)
+
+
+    def _send(self, *argv):
+        out = io.StringIO()
+        ret = daemon.send_job({"argv" : list(argv), "cwd" : self.directory}, self.address, out)
+        return ret, out.getvalue()
+
+
+    def test_jobs_cache_hit_and_stop(self):
+        self._start()
+        prototxt = os.path.join(self.directory, "lenet.prototxt")
+        shutil.copy(_LENET, prototxt)
+        # a weight file without blobs, the cache key needs every source to exist
+        from converters.caffe.caffe_pb2 import NetParameter
+        with open(os.path.join(self.directory, "lenet.caffemodel"), "wb") as of:
+            of.write(NetParameter(name = "LeNet").SerializeToString())
+        argv = ["--caffeProtoTxtPath", "lenet.prototxt", "--srcModelPath", "lenet.caffemodel",
+                "--dstModelPath", "lenet.json", "--cacheDir", os.path.join(self.directory, "cache")]
+
+        ret, output = self._send(*argv)
+        self.assertEqual(ret, 0, output)
+        self.assertIn("IR saved as", output)
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, "lenet.json")))
+
+        ret, output = self._send(*argv)
+        self.assertEqual(ret, 0, output)
+        self.assertIn("Conversion cache hit", output)
+
+        ret, output = self._send("--caffeProtoTxtPath", "missing.prototxt", "--dstModelPath", "missing.json", "--no-cache")
+        self.assertNotEqual(ret, 0, output)
+
+        self.assertEqual(daemon.daemon_main(["--socket", self.address, "--stop"]), 0)
+        self.thread.join(30)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.address))
+        self.assertEqual(daemon.daemon_main(["--socket", self.address, "--stop"]), 1)
+
+
+    @unittest.skipUnless(hasattr(os, "fork"), "the workers must inherit the patched converter")
+    def test_worker_death(self):
+        run = converter._run
+        converter._run = _sleeping_run
+        try:
+            self._start()
+        finally:
+            converter._run = run
+        pid_path = os.path.join(self.directory, "worker.pid")
+
+        def kill_worker():
+            deadline = time.time() + 30
+            while not os.path.isfile(pid_path) and time.time() < deadline:
+                time.sleep(0.05)
+            time.sleep(0.2)
+            with open(pid_path, "r") as fin:
+                os.kill(int(fin.read()), signal.SIGKILL)
+        killer = threading.Thread(target = kill_worker)
+        killer.start()
+
+        start = time.time()
+        ret, output = self._send(pid_path, "60")
+        killer.join()
+        self.assertEqual(ret, 1, output)
+        self.assertIn("started", output)
+        self.assertIn("the conversion worker died", output)
+        self.assertLess(time.time() - start, 30)
+
+        # the pool replaced the worker, the daemon keeps serving
+        os.remove(pid_path)
+        ret, output = self._send(pid_path, "0")
+        self.assertEqual(ret, 0, output)
+
+
+    def test_token_comparison(self):
+        self.assertTrue(daemon._same_token(u"abc", u"abc"))
+        self.assertFalse(daemon._same_token(u"abd", u"abc"))
+        self.assertFalse(daemon._same_token(None, u"abc"))
+        self.assertFalse(daemon._same_token(12, u"abc"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+from common.IR.graph_pb2 import GraphDef, NodeDef
+from common.IR.IR_tensor import get_weight, set_weight
+from common.IR.passes.fold_batchnorm import FoldBatchNorm
+
+
+def _conv2d_nhwc(x, kernel, bias):
+    # valid padding, stride 1, kernel in (height, width, in, out) layout
+    kh, kw = kernel.shape[:2]
+    oh, ow = x.shape[1] - kh + 1, x.shape[2] - kw + 1
+    out = np.zeros((x.shape[0], oh, ow, kernel.shape[-1]))
+    for i in range(oh):
+        for j in range(ow):
+            out[:, i, j, :] = np.tensordot(x[:, i : i + kh, j : j + kw, :], kernel, axes = 3)
+    return out + bias
+
+
+def _batchnorm(x, bn, axis):
+    shape = [1] * x.ndim
+    shape[axis] = -1
+    params = [get_weight(bn, key).reshape(shape) for key in ("gamma", "beta", "mean", "var")]
+    gamma, beta, mean, var = params
+    return gamma * (x - mean) / np.sqrt(var + bn.attr["epsilon"].f) + beta
+
+
+
+class FoldBatchNormTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+
+    def _graph(self, op, kernel, axis, data_format = None):
+        graph = GraphDef()
+        data = graph.node.add(name = "data", op = "DataInput")
+        producer = graph.node.add(name = "producer", op = op, input = [data.name])
+        if op != "Fully_connected":
+            producer.attr["strides"].list.i.extend([1] * (kernel.ndim - 2))
+        if data_format is not None:
+            producer.attr["data_format"].s = data_format
+        set_weight(producer, "kernel", kernel)
+        set_weight(producer, "bias", self.rng.randn(kernel.shape[-1]).astype(np.float32))
+        producer.attr["use_bias"].b = True
+
+        channels = kernel.shape[-1]
+        bn = graph.node.add(name = "bn", op = "BatchNorm", input = [producer.name])
+        bn.attr["axis"].i = axis
+        bn.attr["epsilon"].f = 1e-3
+        set_weight(bn, "gamma", self.rng.uniform(0.5, 2.0, channels).astype(np.float32))
+        set_weight(bn, "beta", self.rng.randn(channels).astype(np.float32))
+        set_weight(bn, "mean", self.rng.randn(channels).astype(np.float32))
+        set_weight(bn, "var", self.rng.uniform(0.1, 2.0, channels).astype(np.float32))
+        graph.node.add(name = "output", op = "Relu", input = [bn.name])
+        return graph
+
+
+    @staticmethod
+    def _nodes(graph):
+        return dict((node.name, node) for node in graph.node)
+
+
+    def _fold(self, graph):
+        """Run the pass; returns the folded producer and a copy of the removed BatchNorm."""
+        bn = NodeDef()
+        bn.CopyFrom(self._nodes(graph)["bn"])
+        self.assertTrue(FoldBatchNorm().run(graph))
+        nodes = self._nodes(graph)
+        self.assertNotIn("bn", nodes)
+        self.assertEqual(list(nodes["output"].input), ["producer"])
+        return nodes["producer"], bn
+
+
+    def test_conv2d_nhwc(self):
+        kernel = self.rng.randn(3, 3, 4, 8).astype(np.float32)
+        graph = self._graph("Conv2D", kernel, -1, b"NHWC")
+        bias = get_weight(graph.node[1], "bias")
+        x = self.rng.randn(2, 7, 7, 4)
+
+        producer, bn = self._fold(graph)
+        expected = _batchnorm(_conv2d_nhwc(x, kernel, bias), bn, -1)
+        folded = _conv2d_nhwc(x, get_weight(producer, "kernel"), get_weight(producer, "bias"))
+        np.testing.assert_allclose(folded, expected, rtol = 1e-4, atol = 1e-4)
+
+
+    def test_conv2d_nchw(self):
+        # channels on axis 1, the kernel keeps its output channels last
+        kernel = self.rng.randn(3, 3, 4, 8).astype(np.float32)
+        graph = self._graph("Conv2D", kernel, 1, b"NCHW")
+        bias = get_weight(graph.node[1], "bias")
+        x = self.rng.randn(2, 4, 7, 7)
+
+        def conv_nchw(kernel, bias):
+            return _conv2d_nhwc(x.transpose(0, 2, 3, 1), kernel, bias).transpose(0, 3, 1, 2)
+
+        producer, bn = self._fold(graph)
+        expected = _batchnorm(conv_nchw(kernel, bias), bn, 1)
+        folded = conv_nchw(get_weight(producer, "kernel"), get_weight(producer, "bias"))
+        np.testing.assert_allclose(folded, expected, rtol = 1e-4, atol = 1e-4)
+
+
+    def test_fully_connected(self):
+        kernel = self.rng.randn(16, 10).astype(np.float32)
+        graph = self._graph("Fully_connected", kernel, -1)
+        bias = get_weight(graph.node[1], "bias")
+        x = self.rng.randn(5, 16)
+
+        producer, bn = self._fold(graph)
+        expected = _batchnorm(x.dot(kernel) + bias, bn, -1)
+        folded = x.dot(get_weight(producer, "kernel")) + get_weight(producer, "bias")
+        np.testing.assert_allclose(folded, expected, rtol = 1e-4, atol = 1e-4)
+
+
+    def test_non_channel_axis_is_kept(self):
+        kernel = self.rng.randn(3, 3, 4, 8).astype(np.float32)
+        for data_format, axis in ((b"NCHW", -1), (b"NHWC", 1)):
+            graph = self._graph("Conv2D", kernel, axis, data_format)
+            self.assertFalse(FoldBatchNorm().run(graph))
+            self.assertIn("bn", self._nodes(graph))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
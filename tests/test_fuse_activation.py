@@ -0,0 +1,29 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from common.IR.graph_pb2 import GraphDef
+from common.IR.passes.fuse_activation import FuseActivation
+
+
+class FuseActivationTest(unittest.TestCase):
+
+    def test_softmax_is_not_fused(self):
+        graph = GraphDef()
+        graph.node.add(name = "data", op = "DataInput")
+        graph.node.add(name = "fc1", op = "Fully_connected", input = ["data"])
+        graph.node.add(name = "relu", op = "Relu", input = ["fc1"])
+        graph.node.add(name = "fc2", op = "Fully_connected", input = ["relu"])
+        graph.node.add(name = "prob", op = "Softmax", input = ["fc2"])
+
+        self.assertTrue(FuseActivation().run(graph))
+        self.assertEqual([e.name for e in graph.node], ["data", "fc1", "fc2", "prob"])
+        self.assertEqual(graph.node[1].attr["fused_activation"].s, b"Relu")
+        self.assertEqual(list(graph.node[2].input), ["fc1"])
+        self.assertFalse("fused_activation" in graph.node[2].attr)
+
+
+if __name__ == "__main__":
+    unittest.main()
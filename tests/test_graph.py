@@ -0,0 +1,109 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import unittest
+
+from common.IR.graph_pb2 import GraphDef
+from common.IR.IR_graph import IRGraph
+from common.IR.IR_csr_graph import IRCSRGraph
+from converters.keras.keras2_parser import Keras2Parser
+
+
+def _chain_graph():
+    # data -> a -> b -> c, data -> c
+    graph = GraphDef()
+    graph.node.add(name = "data", op = "DataInput")
+    graph.node.add(name = "a", op = "Conv2D", input = ["data"])
+    graph.node.add(name = "b", op = "Dropout", input = ["a"])
+    graph.node.add(name = "c", op = "Add", input = ["b", "data"])
+    IR_graph = IRGraph(graph)
+    IR_graph.build()
+    return IR_graph
+
+
+
+class IncrementalGraphTest(unittest.TestCase):
+
+    def assertValidOrder(self, IR_graph):
+        position = dict((name, idx) for idx, name in enumerate(IR_graph.topological_sort))
+        self.assertEqual(set(position), set(IR_graph.layer_map))
+        for name, node in IR_graph.layer_map.items():
+            for succ in node.out_edges:
+                self.assertLess(position[name], position[succ])
+
+
+    def test_remove_IR_node_reconnects_consumers(self):
+        IR_graph = _chain_graph()
+        IR_graph.remove_IR_node("b")
+        self.assertEqual(list(IR_graph.layer_map["c"].IR_layer.input), ["a", "data"])
+        self.assertEqual(IR_graph.layer_map["a"].out_edges, ["c"])
+        self.assertNotIn("b", IR_graph.topological_sort)
+        self.assertValidOrder(IR_graph)
+
+        self.assertTrue(IR_graph.compact())
+        self.assertEqual([node.name for node in IR_graph.model.node], ["data", "a", "c"])
+        self.assertIs(IR_graph.layer_map["c"].IR_layer, IR_graph.model.node[2])
+
+
+    def test_input_and_output_layers(self):
+        IR_graph = _chain_graph()
+        self.assertEqual(list(IR_graph.input_layers), ["data"])
+        self.assertEqual(list(IR_graph.output_layers), ["c"])
+
+        IR_graph.remove_IR_node("c")
+        self.assertEqual(list(IR_graph.output_layers), ["b"])
+        IR_graph.remove_IR_node("data")
+        self.assertEqual(list(IR_graph.input_layers), ["a"])
+        self.assertValidOrder(IR_graph)
+
+
+    def test_insert_IR_node(self):
+        IR_graph = _chain_graph()
+        IR_node = IR_graph.model.node.add(name = "d", op = "Relu", input = ["c"])
+        IR_graph.insert_IR_node(IR_node, after = "data")
+        self.assertEqual(list(IR_graph.output_layers), ["d"])
+        self.assertValidOrder(IR_graph)
+
+        with self.assertRaises(ValueError):
+            IR_graph.insert_edge("d", "a")
+        self.assertValidOrder(IR_graph)
+
+
+class CSRGraphTest(unittest.TestCase):
+
+    def assertSameAdjacency(self, model):
+        IR_graph = IRGraph(model)
+        IR_graph.build()
+        csr_graph = IRCSRGraph(model)
+        csr_graph.build()
+        self.assertEqual(csr_graph.names, [node.name for node in model.node])
+        for name, node in IR_graph.layer_map.items():
+            csr_node = csr_graph.get_node(name)
+            self.assertEqual(csr_node.in_edges, list(node.in_edges))
+            self.assertEqual(sorted(csr_node.out_edges), sorted(node.out_edges))
+        self.assertEqual(sorted(csr_graph.input_layers), sorted(IR_graph.input_layers))
+        self.assertEqual(sorted(csr_graph.output_layers), sorted(IR_graph.output_layers))
+
+        position = dict((name, idx) for idx, name in enumerate(csr_graph.topological_sort))
+        self.assertEqual(len(position), len(model.node))
+        for node in model.node:
+            for pred in node.input:
+                self.assertLess(position[pred], position[node.name])
+
+
+    def test_chain_graph(self):
+        self.assertSameAdjacency(_chain_graph().model)
+
+
+    def test_keras_resnet50(self):
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "example", "keras", "resnet50.json")
+        parser = Keras2Parser((path, ""))
+        parser.gen_IR()
+        self.assertSameAdjacency(parser.IR_graph)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
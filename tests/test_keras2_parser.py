@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import unittest
+
+from converters.keras.keras2_parser import Keras2Parser
+
+
+_EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "example", "keras")
+
+
+def _convert(name):
+    # the JSON config path, without Keras
+    parser = Keras2Parser((os.path.join(_EXAMPLES, name + ".json"), ""))
+    parser.gen_IR()
+    return parser.IR_graph
+
+
+def _nodes(IR_graph):
+    return [(e.name, e.op, list(e.input)) for e in IR_graph.node]
+
+
+
+class Keras2ParserTest(unittest.TestCase):
+
+    def test_mnist_cnn(self):
+        IR_graph = _convert("mnist_cnn")
+        self.assertEqual(_nodes(IR_graph), [
+            ("input_1", "DataInput", []),
+            ("conv2d_1", "Conv2D", ["input_1"]),
+            ("activation_1", "Relu", ["conv2d_1"]),
+            ("conv2d_2", "Conv2D", ["activation_1"]),
+            ("activation_2", "Relu", ["conv2d_2"]),
+            ("flatten_1", "Flatten", ["activation_2"]),
+            ("dense_1", "Fully_connected", ["flatten_1"]),
+            ("dense_1_activation", "Softmax", ["dense_1"]),
+            ])
+        conv = IR_graph.node[1]
+        self.assertEqual(conv.attr["padding"].s, b"VALID")
+        self.assertEqual(list(conv.attr["filter"].list.i), [3, 3, 1, 32])
+        self.assertEqual(list(conv.attr["strides"].list.i), [1, 1])
+
+
+    def test_reuters_mlp(self):
+        # a Sequential model gets the InputLayer Keras creates for it
+        self.assertEqual(_nodes(_convert("reuters_mlp")), [
+            ("dense_1_input", "DataInput", []),
+            ("dense_1", "Fully_connected", ["dense_1_input"]),
+            ("activation_1", "Relu", ["dense_1"]),
+            ("dropout_1", "Dropout", ["activation_1"]),
+            ("dense_2", "Fully_connected", ["dropout_1"]),
+            ("activation_2", "Softmax", ["dense_2"]),
+            ])
+
+
+    def test_resnet50(self):
+        IR_graph = _convert("resnet50")
+        nodes = dict((e[0], e[1:]) for e in _nodes(IR_graph))
+        self.assertEqual(nodes["zero_padding2d_1"], ("pad", ["input_1"]))
+        self.assertEqual(nodes["add_1"], ("Add", ["bn2a_branch2c", "bn2a_branch1"]))
+        self.assertEqual(nodes["avg_pool"][0], "AvgPool2D")
+        self.assertEqual(nodes["fc1000"], ("Fully_connected", ["flatten_1"]))
+        self.assertEqual(IR_graph.node[1].attr["mode"].s, b"CONSTANT")
+
+
+    def test_examples_are_connected(self):
+        for name in ("image_ocr", "imdb_cnn", "imdb_lstm", "inception_v3", "vgg19"):
+            IR_graph = _convert(name)
+            names = set(e.name for e in IR_graph.node)
+            self.assertTrue(len(names) > 1, name)
+            for node in IR_graph.node:
+                for input_name in node.input:
+                    self.assertIn(input_name, names, "%s %s" % (name, node.name))
+
+
+if __name__ == "__main__":
+    unittest.main()
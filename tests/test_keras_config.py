@@ -0,0 +1,126 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import unittest
+
+from converters.keras.keras2_config import load_json_model
+
+try:
+    import keras
+except ImportError:
+    keras = None
+
+
+_EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "example", "keras")
+
+# layer name -> output shape, as Keras computes them
+_EXPECTED_SHAPES = {
+    "mnist_cnn" : {
+        "conv2d_2"  : (None, 24, 24, 64),
+        "flatten_1" : (None, 36864),
+        "dense_1"   : (None, 10),
+        },
+    "vgg19" : {
+        "block5_pool" : (None, 7, 7, 512),
+        "flatten_1"   : (None, 25088),
+        "dense_3"     : (None, 1000),
+        },
+    "resnet50" : {
+        "zero_padding2d_1" : (None, 230, 230, 3),
+        "max_pooling2d_1"  : (None, 55, 55, 64),
+        "add_16"           : (None, 7, 7, 2048),
+        "avg_pool"         : (None, 1, 1, 2048),
+        "fc1000"           : (None, 1000),
+        },
+    "inception_v3" : {
+        "mixed0"      : (None, 35, 35, 256),
+        "mixed7"      : (None, 17, 17, 768),
+        "mixed10"     : (None, 8, 8, 2048),
+        "predictions" : (None, 1000),
+        },
+    "imdb_cnn" : {
+        "embedding_1"            : (None, 400, 50),
+        "conv1d_1"               : (None, 398, 250),
+        "global_max_pooling1d_1" : (None, 250),
+        },
+    "imdb_lstm" : {
+        "embedding_1" : (None, None, 128),
+        "lstm_1"      : (None, 128),
+        },
+    "image_ocr" : {
+        "reshape"       : (None, 32, 256),
+        "concatenate_1" : (None, 32, 1024),
+        "ctc"           : (None, 1),
+        },
+    "mnist_acgan" : {
+        "model_2" : (None, 1, 28, 28),
+        "model_1" : [(None, 1), (None, 10)],
+        },
+    }
+
+# image_ocr holds the Python 2 bytecode of its Lambda, which Keras cannot rebuild everywhere
+_KERAS_EXAMPLES = ["mnist_cnn", "vgg19", "resnet50", "inception_v3", "imdb_cnn", "imdb_lstm", "reuters_mlp", "mnist_acgan"]
+
+
+def _example(name):
+    return os.path.join(_EXAMPLES, name + ".json")
+
+
+def _shapes(layer):
+    return tuple(getattr(layer, attr, None) for attr in ("input_shape", "output_shape"))
+
+
+
+class KerasConfigShapeTest(unittest.TestCase):
+
+    def test_output_shapes(self):
+        for name, expected in _EXPECTED_SHAPES.items():
+            model = load_json_model(_example(name))
+            for layer_name, shape in expected.items():
+                self.assertEqual(model.get_layer(layer_name).output_shape, shape, "%s %s" % (name, layer_name))
+
+
+    def test_model_outputs(self):
+        self.assertEqual(load_json_model(_example("reuters_mlp")).output_shapes, [(None, 46)])
+        self.assertEqual(load_json_model(_example("mnist_acgan")).output_shapes, [(None, 1), (None, 10)])
+
+
+    def test_shared_layer_shapes(self):
+        # the generator model is called once, next to its own node 0: both share the shapes
+        model = load_json_model(_example("mnist_acgan"))
+        generator = model.get_layer("model_2")
+        self.assertEqual(len(generator.inbound_nodes), 2)
+        self.assertEqual(generator.input_shape, [(None, 100), (None, 1)])
+
+
+
+@unittest.skipUnless(keras is not None, "Keras is not installed")
+class KerasConfigCompareTest(unittest.TestCase):
+
+    def test_layer_shapes(self):
+        from keras.models import model_from_json
+
+        for name in _KERAS_EXAMPLES:
+            with open(_example(name), "r") as fin:
+                keras_model = model_from_json(fin.read())
+            model = load_json_model(_example(name))
+            for keras_layer in keras_model.layers:
+                self.assertEqual(_shapes(model.get_layer(keras_layer.name)), _shapes(keras_layer), "%s %s" % (name, keras_layer.name))
+
+
+    def test_IR(self):
+        from converters.keras.keras2_parser import Keras2Parser
+
+        for name in _KERAS_EXAMPLES:
+            IR_graphs = list()
+            for use_keras in (False, True):
+                parser = Keras2Parser((_example(name), ""), use_keras)
+                parser.gen_IR()
+                IR_graphs.append(parser.IR_graph)
+            self.assertEqual(IR_graphs[0], IR_graphs[1], name)
+
+
+if __name__ == "__main__":
+    unittest.main()
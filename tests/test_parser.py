@@ -0,0 +1,36 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from common.DataStructure.parser import Parser
+
+
+class _SourceGraph(object):
+    # a -> b -> c, a -> d in a depth-first topological order
+    topological_sort = ["a", "b", "c", "d"]
+
+    def topological_levels(self):
+        return [["a"], ["b", "d"], ["c"]]
+
+
+    def get_node(self, name):
+        return name
+
+
+
+class ParserTest(unittest.TestCase):
+
+    def test_gen_IR_by_level_order(self):
+        parser = Parser()
+
+        def convert(name):
+            parser.IR_graph.node.add(name = name, op = "Relu")
+
+        parser._gen_IR_by_level(_SourceGraph(), convert, 2)
+        self.assertEqual([e.name for e in parser.IR_graph.node], ["a", "b", "c", "d"])
+
+
+if __name__ == "__main__":
+    unittest.main()
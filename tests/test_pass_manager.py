@@ -0,0 +1,49 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from common.IR.graph_pb2 import GraphDef
+from common.IR.passes import PassManager
+
+
+class PassManagerTest(unittest.TestCase):
+
+    def test_after_only_orders(self):
+        manager = PassManager(["fuse_activation"])
+        self.assertEqual([e.name for e in manager.passes], ["fuse_activation"])
+        self.assertEqual(manager.pulled_in, [])
+
+
+    def test_after_orders_requested_passes(self):
+        manager = PassManager(["fuse_activation", "fold_batchnorm", "eliminate_dropout"])
+        self.assertEqual([e.name for e in manager.passes], ["eliminate_dropout", "fold_batchnorm", "fuse_activation"])
+
+
+    def test_standard_expands_in_place(self):
+        for pass_names in (["standard", "infer_shapes"], ["infer_shapes", "standard"]):
+            manager = PassManager(pass_names)
+            self.assertEqual([e.name for e in manager.passes], ["eliminate_dropout", "fold_batchnorm", "fuse_activation", "infer_shapes"])
+        manager = PassManager(["plan_memory", "schedule_memory", "standard"])
+        self.assertEqual([e.name for e in manager.passes][-2:], ["schedule_memory", "plan_memory"])
+
+
+    def test_memory_tracing_is_opt_in(self):
+        graph = GraphDef()
+        graph.node.add(name = "data", op = "DataInput")
+        manager = PassManager(["eliminate_dropout"])
+        self.assertIsNone(manager.run(graph)[0]["peak_memory"])
+        manager = PassManager(["eliminate_dropout"], trace_memory = True)
+        self.assertIsNotNone(manager.run(graph)[0]["peak_memory"])
+
+
+    def test_batch_size_option(self):
+        manager = PassManager(["schedule_memory", "plan_memory", "eliminate_dropout"], options = {"batch_size": 8})
+        passes = dict((e.name, e) for e in manager.passes)
+        self.assertEqual([passes[e].batch_size for e in ("schedule_memory", "plan_memory")], [8, 8])
+        self.assertFalse(hasattr(passes["eliminate_dropout"], "batch_size"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+import common.IR.graph_pb2 as graph_pb2
+from common.IR.graph_pb2 import GraphDef
+from common.IR.IR_tensor import get_weight, set_weight
+from common.IR.quantization import WeightQuantizer, dequantize, dequantize_weight, quantize_fp16, quantize_int8
+
+
+class QuantizationTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # channels of very different ranges, where per channel scales pay off
+        self.kernel = (rng.randn(3, 3, 4, 8) * np.logspace(-3, 1, 8)).astype(np.float32)
+
+
+    def assertWithinHalfStep(self, x, q, scale, zero_point, axis):
+        error = np.abs(dequantize(q, scale, zero_point, axis) - x)
+        if axis is not None:
+            shape = [1] * x.ndim
+            shape[axis] = -1
+            scale = scale.reshape(shape)
+        self.assertTrue(np.all(error <= scale / 2 * (1 + 1e-5)))
+
+
+    def test_int8_error_bounds(self):
+        for axis in (None, -1):
+            for symmetric in (True, False):
+                q, scale, zero_point = quantize_int8(self.kernel, axis, symmetric)
+                self.assertEqual(q.dtype, np.int8 if symmetric else np.uint8)
+                self.assertWithinHalfStep(self.kernel, q, scale, zero_point, axis)
+
+        # per channel, the small channels are not drowned by the large ones
+        per_tensor = np.abs(dequantize(*quantize_int8(self.kernel, None)) - self.kernel)
+        q, scale, zero_point = quantize_int8(self.kernel, -1)
+        per_channel = np.abs(dequantize(q, scale, zero_point, -1) - self.kernel)
+        self.assertLess(per_channel[..., 0].max(), per_tensor[..., 0].max())
+
+
+    def test_int8_exact_values(self):
+        # zero, the symmetric range bounds and all-zero tensors are represented exactly
+        x = np.array([-2.0, 0.0, 1.0, 2.0], dtype = np.float32)
+        for symmetric in (True, False):
+            q, scale, zero_point = quantize_int8(x, None, symmetric)
+            self.assertEqual(dequantize(q, scale, zero_point)[1], 0.0)
+        restored = dequantize(*quantize_int8(x, None))
+        self.assertAlmostEqual(restored[0], -2.0, places = 5)
+        self.assertAlmostEqual(restored[3], 2.0, places = 5)
+        zeros = np.zeros((2, 3), dtype = np.float32)
+        np.testing.assert_array_equal(dequantize(*quantize_int8(zeros, None)), zeros)
+
+
+    def test_fp16_error_bound(self):
+        restored = quantize_fp16(self.kernel).astype(np.float32)
+        # half precision keeps 11 significant bits, its subnormals are 2 ** -24 apart
+        self.assertTrue(np.all(np.abs(restored - self.kernel) <= np.abs(self.kernel) * 2.0 ** -11 + 2.0 ** -25))
+
+
+    def test_quantizer_rewrites_weights(self):
+        graph = GraphDef()
+        conv = graph.node.add(name = "conv", op = "Conv2D")
+        set_weight(conv, "kernel", self.kernel)
+        set_weight(conv, "bias", np.ones(8, dtype = np.float32))
+
+        quantizer = WeightQuantizer("int8")
+        self.assertTrue(quantizer.run(graph))
+        self.assertEqual(conv.attr["kernel"].tensor.dtype, graph_pb2.DT_INT8)
+        self.assertEqual(get_weight(conv, "bias").dtype, np.float32)
+        restored = dequantize_weight(conv, "kernel")
+        scale = get_weight(conv, "kernel_scale")
+        self.assertTrue(np.all(np.abs(restored - self.kernel) <= scale / 2 * (1 + 1e-5)))
+        # int8 kernel, float32 scale and int8 zero point per output channel
+        self.assertEqual(quantizer.summary()["bytes_after"], self.kernel.size + 8 * 4 + 8)
+
+        # quantized weights are left as they are
+        self.assertFalse(WeightQuantizer("int8").run(graph))
+
+
+if __name__ == "__main__":
+    unittest.main()
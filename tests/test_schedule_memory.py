@@ -0,0 +1,49 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+from common.IR.graph_pb2 import GraphDef
+from common.IR.IR_graph import IRGraph
+from common.IR.IR_tensor import get_weight, set_weight
+from common.IR.passes.fold_batchnorm import FoldBatchNorm
+from common.IR.passes.schedule_memory import ScheduleMemory
+
+
+class ScheduleMemoryTest(unittest.TestCase):
+
+    def test_rewrite_after_reorder(self):
+        # relu comes before bn in the GraphDef, so scheduling reorders them
+        graph = GraphDef()
+        graph.node.add(name = "data", op = "DataInput")
+        fc = graph.node.add(name = "fc", op = "Fully_connected", input = ["data"])
+        set_weight(fc, "kernel", np.ones((4, 3), dtype = np.float32))
+        set_weight(fc, "bias", np.zeros(3, dtype = np.float32))
+        fc.attr["use_bias"].b = True
+        graph.node.add(name = "relu", op = "Relu", input = ["bn"])
+        bn = graph.node.add(name = "bn", op = "BatchNorm", input = ["fc"])
+        bn.attr["axis"].i = -1
+        bn.attr["epsilon"].f = 0.0
+        for key, value in (("gamma", 2.0), ("beta", 0.0), ("mean", 0.0), ("var", 1.0)):
+            set_weight(bn, key, np.full(3, value, dtype = np.float32))
+
+        # the passes share one view, as in PassManager.run
+        view = IRGraph(graph)
+        view.build()
+        schedule, fold = ScheduleMemory(), FoldBatchNorm()
+        schedule.graph = fold.graph = view
+
+        self.assertTrue(schedule.run(graph))
+        self.assertEqual([e.name for e in graph.node], ["data", "fc", "bn", "relu"])
+        self.assertTrue(fold.run(graph))
+
+        nodes = dict((e.name, e) for e in graph.node)
+        self.assertEqual(list(nodes), ["data", "fc", "relu"])
+        self.assertEqual(list(nodes["relu"].input), ["fc"])
+        np.testing.assert_allclose(get_weight(nodes["fc"], "kernel"), np.full((4, 3), 2.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import common.IR.graph_pb2 as graph_pb2
+from common.IR.graph_pb2 import GraphDef
+from common.IR.shape_inference import BATCH, ShapeInference
+from converters.caffe.caffe_parser import CaffeParser
+from converters.keras.keras2_parser import Keras2Parser
+
+
+_EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "example")
+
+
+
+class ShapeInferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def _caffe(self, name, phase = "TEST"):
+        # a copy, the parser caches the parsed prototxt next to it
+        prototxt = os.path.join(self.directory, name + ".prototxt")
+        shutil.copy(os.path.join(_EXAMPLES, "caffe", name + ".prototxt"), prototxt)
+        parser = CaffeParser((prototxt, None), phase)
+        parser.gen_IR()
+        return parser.IR_graph
+
+
+    def test_keras_mnist_cnn(self):
+        parser = Keras2Parser((os.path.join(_EXAMPLES, "keras", "mnist_cnn.json"), ""))
+        parser.gen_IR()
+        shapes = ShapeInference(parser.IR_graph).infer_all()
+        self.assertEqual(shapes["input_1"], (BATCH, 28, 28, 1))
+        self.assertEqual(shapes["conv2d_2"], (BATCH, 24, 24, 64))
+        self.assertEqual(shapes["flatten_1"], (BATCH, 36864))
+        self.assertEqual(shapes["dense_1_activation"], (BATCH, 10))
+
+
+    def test_caffe_lenet(self):
+        IR_graph = self._caffe("lenet_train_test")
+        # the Data layers carry no shape, give the MNIST one
+        data = [e for e in IR_graph.node if e.name == "data"][0]
+        for e in (-1, 1, 28, 28):
+            data.attr["shape"].shape.dim.add().size = e
+
+        shapes = ShapeInference(IR_graph, batch_size = 64).infer_all()
+        self.assertEqual(shapes["conv1"], (64, 20, 24, 24))
+        self.assertEqual(shapes["pool1"], (64, 20, 12, 12))
+        self.assertEqual(shapes["conv2"], (64, 50, 8, 8))
+        self.assertEqual(shapes["pool2"], (64, 50, 4, 4))
+        self.assertEqual(shapes["ip1"], (64, 500))
+        self.assertEqual(shapes["ip2"], (64, 10))
+
+
+    def test_caffe_googlenet(self):
+        # Input layer shape, padded convolutions, pooling rounded up, Concat on channels
+        inference = ShapeInference(self._caffe("googlenet_eval"))
+        shapes = inference.infer_all()
+        self.assertEqual(shapes["data"], (BATCH, 3, 224, 224))
+        self.assertEqual(shapes["conv1/7x7_s2"], (BATCH, 64, 112, 112))
+        self.assertEqual(shapes["pool1/3x3_s2"], (BATCH, 64, 56, 56))
+        self.assertEqual(shapes["inception_3a/output"], (BATCH, 256, 28, 28))
+        self.assertEqual(shapes["prob"], (BATCH, 1000))
+        self.assertNotIn(None, shapes.values())
+        self.assertEqual(inference.dtype("prob"), graph_pb2.DT_FLOAT32)
+
+
+    def test_channels_first_pooling(self):
+        graph = GraphDef()
+        data = graph.node.add(name = "data", op = "DataInput")
+        for e in (-1, 8, 32, 16):
+            data.attr["shape"].shape.dim.add().size = e
+        pool = graph.node.add(name = "pool", op = "MaxPool2D", input = ["data"])
+        pool.attr["data_format"].s = b"NCHW"
+        pool.attr["padding"].s = b"VALID"
+        pool.attr["ksize"].list.i.extend([1, 1, 2, 2])
+        pool.attr["strides"].list.i.extend([1, 1, 2, 2])
+        self.assertEqual(ShapeInference(graph).shape("pool"), (BATCH, 8, 16, 8))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from common.IR.graph_pb2 import GraphDef
+from common.IR.IR_tensor import get_weight, set_weight
+from common.IR.sparse import WeightSparsifier, decode_bsr, decode_csr, encode_bsr, encode_csr, is_sparse
+
+
+def _pruned(shape, sparsity, seed = 0):
+    rng = np.random.RandomState(seed)
+    array = np.asarray(rng.randn(*shape), dtype = np.float32)
+    array[np.asarray(rng.rand(*shape)) < sparsity] = 0
+    return array
+
+
+
+class SparseTest(unittest.TestCase):
+
+    def test_csr_round_trip(self):
+        for shape in ((), (7,), (5, 6), (3, 3, 4, 8)):
+            array = _pruned(shape, 0.8)
+            values, indices, indptr = encode_csr(array)
+            self.assertEqual(len(values), np.count_nonzero(array))
+            restored = decode_csr(values, indices, indptr, shape)
+            self.assertEqual(restored.shape, shape)
+            np.testing.assert_array_equal(restored, array)
+
+
+    def test_bsr_round_trip(self):
+        array = _pruned((3, 3, 8, 8), 0.5)
+        # zero out whole blocks, so some are left out
+        array.reshape(-1, 8)[:36, 4:] = 0
+        values, indices, indptr = encode_bsr(array, (4, 4))
+        self.assertEqual(values.shape[1:], (4, 4))
+        self.assertLess(len(values), (72 // 4) * (8 // 4))
+        np.testing.assert_array_equal(decode_bsr(values, indices, indptr, array.shape, (4, 4)), array)
+
+        with self.assertRaises(ValueError):
+            encode_bsr(np.ones((6, 8)), (4, 4))
+
+
+    def test_sparsifier_round_trip(self):
+        for sparse_format in ("csr", "bsr"):
+            graph = GraphDef()
+            sparse = graph.node.add(name = "sparse", op = "Fully_connected")
+            dense = graph.node.add(name = "dense", op = "Fully_connected")
+            kernel = _pruned((64, 32), 0.9)
+            kernel[:, :8] = 0
+            set_weight(sparse, "kernel", kernel)
+            set_weight(dense, "kernel", _pruned((64, 32), 0.1))
+
+            sparsifier = WeightSparsifier(sparse_format, block_shape = (1, 8))
+            self.assertTrue(sparsifier.run(graph))
+            self.assertTrue(is_sparse(sparse, "kernel"))
+            self.assertFalse(is_sparse(dense, "kernel"))
+            np.testing.assert_array_equal(get_weight(sparse, "kernel"), kernel)
+            self.assertGreater(sparsifier.report[0]["bytes_saved"], 0)
+
+            # already sparse weights are left as they are
+            self.assertFalse(WeightSparsifier(sparse_format, block_shape = (1, 8)).run(graph))
+
+
+if __name__ == "__main__":
+    unittest.main()
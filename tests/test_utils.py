@@ -0,0 +1,67 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from common.IR.graph_pb2 import GraphDef
+from common.utils import CACHE_SUFFIX, load_protobuf_from_file
+
+
+class TextCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "graph.pbtxt")
+        with open(self.path, "w") as of:
+            of.write('node { name: "data" op: "DataInput" }\n')
+            of.write('node { name: "conv" op: "Conv2D" input: "data" }\n')
+        self.cache_path = self.path + CACHE_SUFFIX
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def _load(self):
+        graph = load_protobuf_from_file(GraphDef(), self.path)
+        self.assertEqual([e.name for e in graph.node], ["data", "conv"])
+        self.assertEqual(list(graph.node[1].input), ["data"])
+
+
+    def _corrupt(self, edit):
+        self._load()
+        with open(self.cache_path, "rb") as fin:
+            content = fin.read()
+        with open(self.cache_path, "wb") as of:
+            of.write(edit(content))
+        self._load()
+
+
+    def test_cache_hit(self):
+        self._load()
+        self.assertTrue(os.path.isfile(self.cache_path))
+        self._load()
+
+
+    def test_truncated_body(self):
+        self._corrupt(lambda content: content[:-5])
+
+
+    def test_truncated_header(self):
+        self._corrupt(lambda content: content[:20])
+
+
+    def test_corrupt_header(self):
+        self._corrupt(lambda content: content.replace(b'"type"', b'"type\\'))
+
+
+    def test_corrupt_body(self):
+        self._corrupt(lambda content: content[:content.index(b"}\n") + 2] + b"\xff" * 24)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from common.IR.weight_store import BlobStore, WeightStoreWriter, CompressedWeightStoreWriter, open_weight_store
+
+
+class WeightStoreTest(unittest.TestCase):
+
+    arrays = {
+        "scalar" : np.array(0.5, dtype = np.float32),
+        "kernel" : np.arange(24, dtype = np.float32).reshape(2, 3, 4),
+        "bias"   : np.arange(3, dtype = np.int64),
+        }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_round_trip_keeps_shapes(self):
+        path = os.path.join(self.directory, "weights.bin")
+        with WeightStoreWriter(path) as writer:
+            for key, array in self.arrays.items():
+                writer.add(key, array)
+
+        store = open_weight_store(path)
+        for key, array in self.arrays.items():
+            loaded = store.get(key)
+            self.assertEqual(loaded.shape, array.shape)
+            self.assertEqual(loaded.dtype, array.dtype)
+            np.testing.assert_array_equal(loaded, array)
+
+
+    def test_blob_store_keeps_shapes(self):
+        path = os.path.join(self.directory, "blobs")
+        with BlobStore(path) as store:
+            digests = dict((key, store.add(key, array)) for key, array in self.arrays.items())
+
+        store = open_weight_store(path)
+        for key, array in self.arrays.items():
+            loaded = store.get(digests[key])
+            self.assertEqual(loaded.shape, array.shape)
+            np.testing.assert_array_equal(loaded, array)
+
+
+    def _compressed_store(self):
+        path = os.path.join(self.directory, "weights.bin")
+        # chunks smaller than the kernel, so it spans several
+        with CompressedWeightStoreWriter(path, chunk_size = 32, alignment = 8) as writer:
+            for key, array in self.arrays.items():
+                writer.add(key, array)
+        return path
+
+
+    def test_compressed_round_trip(self):
+        threads = threading.active_count()
+        with open_weight_store(self._compressed_store()) as store:
+            for key, array in self.arrays.items():
+                loaded = store.get(key)
+                self.assertEqual(loaded.shape, array.shape)
+                self.assertEqual(loaded.dtype, array.dtype)
+                np.testing.assert_array_equal(loaded, array)
+            store.load_all()
+            np.testing.assert_array_equal(store.get("kernel"), self.arrays["kernel"])
+        # leaving the with block stops the decompression threads
+        self.assertEqual(threading.active_count(), threads)
+
+
+    def test_compressed_partial_read(self):
+        with open_weight_store(self._compressed_store()) as store:
+            read = list()
+            decompress = store._decompress_chunk
+            def counting(idx):
+                read.append(idx)
+                return decompress(idx)
+            store._decompress_chunk = counting
+
+            np.testing.assert_array_equal(store.get("bias"), self.arrays["bias"])
+            entry = store.index["bias"]
+            first = entry["offset"] // store.chunk_size
+            last = (entry["offset"] + self.arrays["bias"].nbytes - 1) // store.chunk_size
+            self.assertEqual(sorted(read), list(range(first, last + 1)))
+            self.assertLess(len(read), len(store.chunks))
+
+
+
+if __name__ == "__main__":
+    unittest.main()